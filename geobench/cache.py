@@ -0,0 +1,617 @@
+"""Caches of decoded samples.
+
+Caches keep the samples returned by `GeobenchDataset.get_sample` before the transform, so that
+multi-epoch training reads and decodes each sample once while augmentations still vary from one
+epoch to the next.
+
+* `SampleCache` lives in the memory of a process.
+* `SharedSampleCache` lives in a file of a node-local directory, e.g., on /dev/shm, and is shared
+  by all DataLoader workers and training processes of the node.
+
+`TensorCache` instead persists the output of the deterministic preprocessing of a split, i.e.,
+band selection, resampling, normalization and an optional user transform, as fixed-shape arrays
+that later runs memory-map.
+"""
+
+import copy
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from tqdm import tqdm
+
+from geobench.dataset import Band, CompactSample, GeobenchDataset, Sample
+from geobench.manifest import MANIFEST_FILE
+from geobench.memmap import MEMMAP_DIR
+from geobench.shards import SHARDS_DIR
+
+
+def sample_nbytes(sample: Sample) -> int:
+    """Return the number of bytes of the band data and label of a sample."""
+    if isinstance(sample, CompactSample) and sample._bands is None:
+        nbytes = sum(group.data.nbytes for group in sample.groups)
+        nbytes += sum(band.data.nbytes for band in sample._extras)
+    else:
+        nbytes = sum(band.data.nbytes for band in sample.bands)
+    label = sample.label
+    if isinstance(label, Band):
+        nbytes += label.data.nbytes
+    return nbytes + getattr(label, "nbytes", 0)
+
+
+class SampleCache:
+    """In-memory cache of samples, bounded by a byte budget, with least recently used eviction.
+
+    Samples are stored as `CompactSample`, one array per group of same-shape bands, and each hit
+    returns a copy, so that transforms can modify the returned sample in place. The cache is
+    thread safe, e.g., for `GeobenchDataset.aiter`. When pickled, e.g., for DataLoader workers, the
+    cache is emptied: each worker fills its own copy.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        """Initialize new instance of SampleCache.
+
+        Args:
+            max_bytes: maximum total size of the band data and labels of the cached samples.
+        """
+        self.max_bytes = int(max_bytes)
+        self._samples: "OrderedDict[Hashable, CompactSample]" = OrderedDict()
+        self._sizes: Dict[Hashable, int] = {}
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        """Pickle the budget only, see class documentation."""
+        return dict(max_bytes=self.max_bytes)
+
+    def __setstate__(self, state):
+        """Restore an empty cache."""
+        self.__init__(state["max_bytes"])
+
+    def __len__(self) -> int:
+        """Return the number of cached samples."""
+        return len(self._samples)
+
+    def __contains__(self, key: Hashable) -> bool:
+        """Check if a sample is cached, without counting a hit or a miss."""
+        return key in self._samples
+
+    def get(self, key: Hashable) -> Optional[Sample]:
+        """Return a copy of the cached sample, or None if it is not cached."""
+        with self._lock:
+            sample = self._samples.get(key)
+            if sample is None:
+                self.misses += 1
+                return None
+            self._samples.move_to_end(key)
+            self.hits += 1
+        return copy.deepcopy(sample)
+
+    def put(self, key: Hashable, sample: Sample) -> bool:
+        """Cache a copy of a sample, evicting the least recently used samples if needed.
+
+        Args:
+            key: key of the sample, e.g., its name and band selection.
+            sample: sample to cache. It can still be modified by the caller afterwards.
+
+        Returns:
+            whether the sample was cached. Samples larger than the whole budget are not.
+        """
+        # 2d bands are copied into the group arrays, other bands and the label are copied as is
+        compact = CompactSample(sample.bands, None, sample.sample_name)
+        compact._extras = copy.deepcopy(compact._extras)
+        compact.label = copy.deepcopy(sample.label)
+        nbytes = sample_nbytes(compact)
+        if nbytes > self.max_bytes:
+            return False
+        with self._lock:
+            if key in self._samples:
+                self.nbytes -= self._sizes.pop(key)
+                del self._samples[key]
+            while self.nbytes + nbytes > self.max_bytes:
+                evicted, _ = self._samples.popitem(last=False)
+                self.nbytes -= self._sizes.pop(evicted)
+                self.evictions += 1
+            self._samples[key] = compact
+            self._sizes[key] = nbytes
+            self.nbytes += nbytes
+        return True
+
+    def clear(self) -> None:
+        """Remove all samples, keeping the counters."""
+        with self._lock:
+            self._samples.clear()
+            self._sizes.clear()
+            self.nbytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the counters of the cache."""
+        return dict(
+            hits=self.hits,
+            misses=self.misses,
+            evictions=self.evictions,
+            n_samples=len(self._samples),
+            nbytes=self.nbytes,
+            max_bytes=self.max_bytes,
+        )
+
+
+_ALIGNMENT = 64  # byte alignment of the arrays in the arena
+
+_INDEX_VERSION = 2  # sqlite user_version of the index, older indexes are emptied
+
+_SCHEMA = [
+    "DROP TABLE IF EXISTS meta",
+    "DROP TABLE IF EXISTS entries",
+    "CREATE TABLE meta (name TEXT PRIMARY KEY, value INTEGER)",
+    "INSERT INTO meta VALUES ('head', 0), ('generation', 0)",
+    """CREATE TABLE entries (
+        key TEXT PRIMARY KEY,
+        offset INTEGER,
+        nbytes INTEGER,
+        generation INTEGER,
+        created REAL,
+        header BLOB,
+        sizes TEXT,
+        ready INTEGER
+    )""",
+    "CREATE INDEX entries_offset ON entries (offset)",
+    f"PRAGMA user_version = {_INDEX_VERSION}",
+]
+
+_READ_ATTEMPTS = 3  # reads of an entry replaced during the copy, before counting a miss
+_WRITE_TIMEOUT = 60.0  # seconds after which a range being written is assumed abandoned
+
+
+def _align(n: int) -> int:
+    return (n + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+
+class SharedSampleCache:
+    """Sample cache shared by the processes of a node, bounded by a byte budget.
+
+    The arrays of the cached samples are stored once in an arena file of `max_bytes` bytes, and
+    samples are indexed in an sqlite database next to it, which serializes concurrent writers.
+    Samples are pickled with protocol 5, with their arrays out of band, and unpickled from a
+    single read of their range of the arena, so returned samples own their memory.
+
+    The arena is a ring: new samples are written after the last one, evicting the oldest samples
+    they overlap. Each write gets a new generation, and a range is only overwritten once the
+    entries it held are deleted from the index. Readers check, after copying a range, that its
+    entry still has the generation they read, as a seqlock: a sample evicted during the copy is
+    read again or counted as a miss, never returned torn. Likewise, ranges still being written are
+    not reallocated: a sample is not cached rather than overwriting them.
+
+    Counters are per process. When pickled, e.g., for DataLoader workers, the cache is reopened.
+    """
+
+    def __init__(self, cache_dir, max_bytes: int) -> None:
+        """Initialize new instance of SharedSampleCache.
+
+        Args:
+            cache_dir: node-local directory of the cache, e.g., on /dev/shm, created if needed.
+                Processes sharing the cache use the same directory.
+            max_bytes: size of the arena, fixed when the cache directory is created.
+
+        Raises:
+            ValueError if the arena of cache_dir has another size.
+        """
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = int(max_bytes)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._pid: Optional[int] = None
+        self._open()
+
+    def __getstate__(self):
+        """Pickle the location and budget only, see class documentation."""
+        return dict(cache_dir=self.cache_dir, max_bytes=self.max_bytes)
+
+    def __setstate__(self, state):
+        """Reopen the cache."""
+        self.__init__(state["cache_dir"], state["max_bytes"])
+
+    def _open(self) -> None:
+        """Open the arena and the index, in each process, since neither survives a fork."""
+        if self._pid == os.getpid():
+            return
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._fd = os.open(self.cache_dir / "arena.bin", os.O_RDWR | os.O_CREAT, 0o666)
+        size = os.fstat(self._fd).st_size
+        if size == 0:
+            os.ftruncate(self._fd, self.max_bytes)  # sparse, pages are allocated when written
+        elif size != self.max_bytes:
+            raise ValueError(
+                f"The arena of {self.cache_dir} has {size} bytes, but max_bytes is {self.max_bytes}."
+            )
+        self._db = sqlite3.connect(
+            self.cache_dir / "index.sqlite",
+            timeout=60,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("BEGIN IMMEDIATE")
+        if self._db.execute("PRAGMA user_version").fetchone()[0] != _INDEX_VERSION:
+            for statement in _SCHEMA:
+                self._db.execute(statement)
+        self._db.execute("COMMIT")
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def __len__(self) -> int:
+        """Return the number of cached samples."""
+        self._open()
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM entries WHERE ready = 1").fetchone()[0]
+
+    def __contains__(self, key: Hashable) -> bool:
+        """Check if a sample is cached, without counting a hit or a miss."""
+        self._open()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT 1 FROM entries WHERE key = ? AND ready = 1", (repr(key),)
+            ).fetchone()
+        return row is not None
+
+    def _entry(self, key: str) -> Optional[Tuple]:
+        with self._lock:
+            return self._db.execute(
+                "SELECT offset, nbytes, generation, header, sizes FROM entries "
+                "WHERE key = ? AND ready = 1",
+                (key,),
+            ).fetchone()
+
+    def _read(self, offset: int, nbytes: int) -> memoryview:
+        """Copy a range of the arena into a new buffer."""
+        data = memoryview(bytearray(nbytes))
+        buffer = data
+        while len(buffer) > 0:
+            n_read = os.preadv(self._fd, [buffer], offset)
+            if n_read == 0:
+                raise EOFError(f"Unexpected end of the arena of {self.cache_dir}.")
+            buffer = buffer[n_read:]
+            offset += n_read
+        return data
+
+    def get(self, key: Hashable) -> Optional[Sample]:
+        """Return a copy of the cached sample, or None."""
+        self._open()
+        key = repr(key)
+        for _ in range(_READ_ATTEMPTS):
+            row = self._entry(key)
+            if row is None:
+                break
+            offset, nbytes, generation, header, sizes = row
+            data = self._read(offset, nbytes)
+            row = self._entry(key)
+            if row is None or row[2] != generation:
+                continue  # evicted during the copy, the range may have been overwritten
+            buffers = []
+            position = 0
+            for size in map(int, sizes.split(",")) if sizes else ():
+                buffers.append(data[position : position + size])
+                position += _align(size)
+            self.hits += 1
+            return pickle.loads(header, buffers=buffers)
+        self.misses += 1
+        return None
+
+    def _allocate(self, key: str, nbytes: int) -> Optional[Tuple[int, int]]:
+        """Reserve `nbytes` after the last sample, evicting the samples in the way.
+
+        Returns:
+            offset and generation of the new entry, or None if the sample is already cached or the
+            range is still being written by another process.
+        """
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                if self._db.execute("SELECT 1 FROM entries WHERE key = ?", (key,)).fetchone():
+                    self._db.execute("COMMIT")
+                    return None  # cached by another process meanwhile
+                offset = self._db.execute("SELECT value FROM meta WHERE name = 'head'").fetchone()[
+                    0
+                ]
+                if offset + nbytes > self.max_bytes:
+                    offset = 0
+                writing = self._db.execute(
+                    "SELECT 1 FROM entries WHERE offset < ? AND offset + nbytes > ? "
+                    "AND ready = 0 AND created > ?",
+                    (offset + nbytes, offset, now - _WRITE_TIMEOUT),
+                ).fetchone()
+                if writing:
+                    self._db.execute("COMMIT")
+                    return None
+                evicted = self._db.execute(
+                    "DELETE FROM entries WHERE offset < ? AND offset + nbytes > ?",
+                    (offset + nbytes, offset),
+                ).rowcount
+                self._db.execute(
+                    "UPDATE meta SET value = ? WHERE name = 'head'", (offset + nbytes,)
+                )
+                self._db.execute("UPDATE meta SET value = value + 1 WHERE name = 'generation'")
+                generation = self._db.execute(
+                    "SELECT value FROM meta WHERE name = 'generation'"
+                ).fetchone()[0]
+                self._db.execute(
+                    "INSERT INTO entries (key, offset, nbytes, generation, created, ready) "
+                    "VALUES (?, ?, ?, ?, ?, 0)",
+                    (key, offset, nbytes, generation, now),
+                )
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        self.evictions += evicted
+        return offset, generation
+
+    def put(self, key: Hashable, sample: Sample) -> bool:
+        """Cache a sample, evicting the oldest samples if needed.
+
+        Args:
+            key: key of the sample, e.g., its name and band selection.
+            sample: sample to cache. It can still be modified by the caller afterwards.
+
+        Returns:
+            whether the sample was cached. Samples larger than the arena are not, nor samples
+            already cached, e.g., by another worker, nor samples whose range is being written.
+        """
+        self._open()
+        compact = sample if isinstance(sample, CompactSample) else sample.compact()
+        buffers: List[pickle.PickleBuffer] = []
+        header = pickle.dumps(compact, protocol=5, buffer_callback=buffers.append)
+        raws = [buffer.raw() for buffer in buffers]
+        nbytes = sum(_align(raw.nbytes) for raw in raws)
+        if nbytes > self.max_bytes:
+            return False
+        key = repr(key)
+        allocated = self._allocate(key, nbytes)
+        if allocated is None:
+            return False
+        offset, generation = allocated
+        position = offset
+        for raw in raws:
+            os.pwrite(self._fd, raw, position)
+            position += _align(raw.nbytes)
+        sizes = ",".join(str(raw.nbytes) for raw in raws)
+        with self._lock:
+            self._db.execute(
+                "UPDATE entries SET header = ?, sizes = ?, ready = 1 "
+                "WHERE key = ? AND generation = ?",
+                (header, sizes, key, generation),
+            )
+        return True
+
+    def clear(self) -> None:
+        """Remove all samples, for all processes, keeping the counters."""
+        self._open()
+        with self._lock:
+            self._db.execute("DELETE FROM entries")
+            self._db.execute("UPDATE meta SET value = 0 WHERE name = 'head'")
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the counters of this process and the occupancy of the shared arena."""
+        self._open()
+        with self._lock:
+            n_samples, nbytes = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(nbytes), 0) FROM entries WHERE ready = 1"
+            ).fetchone()
+        return dict(
+            hits=self.hits,
+            misses=self.misses,
+            evictions=self.evictions,
+            n_samples=n_samples,
+            nbytes=nbytes,
+            max_bytes=self.max_bytes,
+        )
+
+
+TENSOR_CACHE_VERSION = 1
+
+
+def _hash(value: Any) -> str:
+    return hashlib.sha256(json.dumps(value, sort_keys=True).encode()).hexdigest()
+
+
+def _source_files(dataset: GeobenchDataset, sample_names: Sequence[str]) -> List[Path]:
+    """List the files the samples of a dataset are read from, with the manifest and statistics."""
+    dataset_dir = dataset.dataset_dir
+    if dataset.format in ("shards", "memmap"):
+        container_dir = dataset_dir / dict(shards=SHARDS_DIR, memmap=MEMMAP_DIR)[dataset.format]
+        paths = sorted(container_dir.iterdir())
+    elif dataset.format == "tif":
+        paths = [path for name in sample_names for path in sorted((dataset_dir / name).iterdir())]
+    else:
+        paths = [dataset_dir / f"{name}.{dataset.format}" for name in sample_names]
+    return paths + [
+        path
+        for path in (dataset_dir / MANIFEST_FILE, dataset_dir / "band_stats.json")
+        if path.exists()
+    ]
+
+
+def source_signature(dataset: GeobenchDataset, sample_names: Sequence[str]) -> str:
+    """Hash the size and modification time of the files the samples are read from."""
+    stats = []
+    for path in _source_files(dataset, sample_names):
+        stat = path.stat()
+        stats.append((str(path.relative_to(dataset.dataset_dir)), stat.st_size, stat.st_mtime_ns))
+    return _hash(stats)
+
+
+def _label_array(label) -> np.ndarray:
+    if isinstance(label, Band):
+        return np.asarray(label.data)
+    if isinstance(label, (int, np.integer, np.ndarray)):
+        return np.asarray(label)
+    raise ValueError(f"Can't store labels of type {type(label)} in a tensor cache.")
+
+
+class TensorCache:
+    """Persistent cache of the preprocessed samples of the active split of a dataset.
+
+    The deterministic prefix of the input pipeline is run once and its output stored as
+    fixed-shape arrays in a sub-directory of `cache_dir`:
+
+    * images.npy: float32 array of shape (n_samples, n_channels, height, width).
+    * labels.npy: class ids, multi-hot vectors or segmentation maps of the samples.
+    * index.json: sample names, settings and signature of the source files.
+
+    The sub-directory is named after a hash of the dataset, split, band names, resampling and
+    normalization settings and transform fingerprint, so each configuration gets its own arrays.
+    The arrays are rebuilt when the size or modification time of the samples, the manifest or the
+    band statistics changed since they were written. Later runs memory-map the arrays.
+    """
+
+    def __init__(
+        self,
+        dataset: GeobenchDataset,
+        cache_dir,
+        transform: Callable[[Sample], Sample] = None,
+        fingerprint: str = None,
+        resample_method: str = "bilinear",
+        fill_value: float = None,
+        normalize: bool = False,
+    ) -> None:
+        """Open the cached arrays of a dataset, building them if needed.
+
+        Args:
+            dataset: dataset whose active split is cached. Its own transform, typically random
+                augmentations, is not applied.
+            cache_dir: local directory of the caches, created if needed.
+            transform: deterministic transform applied to each sample before packing.
+            fingerprint: identifies the transform and its parameters, e.g., "crop64-v2". It must
+                change whenever the transform does, since the transform itself is not hashed.
+            resample_method: method resampling bands to the largest shape, see `Sample.pack_to_4d`.
+            fill_value: fills missing bands with this value, see `Sample.pack_to_4d`.
+            normalize: whether to standardize each band with the mean and std of the band
+                statistics of the dataset.
+
+        Raises:
+            ValueError if a transform is given without fingerprint.
+        """
+        if transform is not None and fingerprint is None:
+            raise ValueError("A fingerprint is required to cache the output of a transform.")
+        self.dataset = dataset
+        self.transform = transform
+        self.resample_method = resample_method
+        self.fill_value = fill_value
+        self.normalize = normalize
+        self.sample_names = list(dataset.list_sample_names())
+        self.settings = dict(
+            version=TENSOR_CACHE_VERSION,
+            dataset_dir=str(dataset.dataset_dir.resolve()),
+            format=dataset.format,
+            sample_names=_hash(self.sample_names),
+            band_names=list(dataset.band_names),
+            resample_method=resample_method,
+            fill_value=fill_value,
+            normalize=normalize,
+            fingerprint=fingerprint,
+        )
+        self.directory = Path(cache_dir) / f"{dataset.dataset_dir.name}-{_hash(self.settings)[:16]}"
+        self.built = False
+        if not self._is_valid():
+            self.build()
+        self.images = np.load(self.directory / "images.npy", mmap_mode="r")
+        self.labels = np.load(self.directory / "labels.npy", mmap_mode="r")
+
+    def _is_valid(self) -> bool:
+        index_path = self.directory / "index.json"
+        if not index_path.exists():
+            return False
+        with open(index_path, "r") as fd:
+            index = json.load(fd)
+        signature = source_signature(self.dataset, self.sample_names)
+        return index["settings"] == self.settings and index["signature"] == signature
+
+    def _preprocess(self, sample_name: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Return the (n_channels, height, width) image and the label of a sample."""
+        dataset = self.dataset
+        sample = dataset.read_sample(sample_name, band_names=dataset.band_names)
+        if self.transform is not None:
+            sample = self.transform(sample)
+        image, _ = sample.pack_to_3d(
+            band_names=dataset.band_names,
+            resample=True,
+            fill_value=self.fill_value,
+            resample_method=self.resample_method,
+        )
+        image = image.transpose(2, 0, 1).astype(np.float32)
+        if self.normalize:
+            means, stds = dataset.normalization_stats()
+            if len(means) != image.shape[0]:
+                raise ValueError("Normalization requires single channel bands.")
+            image -= np.array(means, dtype=np.float32)[:, None, None]
+            image /= np.array(stds, dtype=np.float32)[:, None, None]
+        return image, _label_array(sample.label)
+
+    def build(self) -> Path:
+        """Preprocess all samples and write the arrays, replacing outdated ones.
+
+        Returns:
+            path to the directory of the arrays
+
+        Raises:
+            ValueError if preprocessed samples don't all have the same shape.
+        """
+        signature = source_signature(self.dataset, self.sample_names)
+        tmp_dir = self.directory.with_name(f"{self.directory.name}.tmp-{os.getpid()}")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        tmp_dir.mkdir(parents=True)
+        images = None
+        labels = []
+        for i, sample_name in enumerate(tqdm(self.sample_names, desc=f"Caching {tmp_dir.name}")):
+            image, label = self._preprocess(sample_name)
+            if images is None:
+                images = np.lib.format.open_memmap(
+                    tmp_dir / "images.npy",
+                    mode="w+",
+                    dtype=np.float32,
+                    shape=(len(self.sample_names),) + image.shape,
+                )
+            elif image.shape != images.shape[1:]:
+                raise ValueError(
+                    f"Sample {sample_name} has shape {image.shape} once preprocessed, expected "
+                    f"{images.shape[1:]}. The tensor cache requires fixed-shape samples."
+                )
+            images[i] = image
+            labels.append(label)
+        if images is None:
+            raise ValueError(f"No sample to cache in the active split of {self.dataset}.")
+        images.flush()
+        del images
+        np.save(tmp_dir / "labels.npy", np.stack(labels))
+        with open(tmp_dir / "index.json", "w") as fd:
+            json.dump(
+                dict(settings=self.settings, signature=signature, sample_names=self.sample_names),
+                fd,
+            )
+        if self.directory.exists():
+            shutil.rmtree(self.directory)
+        os.replace(tmp_dir, self.directory)
+        self.built = True
+        return self.directory
+
+    def __len__(self) -> int:
+        """Return the number of cached samples."""
+        return len(self.sample_names)
+
+    def __getitem__(self, idx: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Return the preprocessed image and the label of sample idx, as read-only views."""
+        return self.images[idx], self.labels[idx]
@@ -9,3 +9,11 @@ else:
     GEO_BENCH_DIR = Path(_GEO_BENCH_DIR_ENV)
 
 GEO_BENCH_DIR.mkdir(exist_ok=True, parents=True)
+
+# number of threads decoding the bands of tif samples concurrently, per process. 0 or 1 reads
+# bands sequentially.
+TIF_READ_THREADS = int(os.environ.get("GEO_BENCH_TIF_READ_THREADS", 0))
+
+# number of threads reading the samples of a batch concurrently, per process, see
+# GeobenchDataset.get_batch. 0 or 1 reads samples sequentially.
+BATCH_READ_THREADS = int(os.environ.get("GEO_BENCH_BATCH_READ_THREADS", 8))
@@ -2,22 +2,34 @@
 from __future__ import annotations
 
 import ast
+import asyncio
+import base64
 import datetime
 import errno
 import json
 import os
 import pathlib
 import pickle
-from collections import OrderedDict, defaultdict
-from functools import cached_property, lru_cache
+import struct
+import threading
+import zipfile
+from collections import OrderedDict, defaultdict, deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import ExitStack
+from functools import cached_property, lru_cache, partial
 from pathlib import Path
+from types import MappingProxyType
 from typing import (
     Any,
+    AsyncGenerator,
     Callable,
     DefaultDict,
+    Deque,
     Dict,
     Generator,
     List,
+    Mapping,
+    NamedTuple,
     Optional,
     Sequence,
     Tuple,
@@ -28,10 +40,20 @@ from warnings import warn
 import h5py
 import numpy as np
 import rasterio
+import rasterio.windows
+from rasterio.crs import CRS
+from rasterio.transform import Affine
 from scipy.ndimage import zoom
 from tqdm import tqdm
 
+from geobench import config
 from geobench.config import GEO_BENCH_DIR
+from geobench.resampling import ORDER_TO_METHOD, resample_batch
+
+try:
+    import hdf5plugin  # registers the blosc and zstd filters with h5py
+except ImportError:
+    hdf5plugin = None
 
 from geobench.label import LabelType
 
@@ -40,9 +62,18 @@ src_datasets_dir: Path = GEO_BENCH_DIR / "source"  # type: ignore
 datasets_dir: Path = GEO_BENCH_DIR / "converted"  # type: ignore
 
 
+# maps class names to BandInfo classes for decoding sample headers, populated by BandInfo.__init_subclass__
+_BAND_INFO_REGISTRY: Dict[str, type] = {}
+
+
 class BandInfo(object):
     """Base class for storing non pixel information about bands such as band name, wavelenth and spatial resolution."""
 
+    def __init_subclass__(cls, **kwargs):
+        """Register subclasses so that they can be decoded from sample headers."""
+        super().__init_subclass__(**kwargs)
+        _BAND_INFO_REGISTRY[cls.__name__] = cls
+
     def __init__(
         self, name: str, alt_names: Sequence[str] = (), spatial_resolution: float = None
     ) -> None:
@@ -118,6 +149,9 @@ class BandInfo(object):
         return [self.name]
 
 
+_BAND_INFO_REGISTRY[BandInfo.__name__] = BandInfo
+
+
 class SpectralBand(BandInfo):
     """Extends BandInfo to provide wavelength of the band."""
 
@@ -360,6 +394,43 @@ landsat8_9_bands = [
 ]
 
 
+class LazyArray:
+    """Placeholder for the data of a band, decoded on first access.
+
+    Shape and dtype are known from the file meta data, without reading pixels.
+    """
+
+    def __init__(self, shape: Tuple[int, ...], dtype, loader: Callable[[], np.ndarray]) -> None:
+        """Initialize new instance of LazyArray.
+
+        Args:
+            shape: shape of the array once loaded.
+            dtype: dtype of the array once loaded.
+            loader: callable reading and decoding the array, should be picklable.
+        """
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.loader = loader
+
+    @property
+    def ndim(self) -> int:
+        """Return the number of dimensions of the array."""
+        return len(self.shape)
+
+    def load(self) -> np.ndarray:
+        """Read and decode the array."""
+        return self.loader()
+
+    def __array__(self, dtype=None):
+        """Load the array when converted by numpy."""
+        data = self.load()
+        return data if dtype is None else data.astype(dtype)
+
+    def __repr__(self):
+        """Return representation of a LazyArray."""
+        return f"LazyArray(shape={self.shape}, dtype={self.dtype})"
+
+
 class Band:
     """Group Band information and provide function for saving to geotiff."""
 
@@ -379,6 +450,7 @@ class Band:
 
         Args:
             data: 2d or 3d array of data containing the pixels of the band. shape=(height, width) or shape=(height, width, bands)
+                A LazyArray defers reading the pixels to the first access to `Band.data`.
             band_info: Object of type Band_Info containing the band name, wavelength, spatial_resolution original spatial resolution.
             spatial_resolution: current Spatial resolution of the pixels in meters. Note: Band.band_info.spatial_resolution  contains
                 the original spatial resolution of the sensor. If data is a resampled version of the original data, Band.spatial_resolution
@@ -401,12 +473,47 @@ class Band:
         self.meta_info = meta_info
         self.convert_to_int16 = convert_to_int16
 
+    @property
+    def data(self) -> "np.typing.NDArray[np.int_]":
+        """Return the pixels of the band, decoding them on first access for lazy bands."""
+        if isinstance(self._data, LazyArray):
+            self._data = self._data.load()
+        return self._data
+
+    @data.setter
+    def data(self, data) -> None:
+        self._data = data
+
+    @property
+    def is_loaded(self) -> bool:
+        """Check if the pixels of the band are in memory."""
+        return not isinstance(self._data, LazyArray)
+
+    @property
+    def shape(self) -> Optional[Tuple[int, ...]]:
+        """Return the shape of the data, without decoding lazy bands."""
+        return getattr(self._data, "shape", None)
+
+    @property
+    def dtype(self) -> Optional[np.dtype]:
+        """Return the dtype of the data, without decoding lazy bands."""
+        return getattr(self._data, "dtype", None)
+
+    def __getstate__(self):
+        """Decode lazy bands before pickling, the loader may hold file handles."""
+        state = self.__dict__.copy()
+        state["_data"] = self.data
+        return state
+
+    def __setstate__(self, state):
+        """Restore state, including bands pickled before data became a property."""
+        if "data" in state:
+            state["_data"] = state.pop("data")
+        self.__dict__.update(state)
+
     def __repr__(self):
         """Return representation of a Band."""
-        if isinstance(self.data, np.ndarray):
-            shape = self.data.shape
-        else:
-            shape = "unknown"
+        shape = "unknown" if self.shape is None else self.shape
         return f"Band(info={self.band_info}, shape={shape}, resampled_resolution={self.spatial_resolution}m, date={self.date})"
 
     def get_descriptor(self) -> str:
@@ -417,7 +524,7 @@ class Band:
             descriptor += f"_{_format_date(self.date)}"
         return descriptor
 
-    def write_to_geotiff(self, directory):
+    def write_to_geotiff(self, directory, write_tags: bool = True):
         """Write an image from an array to a geotiff file with its label.
 
         We compress with zstd, a lossless compression which gains a factor of ~2 in compression.
@@ -427,6 +534,8 @@ class Band:
 
         Args:
             directory: Destination path to save the file.
+            write_tags: whether to store the band meta data as pickled tags in the file. Samples
+                written with `write_sample_tif` store them in a metadata sidecar instead.
 
         Raises:
             ValueError: when values of image are not in range (-32768, 32767)
@@ -470,14 +579,8 @@ class Band:
             predictor=2,
             transform=self.transform,
         ) as dst:
-            tags = dict(
-                date=self.date,
-                date_id=self.date_id,
-                spatial_resolution=self.spatial_resolution,
-                band_info=self.band_info,
-                meta_info=self.meta_info,
-            )
-            dst.update_tags(data=str(pickle.dumps(tags)))
+            if write_tags:
+                dst.update_tags(data=str(pickle.dumps(self._tif_tags())))
 
             dst.nodata = 0  # we use 0 as the nodata value.
 
@@ -491,6 +594,16 @@ class Band:
 
         return file_path
 
+    def _tif_tags(self) -> Dict[str, Any]:
+        """Return the meta data of the band stored alongside a tif file."""
+        return dict(
+            date=self.date,
+            date_id=self.date_id,
+            spatial_resolution=self.spatial_resolution,
+            band_info=self.band_info,
+            meta_info=self.meta_info,
+        )
+
     def crop_from_ratio(
         self, start_ratio: Union[tuple, np.ndarray], size_ratio: Union[tuple, np.ndarray]
     ) -> None:
@@ -510,34 +623,129 @@ class Band:
         x_start, y_start = np.array(start)
         x_end, y_end = np.array(start) + np.array(size)
         self.data = self.data[x_start:x_end, y_start:y_end, ...]
+        self.transform = _crop_transform(self.transform, x_start, y_start)
+
 
-        # TODO recalculate the new transform. Meanwhile, set to None to avoid silent errors.
-        self.transform = None
-        self.crs = None
+def _crop_transform(transform, row_start: int, col_start: int):
+    """Return the geotransform of a crop starting at (row_start, col_start).
 
+    Transforms other than affine transforms (e.g. None) can't be updated and are set to None.
+    """
+    if isinstance(transform, Affine):
+        return transform * Affine.translation(int(col_start), int(row_start))
+    return None
+
+
+Window = Tuple[int, int, int, int]
+
+
+def _band_windows(window: Window, shapes: Dict[str, Tuple[int, ...]]) -> Dict[str, Window]:
+    """Scale a window defined on the largest band to each band.
+
+    The window of a lower resolution band covers all its pixels overlapping the window, i.e. its
+    start is rounded down and its end rounded up. It is always contained in the band and at least
+    one pixel wide, so that all formats return the same shapes.
+
+    Args:
+        window: (row_start, col_start, height, width) in pixels of the largest band.
+        shapes: mapping from band descriptor to band shape.
+
+    Returns:
+        mapping from band descriptor to the (row_start, col_start, height, width) of this band.
+
+    Raises:
+        ValueError if the window is not contained in the largest band.
+    """
+    ref_shape = np.max([shape[:2] for shape in shapes.values()], axis=0)
+    start, size = np.array(window[:2]), np.array(window[2:])
+    if np.any(start < 0) or np.any(size <= 0) or np.any(start + size > ref_shape):
+        raise ValueError(
+            f"Window {window} is not contained in the largest band of shape {ref_shape}."
+        )
+
+    windows = {}
+    for descriptor, shape in shapes.items():
+        band_shape = np.array(shape[:2])
+        # integer arithmetic, floor(start) and ceil(end) in pixels of this band
+        band_start = np.minimum(start * band_shape // ref_shape, band_shape - 1)
+        band_end = np.minimum(-(-(start + size) * band_shape // ref_shape), band_shape)
+        band_size = np.maximum(band_end - band_start, 1)
+        windows[descriptor] = (*band_start.tolist(), *band_size.tolist())
+    return windows
+
+
+def _rio_window(window: Window) -> rasterio.windows.Window:
+    row_start, col_start, height, width = window
+    return rasterio.windows.Window(col_start, row_start, width, height)
 
-def load_band_tif(file_path) -> Band:
+
+def _read_tif_data(src, window: Window, multi_band: bool) -> np.ndarray:
+    """Read the pixels of an open rasterio dataset as (height, width) or (height, width, bands)."""
+    data = src.read() if window is None else src.read(window=_rio_window(window))
+    data = np.moveaxis(data, 0, 2)
+    if not multi_band:
+        assert data.shape[2] == 1, f"Got shape: {data.shape}."
+        data = np.squeeze(data, axis=2)
+    return data
+
+
+def _load_tif_data(file_path: Path, window: Window, multi_band: bool) -> np.ndarray:
+    with rasterio.open(file_path) as src:
+        return _read_tif_data(src, window, multi_band)
+
+
+def _read_band_tif(
+    src, window: Window = None, tags: Dict[str, Any] = None, lazy: bool = False
+) -> Band:
+    """Read a band from an open rasterio dataset, optionally restricted to a window.
+
+    Without `tags`, the meta data are read from the metadata sidecar of the sample, with fallback
+    on the legacy pickled tags of the file. With `lazy`, pixels are decoded on first access.
+    """
+    file_path = Path(src.name)
+    if tags is None:
+        metadata = _load_tif_metadata(file_path.parent)
+        if metadata is not None and file_path.name in metadata:
+            tags = metadata[file_path.name]
+        else:
+            tags = pickle.loads(ast.literal_eval(src.tags()["data"]))
+
+    if window is None:
+        transform = src.transform
+        height, width = src.shape
+    else:
+        transform = src.window_transform(_rio_window(window))
+        height, width = window[2:]
+
+    multi_band = isinstance(tags["band_info"], MultiBand)
+    if lazy:
+        shape = (height, width, src.count) if multi_band else (height, width)
+        loader = partial(_load_tif_data, file_path, window, multi_band)
+        data = LazyArray(shape, src.dtypes[0], loader)
+    else:
+        data = _read_tif_data(src, window, multi_band)
+    return Band(data=data, transform=transform, crs=src.crs, **tags)
+
+
+def load_band_tif(
+    file_path, window: Window = None, tags: Dict[str, Any] = None, lazy: bool = False
+) -> Band:
     """Load a tif band object at a given filepath.
 
     Args:
         file_path: path to tif file
+        window: (row_start, col_start, height, width) in pixels of this band. Only this region is
+            read and the transform is updated accordingly. Defaults to None, which reads the
+            whole band.
+        tags: meta data of the band, see `_load_tif_metadata`. Defaults to None, which reads them
+            from the sample's metadata sidecar or the legacy tags of the file.
+        lazy: whether to defer decoding the pixels to the first access to `Band.data`.
 
     Returns:
         Band object of tif file
     """
     with rasterio.open(file_path) as src:
-        tags = pickle.loads(ast.literal_eval(src.tags()["data"]))
-        data = src.read()
-        if data.ndim == 3:
-            data = np.moveaxis(data, 0, 2)
-
-        band_info = tags["band_info"]
-        if not isinstance(band_info, MultiBand) and data.ndim == 3:
-            assert data.shape[2] == 1, f"Got shape: {data.shape}."
-            data = np.squeeze(data, axis=2)
-        band = Band(data=data, transform=src.transform, crs=src.crs, **tags)
-
-    return band
+        return _read_band_tif(src, window, tags, lazy)
 
 
 def _make_map(elements) -> Tuple[Any, Any]:
@@ -573,6 +781,123 @@ def _map_bands(band_info_set) -> Tuple[Dict[str, int], List[BandInfo]]:
     return band_name_map, band_info_list
 
 
+class BandSelection(NamedTuple):
+    """Positions in `Sample.bands` of a selection of dates and bands, see `SampleLayout.select`."""
+
+    positions: np.ndarray  # shape (n_dates, n_bands), -1 for missing bands
+    rows: Tuple[Tuple[int, ...], ...]  # positions, as nested tuples
+    used: Tuple[int, ...]  # distinct positions of the selected bands
+    missing: bool  # whether some bands are missing
+    info_positions: Tuple[int, ...]  # position of a band with the band info of each column
+    dates: Tuple[Any, ...]
+    band_names: Tuple[str, ...]
+
+
+class SampleLayout:
+    """Immutable index of the bands of a sample, by band name and date.
+
+    All samples of a dataset typically share the same band names and dates. The layout is thus
+    computed once per distinct sequence of (band name, alt names, date), see `get_sample_layout`,
+    and shared by all samples with this sequence of bands. It only refers to bands by their
+    position in `Sample.bands`.
+    """
+
+    def __init__(self, band_keys: Tuple[Tuple[str, Tuple[str, ...], Any], ...]) -> None:
+        """Initialize new instance of SampleLayout.
+
+        Args:
+            band_keys: (name, alt_names, date) of each band of the sample, in storage order.
+        """
+        self.band_keys = band_keys
+        date_map, dates = _make_map(set(date for _, _, date in band_keys))
+        self.date_map = MappingProxyType(date_map)
+        self.dates = tuple(dates)
+
+        band_name_map: Dict[str, int] = {}
+        band_names: List[str] = []
+        info_positions = []  # position of the first band of each band info
+        for position, (name, alt_names, _) in enumerate(band_keys):
+            if name in band_names:
+                continue
+            band_idx = len(band_names)
+            band_names.append(name)
+            info_positions.append(position)
+            band_name_map[name] = band_idx
+            for alt_name in alt_names:
+                band_name_map[alt_name] = band_idx
+        self.band_name_map = MappingProxyType(band_name_map)
+        self.band_names = tuple(band_names)
+        self.info_positions = tuple(info_positions)
+
+        # position of the band at each (date, band), -1 for missing bands
+        positions = np.full((len(self.dates), len(band_names)), -1, dtype=np.int64)
+        for position, (name, _, date) in enumerate(band_keys):
+            positions[date_map[date], band_name_map[name]] = position
+        positions.flags.writeable = False
+        self.positions = positions
+        self._selections: Dict[Tuple, Tuple[np.ndarray, List[Any], List[str]]] = {}
+
+    def select(
+        self, dates: Sequence[Any] = None, band_names: Sequence[str] = None
+    ) -> BandSelection:
+        """Return the band positions for a selection of dates and bands, cached per selection.
+
+        Args:
+            dates: dates to select. Defaults to None, which selects all dates.
+            band_names: names or alt names of the bands to select. Defaults to None, which selects
+                all bands.
+
+        Returns:
+            selection, see `BandSelection`.
+
+        Raises:
+            KeyError for unknown dates or band names.
+        """
+        key = (
+            None if dates is None else tuple(dates),
+            None if band_names is None else tuple(band_names),
+        )
+        selection = self._selections.get(key)
+        if selection is None:
+            positions = self.positions
+            band_indexes = range(len(self.band_names))
+            if band_names is not None:
+                band_indexes = [self.band_name_map[name] for name in band_names]
+                positions = positions[:, band_indexes]
+            if dates is not None:
+                positions = positions[[self.date_map[date] for date in dates], :]
+            positions.flags.writeable = False
+            rows = tuple(tuple(row) for row in positions.tolist())
+            selection = BandSelection(
+                positions=positions,
+                rows=rows,
+                used=tuple(sorted(set(position for row in rows for position in row) - {-1})),
+                missing=bool((positions < 0).any()),
+                info_positions=tuple(self.info_positions[i] for i in band_indexes),
+                dates=tuple(self.dates if dates is None else dates),
+                band_names=tuple(self.band_names if band_names is None else band_names),
+            )
+            self._selections[key] = selection
+        return selection
+
+
+def _band_key(band: "Band") -> Tuple[str, Tuple[str, ...], Any]:
+    return _layout_key(band.band_info, band.date)
+
+
+def _layout_key(band_info: BandInfo, date) -> Tuple[str, Tuple[str, ...], Any]:
+    alt_names = band_info.alt_names
+    if isinstance(alt_names, str):
+        alt_names = (alt_names,)
+    return band_info.name, tuple(alt_names), date
+
+
+@lru_cache(maxsize=1024)
+def get_sample_layout(band_keys: Tuple[Tuple[str, Tuple[str, ...], Any], ...]) -> SampleLayout:
+    """Return the layout shared by samples with bands `band_keys`, see `SampleLayout`."""
+    return SampleLayout(band_keys)
+
+
 # TODO need to make sure that band order is consistant through the dataset
 class Sample(object):
     """Samples that contains all band information as well as input and label."""
@@ -596,30 +921,76 @@ class Sample(object):
         np.set_printoptions(threshold=5)
         return f"Sample:(name={self.sample_name}, bands=\n{self.bands}\n)"
 
+    def __getstate__(self):
+        """Drop the layout, it is looked up again from the bands when unpickling."""
+        state = self.__dict__.copy()
+        state.pop("_layout", None)
+        state.pop("_band_array", None)
+        return state
+
+    def __setstate__(self, state):
+        """Restore state and look up the layout, also for samples pickled with their own index."""
+        for key in ("date_map", "dates", "band_name_map", "band_info_list", "band_names"):
+            state.pop(key, None)
+        state.pop("band_array", None)
+        self.__dict__.update(state)
+        self._build_index()
+
     def _build_index(self) -> None:
-        """Build index so that bands can all be accessed."""
-        dates = set()
-        band_info_set: OrderedDict = OrderedDict()  # using it as an ordered set
-        bands = self.bands
+        """Look up the layout of the bands, shared by all samples with the same bands and dates."""
+        self._layout = get_sample_layout(tuple(_band_key(band) for band in self.bands))
+        self._band_array = None
+
+    @property
+    def dates(self) -> List[Any]:
+        """Return the sorted dates of the bands."""
+        return list(self._layout.dates)
 
-        for band in bands:
-            dates.add(band.date)
-            band_info_set[band.band_info] = None
+    @property
+    def date_map(self) -> Mapping[Any, int]:
+        """Return the mapping from date to date index."""
+        return self._layout.date_map
+
+    @property
+    def band_names(self) -> List[str]:
+        """Return the names of the bands, in order of first appearance."""
+        return list(self._layout.band_names)
 
-        self.date_map, self.dates = _make_map(dates)
-        self.band_name_map, self.band_info_list = _map_bands(band_info_set.keys())
-        self.band_names: List[str] = [band_info.name for band_info in self.band_info_list]
+    @property
+    def band_name_map(self) -> Mapping[str, int]:
+        """Return the mapping from band name or alt name to band index."""
+        return self._layout.band_name_map
 
-        self.band_array = np.empty((len(self.dates), len(self.band_info_list)), dtype=object)
+    @property
+    def band_info_list(self) -> List[BandInfo]:
+        """Return the band info of each band name."""
+        return [self._band_info(position) for position in self._layout.info_positions]
 
-        for band in bands:
-            band_idx = self.band_name_map[band.band_info.name]
-            date_idx = self.date_map[band.date]
-            self.band_array[date_idx, band_idx] = band
+    @property
+    def band_array(self) -> np.ndarray:
+        """Return the object array of shape (n_dates, n_bands) of bands, None for missing bands."""
+        if self._band_array is None:
+            self._band_array = self._bands_at(self._layout.positions)
+        return self._band_array
+
+    def _bands_at(self, positions: np.ndarray) -> np.ndarray:
+        """Return the object array of the bands at `positions`, None where the position is -1."""
+        bands = np.empty(len(self.bands) + 1, dtype=object)
+        bands[:-1] = self.bands
+        return bands[positions]  # -1 selects the trailing None
 
     def get_band_info(self, band_name):
         """Retrieve indexed band info."""
-        return self.band_info_list[self.band_name_map[band_name]]
+        position = self._layout.info_positions[self._layout.band_name_map[band_name]]
+        return self._band_info(position)
+
+    def _band_info(self, position: int) -> BandInfo:
+        """Return the band info of the band at `position` in `bands`."""
+        return self.bands[position].band_info
+
+    def _band_data(self, position: int) -> np.ndarray:
+        """Return the data of the band at `position` in `bands`."""
+        return self.bands[position].data
 
     def is_time_series(self) -> bool:
         """Check if sample is a time series."""
@@ -627,11 +998,17 @@ class Sample(object):
 
     def largest_shape(self):
         """Return the height and width of the largest band, including label."""
-        bands: List[Any] = self.bands
+        bands: List[Any] = list(self.bands)
         if isinstance(self.label, Band):
             bands.append(self.label)
         return _largest_shape(np.array(bands))
 
+    def packed_dtype(self, dates=None, band_names: Sequence[str] = None, fill_value: float = None):
+        """Return the dtype of the array returned by `pack_to_4d` with the same arguments."""
+        selection = self._layout.select(dates, band_names)
+        dtypes = [self._band_data(position).dtype for position in selection.used]
+        return _packed_dtype(dtypes, selection.missing, fill_value)
+
     def pack_to_4d(
         self,
         dates=None,
@@ -639,6 +1016,8 @@ class Sample(object):
         resample: bool = False,
         fill_value: float = None,
         resample_order: int = 3,
+        resample_method: str = None,
+        out: np.ndarray = None,
     ) -> Tuple[np.ndarray, List[datetime.date], List[str]]:
         """Pack all bands into an 4d array of shape (n_dates, height, width, n_bands).
 
@@ -649,59 +1028,96 @@ class Sample(object):
             band_names: Selects a subset of bands with a list of string. Defaults to None, which selects all bands.
                 Will search into band_info.name and band_info.alt_names. You cen use, e.g., ('red', 'green', 'blue').
             resample: will enable resampling bands to match the largest shape. Defaults to False and raises an error
-                if bands are not all the same shape. Resampling is performed using scipy.ndimage.zoom with order `resample_order`
+                if bands are not all the same shape. Bands sharing a shape are resampled together, see geobench.resampling.
             fill_value: Fills missing bands with this value. Defaults to None, which will raise an error for missing bands.
                 The type or np.dtype of fill_value may influence the numerical precision of the returned array. See numpy.array's documentation.
-            resample_order: passed to scipy.ndimage.zoom when resampling.
+                Missing MultiBands are filled on all their channels.
+            resample_order: 0, 1 or 3 selects the nearest, bilinear or bicubic method. Other orders are passed to
+                scipy.ndimage.zoom.
+            resample_method: 'nearest', 'bilinear', 'bicubic' or 'area'. Defaults to None, which uses `resample_order`.
+            out: array of shape (n_dates, height, width, n_bands) to pack the bands into, e.g., a slice of a batch,
+                whose dtype is kept. Defaults to None, which allocates it.
 
         Returns:
-            array: 4d array of (n_dates, height, width, n_bands) containing the packed data.
+            array: 4d array of (n_dates, height, width, n_bands) containing the packed data. It is allocated once and
+                each band is copied into its slice.
             dates: selected dates
             band_names: selected bands
         """
-        band_array, dates, band_names = self.get_band_array(dates, band_names)
-        shape = _largest_shape(band_array)
-        data_grid = []
-        for i in range(band_array.shape[0]):
-            data_list = []
-            for j in range(band_array.shape[1]):
-                band = band_array[i, j]
-
-                if band is None:
-                    if fill_value is not None:
-                        # TODO doesn't work yet with MultiBand will raise an error when concatenating
-                        data_list.append(np.zeros(shape, dtype=np.int16) + fill_value)
-                    else:
-                        if band_names is not None:
-                            raise ValueError(
-                                f"Missing band {band_names[j]} for date {dates[i]:s}, but fill_vlaue is None."
-                            )
-                        else:
-                            raise ValueError(f"Missing band names got {band_names}")
-                else:
-                    data = band.data
-                    if data.ndim == 2:
-                        data = np.expand_dims(data, 2)
-                    if data.shape[:2] != shape:
-                        if resample:
-                            zoom_factor = np.concatenate(
-                                (np.array(shape) / np.array(data.shape[:2]), [1])
-                            )
-                            assert zoom_factor[0] == zoom_factor[1]
-                            data_list.append(zoom(data, zoom=zoom_factor, order=resample_order))
-                        else:
-                            raise ValueError(
-                                f"Band {band_names[j]} has shape {data.shape:s}, max shape is {shape:s}, but resample is set to False."  # type: ignore
-                            )
-                    else:
-                        data_list.append(data)
-            data_grid.append(np.concatenate(data_list, axis=2))
+        selection = self._layout.select(dates, band_names)
+        dates, band_names = list(selection.dates), list(selection.band_names)
+        band_infos = [self._band_info(position) for position in selection.info_positions]
+        datas = {position: self._band_data(position) for position in selection.used}
+        missing = selection.missing
+        shapes = [data.shape for data in datas.values()]
+        height = max((shape[0] for shape in shapes), default=0)
+        width = max((shape[1] for shape in shapes), default=0)
+
+        # channel offset of each band and output dtype, computed before allocating
+        offsets = [0]
+        for band_info, column in zip(band_infos, zip(*selection.rows)):
+            data = next((datas[position] for position in column if position >= 0), None)
+            offsets.append(offsets[-1] + _n_channels(band_info, data))
+        dtype = _packed_dtype([data.dtype for data in datas.values()], missing, fill_value)
 
         band_names_ = []
-        for name in band_names:  # type: ignore
-            band_names_.extend(self.get_band_info(name).expand_name())
+        for band_info in band_infos:
+            band_names_.extend(band_info.expand_name())
+
+        shape = (len(dates), height, width, offsets[-1])
+        if out is None:
+            array = np.empty(shape, dtype=dtype)
+        elif out.shape != shape:
+            raise ValueError(f"Expected out of shape {shape}, got {out.shape}.")
+        else:
+            array = out
+        if not missing and all(shape == (height, width) for shape in shapes):
+            # single band 2d arrays of the same shape, one copy per date
+            for i, row in enumerate(selection.rows):
+                np.stack([datas[position] for position in row], axis=-1, out=array[i])
+            return array, dates, band_names_
+
+        to_resample = []  # resampled together once all bands are placed
+        for i, row in enumerate(selection.rows):
+            for j, position in enumerate(row):
+                out = array[i, :, :, offsets[j] : offsets[j + 1]]
+                if position < 0:
+                    if fill_value is None:
+                        raise ValueError(
+                            f"Missing band {band_names[j]} for date {dates[i]}, but fill_value is None."
+                        )
+                    out[...] = fill_value
+                    continue
+
+                data = datas[position]
+                if data.ndim == 2:
+                    data = data[:, :, None]
+                if data.shape[:2] != (height, width):
+                    if not resample:
+                        raise ValueError(
+                            f"Band {band_names[j]} has shape {data.shape}, max shape is {(height, width)}, but resample is set to False."
+                        )
+                    to_resample.append((out, data))
+                else:
+                    out[...] = data
+
+        if len(to_resample) > 0:
+            outs, datas = zip(*to_resample)
+            if resample_method is None and resample_order not in ORDER_TO_METHOD:
+                resampled = [
+                    zoom(
+                        data,
+                        (height / data.shape[0], width / data.shape[1], 1),
+                        order=resample_order,
+                    )
+                    for data in datas
+                ]
+            else:
+                method = resample_method or ORDER_TO_METHOD[resample_order]
+                resampled = resample_batch(datas, (height, width), method)
+            for out, data in zip(outs, resampled):
+                out[...] = data
 
-        array = np.array(data_grid)
         return array, dates, band_names_
 
     def get_band_array(
@@ -718,24 +1134,18 @@ class Sample(object):
         Returns:
             array of band data across dates and band names
         """
-        band_array = self.band_array
-
-        if band_names is not None:
-            band_indexes = [self.band_name_map[band_name] for band_name in band_names]
-            band_array = band_array[:, band_indexes]
-        else:
-            band_names = self.band_names
-
-        if dates is not None:
-            date_indexes = [self.date_map[date] for date in dates]
-            band_array = band_array[date_indexes, :]
-        else:
-            dates = self.dates
-
+        selection = self._layout.select(dates, band_names)
+        band_array = self._bands_at(selection.positions)
+        dates, band_names = list(selection.dates), list(selection.band_names)
         return band_array, dates, band_names  # type : ignore
 
     def pack_to_3d(
-        self, band_names: List[str], resample: bool = False, fill_value=None, resample_order=3
+        self,
+        band_names: List[str],
+        resample: bool = False,
+        fill_value=None,
+        resample_order=3,
+        resample_method: str = None,
     ) -> Tuple[np.ndarray, List[str]]:
         """Pack representation to 3d array.
 
@@ -743,7 +1153,8 @@ class Sample(object):
             band_names: list of band names to pack into 3d array
             resample: whether to resample or not
             fill_value: fills missing bands with this value.
-            resample_order
+            resample_order: see `pack_to_4d`.
+            resample_method: see `pack_to_4d`.
 
         Returns:
             data array and band names
@@ -753,22 +1164,307 @@ class Sample(object):
             resample=resample,
             fill_value=fill_value,
             resample_order=resample_order,
+            resample_method=resample_method,
         )
         assert data_4d.shape[0] == 1
         return data_4d[0], band_names
 
-    def write(self, dataset_dir: str, format: str = "hdf5"):  # -> Callable[[Sample, str], None]:
+    def write(self, dataset_dir: str, format: str = "hdf5", **kwargs):
         """Write sample to a directory.
 
         Args:
             dataset_dir: path to dataset directory.
-            format: 'hdf5' or 'tif'
+            format: 'hdf5', 'tif' or 'npz'
+            kwargs: passed to the writer, e.g., compression and chunks for `write_sample_hdf5`.
 
         Returns:
-            callable function of correct writer for file format options
+            path of the written sample
+        """
+        writer = dict(hdf5=write_sample_hdf5, tif=write_sample_tif, npz=write_sample_npz)[format]
+        return writer(sample=self, dataset_dir=dataset_dir, **kwargs)
+
+    def compact(self) -> "CompactSample":
+        """Return a copy of the sample storing its bands in contiguous arrays, see `CompactSample`."""
+        return CompactSample(self.bands, self.label, self.sample_name)
+
+
+def _equal(value, other) -> bool:
+    """Compare meta data of bands, which can be None, CRS, Affine or dicts of arrays."""
+    if value is other:
+        return True
+    if value is None or other is None:
+        return False
+    try:
+        return bool(value == other)
+    except (TypeError, ValueError):
+        return False
+
+
+class BandGroup:
+    """2d bands of a sample with the same shape, dtype and georeferencing, in one array.
+
+    The data of the band of info `band_infos[c]` acquired at `dates[t]` is `data[t, c]`. Bands
+    missing at some dates are zeros and flagged in `present`.
+    """
+
+    def __init__(
+        self,
+        data: np.ndarray,
+        band_infos: Sequence[BandInfo],
+        dates: Sequence[Any],
+        date_ids: Sequence[Any],
+        present: np.ndarray,
+        spatial_resolution: float,
+        transform=None,
+        crs=None,
+        meta_info=None,
+        convert_to_int16: bool = True,
+    ) -> None:
+        """Initialize new instance of BandGroup.
+
+        Args:
+            data: array of shape (n_dates, n_channels, height, width).
+            band_infos: band info of each channel.
+            dates: date of each row of data.
+            date_ids: date id of each row of data.
+            present: boolean array of shape (n_dates, n_channels), False for missing bands.
+            spatial_resolution: spatial resolution shared by the bands, see `Band`.
+            transform: georeferencing transformation shared by the bands.
+            crs: coordinate reference system shared by the bands.
+            meta_info: meta info shared by the bands.
+            convert_to_int16: see `Band`.
         """
-        writer = dict(hdf5=write_sample_hdf5, tif=write_sample_tif)[format]
-        return writer(sample=self, dataset_dir=dataset_dir)
+        self.data = data
+        self.band_infos = tuple(band_infos)
+        self.dates = tuple(dates)
+        self.date_ids = tuple(date_ids)
+        self.present = present
+        self.spatial_resolution = spatial_resolution
+        self.transform = transform
+        self.crs = crs
+        self.meta_info = meta_info
+        self.convert_to_int16 = convert_to_int16
+
+    def __repr__(self):
+        """Return representation of a BandGroup."""
+        return f"BandGroup(shape={self.data.shape}, dtype={self.data.dtype}, bands={[info.name for info in self.band_infos]})"
+
+    def accepts(self, band: Band) -> bool:
+        """Check if a 2d band has the shape, dtype and georeferencing of the group."""
+        return (
+            band.data.shape == self.data.shape[2:]
+            and band.data.dtype == self.data.dtype
+            and band.spatial_resolution == self.spatial_resolution
+            and band.convert_to_int16 == self.convert_to_int16
+            and _equal(band.transform, self.transform)
+            and _equal(band.crs, self.crs)
+            and _equal(band.meta_info, self.meta_info)
+        )
+
+    def band(self, t: int, c: int) -> Band:
+        """Return the band at date `t` and channel `c`, whose data is a view on the group array."""
+        return Band(
+            data=self.data[t, c],
+            band_info=self.band_infos[c],
+            spatial_resolution=self.spatial_resolution,
+            date=self.dates[t],
+            date_id=self.date_ids[t],
+            transform=self.transform,
+            crs=self.crs,
+            meta_info=self.meta_info,
+            convert_to_int16=self.convert_to_int16,
+        )
+
+
+def _pack_bands(bands: Sequence[Band]) -> Tuple[List[BandGroup], List[Band], np.ndarray]:
+    """Pack 2d bands into groups, see `CompactSample`.
+
+    Returns:
+        groups: the band groups.
+        extras: bands that are not 2d, kept as is.
+        slots: array of shape (n_bands, 3) with the (group id, date, channel) of each band, or
+            (-1, 0, index in extras) for extras.
+    """
+    members: List[List[Tuple[int, Band]]] = []  # (position, band) of each group
+    protos: List[BandGroup] = []  # empty groups holding the shared meta data, for matching
+    cells: List[set] = []  # (date, date_id, band_info) of each group, a band fits only once
+    extras: List[Band] = []
+    slots = np.zeros((len(bands), 3), dtype=np.int64)
+    for position, band in enumerate(bands):
+        data = band.data
+        if data.ndim != 2:
+            slots[position] = (-1, 0, len(extras))
+            extras.append(band)
+            continue
+        cell = (band.date, band.date_id, band.band_info)
+        for group_id, proto in enumerate(protos):
+            if cell not in cells[group_id] and proto.accepts(band):
+                break
+        else:
+            group_id = len(protos)
+            protos.append(
+                BandGroup(
+                    np.empty((0, 0) + data.shape, dtype=data.dtype),
+                    (),
+                    (),
+                    (),
+                    None,
+                    band.spatial_resolution,
+                    band.transform,
+                    band.crs,
+                    band.meta_info,
+                    band.convert_to_int16,
+                )
+            )
+            members.append([])
+            cells.append(set())
+        members[group_id].append((position, band))
+        cells[group_id].add(cell)
+
+    groups = []
+    for group_id, (proto, group_members) in enumerate(zip(protos, members)):
+        # rows and channels in order of first appearance
+        date_keys: Dict[Tuple[Any, Any], int] = {}
+        channels: Dict[BandInfo, int] = {}
+        for _, band in group_members:
+            date_keys.setdefault((band.date, band.date_id), len(date_keys))
+            channels.setdefault(band.band_info, len(channels))
+        data = np.zeros((len(date_keys), len(channels)) + proto.data.shape[2:], proto.data.dtype)
+        present = np.zeros(data.shape[:2], dtype=bool)
+        for position, band in group_members:
+            t = date_keys[(band.date, band.date_id)]
+            c = channels[band.band_info]
+            data[t, c] = band.data
+            present[t, c] = True
+            slots[position] = (group_id, t, c)
+        proto.data = data
+        proto.band_infos = tuple(channels)
+        proto.dates = tuple(date for date, _ in date_keys)
+        proto.date_ids = tuple(date_id for _, date_id in date_keys)
+        proto.present = present
+        groups.append(proto)
+    return groups, extras, slots
+
+
+class CompactSample(Sample):
+    """Sample storing its 2d bands in a few contiguous arrays, with shared meta data.
+
+    Bands with the same shape, dtype, spatial resolution and georeferencing, e.g., the 10m bands of
+    a Sentinel-2 time series, are stored as one `BandGroup` array of shape (n_dates, n_channels,
+    height, width). This keeps the number of Python objects, the pickling cost and the memory
+    fragmentation low, e.g., for samples sent by DataLoader workers or kept in memory caches.
+
+    `bands` returns `Band` views on the group arrays, created on first access, in the order of the
+    original bands. Writing to the data of a view writes to the group array. Views are the
+    reference once created: replacing their attributes or the list items is supported, and the
+    groups are packed again when needed, e.g., for pickling. Assigning `bands` packs the new bands.
+    """
+
+    @property
+    def bands(self) -> List[Band]:
+        """Return the bands, as views on the group arrays."""
+        if self._bands is None:
+            bands = []
+            for group_id, t, c in self._slots.tolist():
+                bands.append(self._extras[c] if group_id < 0 else self._groups[group_id].band(t, c))
+            self._bands = bands
+            self._snapshot = self._take_snapshot()
+        return self._bands
+
+    @bands.setter
+    def bands(self, bands: Sequence[Band]) -> None:
+        self._groups, self._extras, self._slots = _pack_bands(bands)
+        self._bands = None
+        self._snapshot = None
+
+    @property
+    def groups(self) -> List[BandGroup]:
+        """Return the band groups, packed again if the band views were modified."""
+        self._sync()
+        return self._groups
+
+    def _take_snapshot(self) -> Tuple:
+        return tuple((band, tuple(band.__dict__.items())) for band in self._bands)  # type: ignore
+
+    def _sync(self) -> None:
+        """Pack the band views again if they were replaced or if their attributes changed."""
+        if self._bands is None:
+            return
+        snapshot = self._snapshot
+        if len(snapshot) == len(self._bands) and all(
+            band is band_
+            and len(items) == len(band.__dict__)
+            and all(value is band.__dict__.get(key, self) for key, value in items)
+            for band_, (band, items) in zip(self._bands, snapshot)
+        ):
+            return
+        bands = self._bands
+        self.bands = bands
+        # keep the views handed out, as views on the new group arrays
+        for band, (group_id, t, c) in zip(bands, self._slots.tolist()):
+            if group_id >= 0:
+                band.data = self._groups[group_id].data[t, c]
+        self._bands = bands
+        self._snapshot = self._take_snapshot()
+        self._build_index()
+
+    def __getstate__(self):
+        """Pickle the group arrays and shared meta data only, not the band views."""
+        self._sync()
+        return dict(
+            _groups=self._groups,
+            _extras=self._extras,
+            _slots=self._slots,
+            label=self.label,
+            sample_name=self.sample_name,
+        )
+
+    def __setstate__(self, state):
+        """Restore state, band views are created again on first access."""
+        self.__dict__.update(state)
+        self._bands = None
+        self._snapshot = None
+        self._build_index()
+
+    def _build_index(self) -> None:
+        """Look up the layout from the groups, without creating the band views."""
+        if self._bands is not None:
+            return super()._build_index()
+        keys = []
+        for group_id, t, c in self._slots.tolist():
+            if group_id < 0:
+                keys.append(_band_key(self._extras[c]))
+            else:
+                group = self._groups[group_id]
+                keys.append(_layout_key(group.band_infos[c], group.dates[t]))
+        self._layout = get_sample_layout(tuple(keys))
+        self._band_array = None
+
+    def _band_info(self, position: int) -> BandInfo:
+        if self._bands is not None:
+            return self._bands[position].band_info
+        group_id, _, c = self._slots[position].tolist()
+        return self._extras[c].band_info if group_id < 0 else self._groups[group_id].band_infos[c]
+
+    def _band_data(self, position: int) -> np.ndarray:
+        if self._bands is not None:
+            return self._bands[position].data
+        group_id, t, c = self._slots[position].tolist()
+        return self._extras[c].data if group_id < 0 else self._groups[group_id].data[t, c]
+
+    def largest_shape(self):
+        """Return the height and width of the largest band, including label."""
+        if self._bands is not None:
+            return super().largest_shape()
+        shapes = [group.data.shape[2:] for group in self._groups]
+        shapes += [band.shape for band in self._extras]
+        if isinstance(self.label, Band):
+            shapes.append(self.label.shape)
+        return tuple(int(max((shape[i] for shape in shapes), default=0)) for i in range(2))
+
+    def compact(self) -> "CompactSample":
+        """Return the sample itself, already compact."""
+        return self
 
 
 def write_sample_tif(sample: Sample, dataset_dir: str) -> Path:
@@ -790,8 +1486,10 @@ def write_sample_tif(sample: Sample, dataset_dir: str) -> Path:
     band_index = (
         OrderedDict()
     )  # TODO maybe replace this band_index with a structure similar to band array.
+    band_tags = {}
     for i, band in enumerate(sample.bands):
-        file = band.write_to_geotiff(dst_dir)
+        file = band.write_to_geotiff(dst_dir, write_tags=False)
+        band_tags[file.name] = band._tif_tags()
         band_name = band.band_info.name
         if band_name not in band_index:
             band_index[band_name] = [file.name]
@@ -811,221 +1509,899 @@ def write_sample_tif(sample: Sample, dataset_dir: str) -> Path:
                 raise ValueError(
                     "The label is of type Band, but its band_info is not instance of Label."
                 )
-            sample.label.write_to_geotiff(dst_dir)
+            file = sample.label.write_to_geotiff(dst_dir, write_tags=False)
+            band_tags[file.name] = sample.label._tif_tags()
         else:
             with open(Path(dst_dir, "label.json"), "w") as fd:
                 json.dump(sample.label, fd)
+
+    with open(Path(dst_dir, TIF_METADATA_FILE), "w") as fd:
+        fd.write(_encode_tif_metadata(band_tags))
     return dst_dir
 
 
-def write_sample_hdf5(sample: Sample, dataset_dir: str):
-    """Write a sample to tif.
+HEADER_VERSION = 2
+
+
+def _to_json(value: Any) -> Any:
+    """Recursively convert `value` to json compatible objects, tagging non native types with `__type__`."""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, Affine):  # before tuple, Affine is a namedtuple
+        return {"__type__": "affine", "value": list(value)[:6]}
+    if isinstance(value, list):
+        return [_to_json(item) for item in value]
+    if isinstance(value, tuple):
+        return {"__type__": "tuple", "value": [_to_json(item) for item in value]}
+    if isinstance(value, dict):
+        if all(isinstance(key, str) for key in value.keys()):
+            return {key: _to_json(item) for key, item in value.items()}
+        items = [[_to_json(key), _to_json(item)] for key, item in value.items()]
+        return {"__type__": "dict", "value": items}
+    if isinstance(value, datetime.datetime):
+        return {"__type__": "datetime", "value": value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {"__type__": "date", "value": value.isoformat()}
+    if isinstance(value, np.ndarray):
+        return {
+            "__type__": "ndarray",
+            "value": value.tolist(),
+            "dtype": value.dtype.str,
+            "shape": list(value.shape),
+        }
+    if isinstance(value, BandInfo) and type(value).__name__ in _BAND_INFO_REGISTRY:
+        return {
+            "__type__": "band_info",
+            "class": type(value).__name__,
+            "value": _to_json(vars(value)),
+        }
+    if isinstance(value, CRS):
+        return {"__type__": "crs", "value": value.to_wkt()}
+    # anything else is kept as a pickle, this is only expected for exotic meta_info.
+    return {"__type__": "pickle", "value": base64.b64encode(pickle.dumps(value)).decode("ascii")}
+
+
+def _from_json(obj: Dict[str, Any]) -> Any:
+    """Json object_hook reverting the tagged types produced by `_to_json`."""
+    type_name = obj.get("__type__")
+    if type_name is None:
+        return obj
+    value = obj["value"]
+    if type_name == "tuple":
+        return tuple(value)
+    if type_name == "dict":
+        return {(tuple(key) if isinstance(key, list) else key): item for key, item in value}
+    if type_name == "datetime":
+        return datetime.datetime.fromisoformat(value)
+    if type_name == "date":
+        return datetime.date.fromisoformat(value)
+    if type_name == "ndarray":
+        return np.array(value, dtype=obj["dtype"]).reshape(obj["shape"])
+    if type_name == "band_info":
+        cls = _BAND_INFO_REGISTRY.get(obj["class"])
+        if cls is None:
+            raise ValueError(f"Unknown BandInfo class {obj['class']} in sample header.")
+        band_info = cls.__new__(cls)
+        band_info.__dict__.update(value)
+        return band_info
+    if type_name == "affine":
+        return Affine(*value)
+    if type_name == "crs":
+        return CRS.from_wkt(value)
+    if type_name == "pickle":
+        return pickle.loads(base64.b64decode(value))
+    raise ValueError(f"Unknown type {type_name} in sample header.")
+
+
+def encode_header(attr_dict: Dict[str, Any]) -> str:
+    """Encode the band and label meta data of a sample to a versioned json string.
+
+    Args:
+        attr_dict: mapping from band descriptor to band attributes, as well as `bands_order` and
+            optionally `label`.
+
+    Returns:
+        json string
+    """
+    return json.dumps(_to_json(dict(attr_dict, version=HEADER_VERSION)), separators=(",", ":"))
+
+
+def decode_header(header: str) -> Dict[str, Any]:
+    """Decode a header produced by `encode_header`.
+
+    Args:
+        header: json string
+
+    Returns:
+        attr_dict
+
+    Raises:
+        ValueError if the header was written by a more recent version of geobench.
+    """
+    attr_dict = json.loads(header, object_hook=_from_json)
+    version = attr_dict.pop("version", None)
+    if version is None or version > HEADER_VERSION:
+        raise ValueError(f"Unsupported sample header version {version}.")
+    return attr_dict
+
+
+def _read_header(attrs) -> Dict[str, Any]:
+    """Decode the header stored in HDF5 attributes or npz arrays, with fallback on legacy pickled headers."""
+    if "header" in attrs:
+        return decode_header(str(attrs["header"]))
+    return pickle.loads(ast.literal_eval(str(attrs["pickle"])))
+
+
+TIF_METADATA_FILE = "band_metadata.json"
+
+
+def _encode_tif_metadata(band_tags: Dict[str, Dict[str, Any]]) -> str:
+    """Encode the meta data of the tif files of a sample, storing each distinct band_info once.
+
+    Args:
+        band_tags: mapping from tif file name to the meta data of its band.
+
+    Returns:
+        json string
+    """
+    band_infos: Dict[str, Any] = {}
+    files = {}
+    for file_name, tags in band_tags.items():
+        key = json.dumps(_to_json(tags["band_info"]), sort_keys=True)
+        band_info_id = band_infos.setdefault(key, len(band_infos))
+        files[file_name] = dict(tags, band_info=band_info_id)
+    band_infos_list = [json.loads(key, object_hook=_from_json) for key in band_infos]
+    return encode_header(
+        dict(band_infos=encode_header(dict(band_infos=band_infos_list)), files=files)
+    )
+
+
+@lru_cache(maxsize=128)
+def _decode_band_infos(band_infos: str) -> Tuple[BandInfo, ...]:
+    """Decode the band infos of a metadata sidecar, once per dataset since they are identical across samples."""
+    return tuple(decode_header(band_infos)["band_infos"])
+
+
+def _load_tif_metadata(sample_dir) -> Optional[Dict[str, Dict[str, Any]]]:
+    """Load the meta data of the tif files of a sample.
+
+    Args:
+        sample_dir: path to the sample directory.
+
+    Returns:
+        mapping from tif file name to the meta data of its band, or None for legacy samples whose
+        meta data are stored as pickled tags in each file.
+    """
+    try:
+        with open(Path(sample_dir, TIF_METADATA_FILE), "r") as fd:
+            metadata = decode_header(fd.read())
+    except FileNotFoundError:
+        return None
+    band_infos = _decode_band_infos(metadata["band_infos"])
+    files = metadata["files"]
+    for tags in files.values():
+        tags["band_info"] = band_infos[tags["band_info"]]
+    return files
+
+
+def _make_attr_dict(sample: Sample) -> Tuple[List[Band], Dict[str, Any]]:
+    """Collect the bands to write for `sample`, including the label band, and their attributes.
+
+    Args:
+        sample: sample to write
+
+    Returns:
+        bands: list of bands to write, the label band is appended last if any
+        attr_dict: mapping from band descriptor to band attributes, with `bands_order` and the
+            label when it is not a Band.
+    """
+    bands = list(sample.bands)
+    attr_dict: Dict[str, Any] = {}
+    bands_order = []
+
+    if sample.label is not None:
+        if isinstance(sample.label, Band):
+            if not isinstance(sample.label.band_info, LabelType):
+                raise ValueError(
+                    "The label is of type Band, but its band_info is not instance of Label."
+                )
+            assert sample.label.band_info.name == "label"
+            bands.append(sample.label)
+        else:
+            attr_dict["label"] = sample.label
+
+    for band in bands:
+        band_descriptor = band.get_descriptor()
+        attrs = dict(
+            date=band.date,
+            date_id=band.date_id,
+            spatial_resolution=band.spatial_resolution,
+            band_info=band.band_info,
+            meta_info=band.meta_info,
+            transform=band.transform,
+            crs=band.crs,
+        )
+        bands_order.append(band_descriptor)
+        attr_dict[band_descriptor] = attrs
+
+    attr_dict["bands_order"] = bands_order
+    return bands, attr_dict
+
+
+def _hdf5_filter_kwargs(
+    compression: Optional[str], compression_opts: Any = None, shuffle: bool = False
+) -> Dict[str, Any]:
+    """Return the keyword arguments of h5py's create_dataset for a compression filter.
+
+    Args:
+        compression: None, 'lzf', 'gzip', or 'zstd' and 'blosc' which require hdf5plugin.
+        compression_opts: gzip level (0-9) or zstd / blosc level. Defaults to the filter default.
+        shuffle: enable the byte shuffle filter. For blosc, the blosc internal shuffle is used.
+
+    Returns:
+        dict of keyword arguments
+
+    Raises:
+        ImportError if the filter requires hdf5plugin and it is not installed.
+        ValueError for unknown filters.
+    """
+    if compression is None:
+        return {}
+    if compression in ("lzf", "gzip"):
+        return dict(compression=compression, compression_opts=compression_opts, shuffle=shuffle)
+    if compression in ("zstd", "blosc"):
+        if hdf5plugin is None:
+            raise ImportError(
+                f"Compression {compression} requires hdf5plugin: pip install hdf5plugin."
+            )
+        if compression == "zstd":
+            return dict(hdf5plugin.Zstd(clevel=compression_opts or 3), shuffle=shuffle)
+        blosc_shuffle = hdf5plugin.Blosc.SHUFFLE if shuffle else hdf5plugin.Blosc.NOSHUFFLE
+        return dict(
+            hdf5plugin.Blosc(cname="zstd", clevel=compression_opts or 5, shuffle=blosc_shuffle)
+        )
+    raise ValueError(f"Unknown compression {compression}, choose 'lzf', 'gzip', 'zstd' or 'blosc'.")
+
+
+def _hdf5_chunks(chunks, shape: Tuple[int, ...]):
+    """Adapt a 2d chunk shape to the shape of a band, chunks span the full channel axis of MultiBands."""
+    if chunks is None or chunks is True or len(shape) < 2:
+        return chunks
+    return tuple(min(size, dim) for size, dim in zip(chunks, shape[:2])) + tuple(shape[2:])
+
+
+def write_sample_hdf5(
+    sample: Sample,
+    dataset_dir: str,
+    compression: str = None,
+    compression_opts: Any = None,
+    shuffle: bool = False,
+    chunks: Union[bool, Tuple[int, int]] = None,
+):
+    """Write a sample to hdf5.
+
+    By default, bands are written contiguously without compression. Compressed files are read
+    transparently by `load_sample_hdf5`, but zstd and blosc filters require hdf5plugin.
 
     Args:
         sample: sample to write to directory
         dataset_dir: path to dataset directory
+        compression: None, 'lzf', 'gzip', or 'zstd' and 'blosc' which require hdf5plugin.
+        compression_opts: gzip level (0-9) or zstd / blosc level. Defaults to the filter default.
+        shuffle: enable the byte shuffle filter, which usually improves the compression of int16
+            bands.
+        chunks: (height, width) of the chunks, clipped to the shape of each band. True lets h5py
+            guess the chunk shape. Defaults to None which is contiguous, unless compression is
+            used, in which case h5py guesses the chunk shape.
 
     Return
         path to sample
     """
     sample_path = Path(dataset_dir) / f"{sample.sample_name}.hdf5"
+    bands, attr_dict = _make_attr_dict(sample)
+    filter_kwargs = _hdf5_filter_kwargs(compression, compression_opts, shuffle)
 
     with h5py.File(sample_path, "w") as fp:
-        bands = sample.bands
+        for band, band_descriptor in zip(bands, attr_dict["bands_order"]):
+            data = np.asarray(band.data)
+            if data.ndim == 0:
+                fp.create_dataset(name=band_descriptor, data=data)
+            else:
+                fp.create_dataset(
+                    name=band_descriptor,
+                    data=data,
+                    chunks=_hdf5_chunks(chunks, data.shape),
+                    **filter_kwargs,
+                )
+        fp.attrs["header"] = encode_header(attr_dict)  # a single header is faster to parse
+    return sample_path
+
+
+def _select_descriptors(
+    descriptors: Sequence[str], band_infos: Dict[str, BandInfo], band_names: Sequence[str] = None
+) -> List[str]:
+    """Select the stored band descriptors matching `band_names`.
+
+    A descriptor matches if the name or one of the alt names of its band_info is requested. Time
+    series have one descriptor per date for each band, all of them are selected. Label descriptors
+    are always kept.
+
+    Args:
+        descriptors: band descriptors in storage order
+        band_infos: mapping from descriptor to its BandInfo
+        band_names: names or alt names of the bands to select. None selects all bands.
+
+    Returns:
+        selected descriptors, in storage order
+
+    Raises:
+        ValueError if a requested band is not present in the sample
+    """
+    if band_names is None:
+        return list(descriptors)
+
+    requested = set(band_names)
+    found = set()
+    selected = []
+    for descriptor in descriptors:
+        if descriptor.startswith("label"):
+            selected.append(descriptor)
+            continue
+        band_info = band_infos[descriptor]
+        alt_names = band_info.alt_names
+        if isinstance(alt_names, str):
+            alt_names = (alt_names,)
+        matched = requested.intersection((band_info.name,) + tuple(alt_names))
+        if matched:
+            selected.append(descriptor)
+            found.update(matched)
+
+    missing = requested.difference(found)
+    if missing:
+        raise ValueError(f"Bands {sorted(missing)} not found in sample. Got {list(descriptors)}.")
+    return selected
+
+
+def _sample_descriptors(
+    attr_dict: Dict[str, Any], band_names: Sequence[str] = None, label_only: bool = False
+) -> List[str]:
+    """Return the descriptors to read from a sample header, for the selected bands or the label only."""
+    descriptors = attr_dict["bands_order"]
+    if label_only:
+        return [name for name in descriptors if name.startswith("label")]
+    band_infos = {name: attr_dict[name]["band_info"] for name in descriptors}
+    return _select_descriptors(descriptors, band_infos, band_names)
+
+
+def _build_sample(
+    attr_dict: Dict[str, Any],
+    descriptors: Sequence[str],
+    read_band: Callable[[str], np.ndarray],
+    sample_name: str,
+    windows: Dict[str, Window] = None,
+) -> Sample:
+    """Build a Sample from its decoded header, reading the data of each descriptor with `read_band`.
+
+    When `windows` is provided, `read_band` is expected to return the windowed data and the
+    transform of each band is updated to the window.
+    """
+    bands = []
+    label = None
+    for descriptor in descriptors:
+        band = Band(data=read_band(descriptor), **attr_dict[descriptor])
+        if windows is not None:
+            band.transform = _crop_transform(band.transform, *windows[descriptor][:2])
+        if descriptor.startswith("label"):
+            label = band
+        else:
+            bands.append(band)
+    if label is None:
+        label = attr_dict.get("label", None)
+    return Sample(bands=bands, label=label, sample_name=sample_name)
+
+
+def _pack_layout(
+    band_metas: Dict[Any, Tuple[BandInfo, Any, Tuple[int, ...]]], band_names: Sequence[str] = None
+) -> Tuple[Dict[Any, Tuple[int, int, int]], List[Any], Dict[str, Tuple[int, int]], int]:
+    """Locate bands in an array of shape (n_dates, height, width, n_channels), as `Sample.pack_to_4d`.
+
+    Args:
+        band_metas: mapping from a band key to the (band_info, date, shape) of the band.
+        band_names: names or alt names of the bands, in channel order. Defaults to None, which uses
+            the order of first appearance.
+
+    Returns:
+        locations: mapping from band key to (date index, first channel, number of channels)
+        dates: sorted dates
+        channels: mapping from band name to (first channel, number of channels)
+        n_channels: total number of channels
+    """
+    band_info_set = OrderedDict((band_info, None) for band_info, _, _ in band_metas.values())
+    band_name_map, band_info_list = _map_bands(band_info_set.keys())
+    date_map, dates = _make_map(set(date for _, date, _ in band_metas.values()))
+    band_channels = {
+        band_info.name: shape[2] if len(shape) == 3 else 1
+        for band_info, _, shape in band_metas.values()
+    }
+    if band_names is None:
+        band_names = [band_info.name for band_info in band_info_list]
+
+    channels: Dict[str, Tuple[int, int]] = {}
+    n_channels = 0
+    for band_name in band_names:
+        name = band_info_list[band_name_map[band_name]].name
+        channels[name] = (n_channels, band_channels[name])
+        n_channels += band_channels[name]
+
+    locations = {
+        key: (date_map[date], *channels[band_info.name])
+        for key, (band_info, date, _) in band_metas.items()
+        if band_info.name in channels
+    }
+    return locations, dates, channels, n_channels
+
+
+def _pack_into(
+    out: np.ndarray,
+    band_metas: Dict[Any, Tuple[BandInfo, Any, Tuple[int, ...]]],
+    read_into: Callable[[Any, tuple], Optional[np.ndarray]],
+    band_names: Sequence[str] = None,
+    fill_value: float = None,
+) -> Dict[Any, np.ndarray]:
+    """Write bands into a preallocated array, in the layout of `Sample.pack_to_4d`.
+
+    Args:
+        out: array of shape (n_dates, height, width, n_channels), or (n_channels, height, width)
+            for a single date.
+        band_metas: mapping from a band key to the (band_info, date, shape) of the band.
+        read_into: called with a band key and the index of the band in `out`. Either writes the
+            band into `out[index]` and returns None, or returns the band data to copy.
+        band_names: names or alt names of the bands, in channel order.
+        fill_value: fills missing bands with this value. Defaults to None, which raises an error
+            for missing bands.
 
-        attr_dict: Dict[str, Any] = {}
-        bands_order = []
+    Returns:
+        mapping from band key to the view of its data in `out`.
 
-        if sample.label is not None:
-            if isinstance(sample.label, Band):
-                if not isinstance(sample.label.band_info, LabelType):
+    Raises:
+        ValueError if the shape of `out` doesn't match the bands, or for missing bands.
+    """
+    locations, dates, channels, n_channels = _pack_layout(band_metas, band_names)
+    shapes = {tuple(shape[:2]) for _, _, shape in band_metas.values()}
+    if len(shapes) != 1:
+        raise ValueError(f"Bands have different shapes {shapes}, resampling is not supported.")
+    height, width = shapes.pop()
+    channel_first = out.ndim == 3
+    if channel_first:
+        expected_shape: Tuple[int, ...] = (n_channels, height, width)
+        if len(dates) != 1:
+            raise ValueError(f"A (C, H, W) buffer requires a single date, got {len(dates)}.")
+    else:
+        expected_shape = (len(dates), height, width, n_channels)
+    if tuple(out.shape) != expected_shape:
+        raise ValueError(f"Expected a buffer of shape {expected_shape}, got {out.shape}.")
+
+    def band_index(date_idx, channel, n_band_channels, ndim):
+        channels_ = channel if ndim == 2 else slice(channel, channel + n_band_channels)
+        if channel_first:
+            return (channels_,)
+        return (date_idx, slice(None), slice(None), channels_)
+
+    views = {}
+    filled = set()
+    for key, (date_idx, channel, n_band_channels) in locations.items():
+        ndim = len(band_metas[key][2])
+        index = band_index(date_idx, channel, n_band_channels, ndim)
+        view = out[index]
+        if channel_first and ndim == 3:
+            view = np.moveaxis(view, 0, 2)
+        data = read_into(key, index)
+        if data is not None:
+            np.copyto(view, data, casting="unsafe")
+        views[key] = view
+        filled.add((date_idx, channel))
+
+    for date_idx in range(len(dates)):
+        for band_name, (channel, n_band_channels) in channels.items():
+            if (date_idx, channel) not in filled:
+                if fill_value is None:
                     raise ValueError(
-                        "The label is of type Band, but its band_info is not instance of Label."
+                        f"Missing band {band_name} for date {dates[date_idx]}, but fill_value is None."
                     )
-                assert sample.label.band_info.name == "label"
-                bands.append(sample.label)
-            else:
-                attr_dict["label"] = sample.label
-
-        for band in bands:
-            band_descriptor = band.get_descriptor()
-            fp.create_dataset(name=band_descriptor, data=band.data)
-            attrs = dict(
-                date=band.date,
-                date_id=band.date_id,
-                spatial_resolution=band.spatial_resolution,
-                band_info=band.band_info,
-                meta_info=band.meta_info,
-                transform=band.transform,
-                crs=band.crs,
-            )
-            bands_order.append(band_descriptor)
-            attr_dict[band_descriptor] = attrs
-
-            # h5_band.attrs["pickle"] = str(pickle.dumps(attrs))
-        attr_dict["bands_order"] = bands_order
-        fp.attrs["pickle"] = str(
-            pickle.dumps(attr_dict)
-        )  # seems to be faster to do it in a single one pickle
-    return sample_path
+                out[band_index(date_idx, channel, n_band_channels, 3)] = fill_value
+    return views
+
+
+def _read_hdf5_band(sample_path: Path, descriptor: str, index: tuple = ()) -> np.ndarray:
+    with h5py.File(sample_path, "r") as fp:
+        return np.asarray(fp[descriptor][index])
 
 
-def load_sample_hdf5(sample_path: Path, band_names=None, label_only=False):
+def load_sample_hdf5(
+    sample_path: Path,
+    band_names=None,
+    label_only=False,
+    window: Window = None,
+    lazy: bool = False,
+):
     """Load hdf5 sample.
 
+    Only the HDF5 datasets of the selected bands (and the label) are read from disk.
+
     Args:
         sample_path: path to the sample
-        band_names: list of bandnames to return from sample
+        band_names: list of bandnames to return from sample. Alt names are accepted. Defaults to
+            None, which loads all bands.
         label_only: whether or not to only return the label
+        window: (row_start, col_start, height, width) in pixels of the largest selected band. Only
+            this region is read, scaled to the shape of each band (see `Band.crop_from_ratio`),
+            and transforms are updated accordingly. Defaults to None, which reads whole bands.
+        lazy: whether to only read the header, and read the pixels of each band on first access
+            to `Band.data`. Shapes and dtypes are available without reading pixels.
 
     Returns:
         loaded sample
     """
     with h5py.File(sample_path, "r") as fp:
-        attr_dict = pickle.loads(ast.literal_eval(fp.attrs["pickle"]))
-        band_names = attr_dict.get("bands_order", fp.keys())
-        bands = []
-        label = None
-        for band_name in band_names:
-            if label_only and not band_name.startswith("label"):
-                continue
+        attr_dict = _read_header(fp.attrs)
+        if "bands_order" not in attr_dict:
+            attr_dict["bands_order"] = list(fp.keys())
+        descriptors = _sample_descriptors(attr_dict, band_names, label_only)
+
+        windows = None
+        if window is not None:
+            windows = _band_windows(window, {name: fp[name].shape for name in descriptors})
+
+        def read_band(descriptor):
+            index: tuple = ()
+            shape = fp[descriptor].shape
+            if windows is not None:
+                row_start, col_start, height, width = windows[descriptor]
+                index = (slice(row_start, row_start + height), slice(col_start, col_start + width))
+                shape = (height, width, *shape[2:])
+            if lazy:
+                loader = partial(_read_hdf5_band, sample_path, descriptor, index)
+                return LazyArray(shape, fp[descriptor].dtype, loader)
+            return np.asarray(fp[descriptor][index])  # hyperslab selection
+
+        return _build_sample(
+            attr_dict, descriptors, read_band, sample_name=sample_path.stem, windows=windows
+        )
 
-            h5_band = fp[band_name]
 
-            band = Band(data=np.array(h5_band), **attr_dict[band_name])
-            if band_name.startswith("label"):
-                label = band
-            else:
-                bands.append(band)
-        if label is None:
-            label = attr_dict["label"]
+def migrate_sample_header(sample_path: Path) -> bool:
+    """Replace the legacy pickled header of a hdf5 or npz sample by the json header.
 
-        sample = Sample(bands=bands, label=label, sample_name=sample_path.stem)
+    The band data of hdf5 files is left untouched, npz files are rewritten. For tif samples, the
+    pickled tags of each file are collected in the metadata sidecar of the sample.
+
+    Args:
+        sample_path: path to the sample
 
-        return sample
+    Returns:
+        True if the sample was migrated, False if it already had a json header or sidecar.
+    """
+    sample_path = Path(sample_path)
+    if sample_path.suffix == ".hdf5":
+        with h5py.File(sample_path, "r+") as fp:
+            if "header" in fp.attrs:
+                return False
+            fp.attrs["header"] = encode_header(_read_header(fp.attrs))
+            del fp.attrs["pickle"]
+    elif sample_path.suffix == ".npz":
+        with np.load(sample_path) as band_dict:
+            if "header" in band_dict.files:
+                return False
+            arrays = {name: band_dict[name] for name in band_dict.files if name != "pickle"}
+            arrays["header"] = encode_header(_read_header(band_dict))
+        tmp_path = sample_path.with_suffix(".tmp.npz")
+        np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, sample_path)
+    elif (sample_path / "band_index.json").exists():
+        if (sample_path / TIF_METADATA_FILE).exists():
+            return False
+        band_tags = {}
+        for file_path in sorted(sample_path.glob("*.tif")):
+            with rasterio.open(file_path) as src:
+                band_tags[file_path.name] = pickle.loads(ast.literal_eval(src.tags()["data"]))
+        tmp_path = sample_path / f"{TIF_METADATA_FILE}.tmp"
+        with open(tmp_path, "w") as fd:
+            fd.write(_encode_tif_metadata(band_tags))
+        os.replace(tmp_path, sample_path / TIF_METADATA_FILE)
+    else:
+        raise ValueError(
+            f"Can't migrate the header of {sample_path}, expected .hdf5, .npz or a tif sample."
+        )
+    return True
 
 
-def write_sample_npz(sample: Sample, dataset_dir: str):
+def write_sample_npz(sample: Sample, dataset_dir: str, compressed: bool = False):
     """Write a sample to npz.
 
     Args:
         sample: sample to write to directory
         dataset_dir: path to dataset directory
+        compressed: whether to deflate the arrays. Defaults to False, which allows to memory-map
+            the bands when loading.
 
     Return
         path to sample
     """
-    sample
     sample_path = Path(dataset_dir) / f"{sample.sample_name}.npz"
+    bands, attr_dict = _make_attr_dict(sample)
 
-    bands = sample.bands
     band_dict: Dict[str, Any] = {}
-    attr_dict: Dict[str, Any] = {}
-    bands_order = []
+    for band, band_descriptor in zip(bands, attr_dict["bands_order"]):
+        band_dict[band_descriptor] = band.data
+    band_dict["header"] = encode_header(attr_dict)  # a single header is faster to parse
+    if compressed:
+        np.savez_compressed(sample_path, **band_dict)
+    else:
+        np.savez(sample_path, **band_dict)
+    return sample_path
 
-    if sample.label is not None:
-        if isinstance(sample.label, Band):
-            if not isinstance(sample.label.band_info, LabelType):
-                raise ValueError(
-                    "The label is of type Band, but its band_info is not instance of Label."
-                )
-            assert sample.label.band_info.name == "label"
-            bands.append(sample.label)
-        else:
-            attr_dict["label"] = sample.label
 
-    for band in bands:
-        band_descriptor = band.get_descriptor()
-        band_dict[band_descriptor] = band.data
-        attrs = dict(
-            date=band.date,
-            date_id=band.date_id,
-            spatial_resolution=band.spatial_resolution,
-            band_info=band.band_info,
-            meta_info=band.meta_info,
-        )
-        bands_order.append(band_descriptor)
-        attr_dict[band_descriptor] = attrs
+def _memmap_npz_member(
+    sample_path: Path, fd, zip_info: zipfile.ZipInfo, mmap_mode: str
+) -> Optional[np.ndarray]:
+    """Memory-map an array stored uncompressed in a npz archive.
 
-        # h5_band.attrs["pickle"] = str(pickle.dumps(attrs))
-    attr_dict["bands_order"] = bands_order
-    band_dict["pickle"] = str(
-        pickle.dumps(attr_dict)
-    )  # seems to be faster to do it in a single one pickle
-    # band_dict["attr"] = attr_dict
-    np.savez(sample_path, **band_dict)
-    return sample_path
+    Args:
+        sample_path: path to the npz archive
+        fd: the archive opened in binary mode
+        zip_info: zip entry of the array
+        mmap_mode: 'r' or 'c', see np.memmap
 
+    Returns:
+        memory-mapped array, or None if the entry is compressed or holds python objects.
+    """
+    if zip_info.compress_type != zipfile.ZIP_STORED:
+        return None
+    fd.seek(zip_info.header_offset)
+    local_header = fd.read(30)  # fixed size part of the zip local file header
+    name_length, extra_length = struct.unpack("<HH", local_header[26:30])
+    fd.seek(zip_info.header_offset + 30 + name_length + extra_length)
+    version = np.lib.format.read_magic(fd)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(fd)
+    else:
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(fd)
+    if dtype.hasobject:
+        return None
+    if int(np.prod(shape)) == 0:
+        return np.empty(shape, dtype=dtype)
+    return np.memmap(
+        sample_path,
+        dtype=dtype,
+        mode=mmap_mode,
+        offset=fd.tell(),
+        shape=shape,
+        order="F" if fortran_order else "C",
+    )
 
-def load_sample_npz(sample_path: Path, band_names=None, label_only=False):
+
+def load_sample_npz(
+    sample_path: Path,
+    band_names=None,
+    label_only=False,
+    window: Window = None,
+    mmap_mode: Optional[str] = "c",
+):
     """Load a npz sample.
 
+    Only the arrays of the selected bands (and the label) are read. Bands stored uncompressed are
+    memory-mapped, so only the pages actually used are read from disk.
+
     Args:
         sample_path: path to sample
-        band_names: list of bandnames to return from sample
+        band_names: list of bandnames to return from sample. Alt names are accepted. Defaults to
+            None, which loads all bands.
         label_only: whether or not to only return the label
+        window: (row_start, col_start, height, width) in pixels of the largest selected band, see
+            `load_sample_hdf5`. Defaults to None, which returns whole bands.
+        mmap_mode: 'c' (copy-on-write) or 'r' (read-only) to memory-map uncompressed bands. None
+            reads them in memory. Defaults to 'c', bands can be modified in place as with other
+            formats, without modifying the file.
 
     Return
         loaded sample
     """
-    band_dict = np.load(sample_path, allow_pickle=True)
-    attr_dict = pickle.loads(ast.literal_eval(str(band_dict["pickle"])))
-    # attr_dict = band_dict["attr"]
+    sample_path = Path(sample_path)
+    with np.load(sample_path) as band_dict, open(sample_path, "rb") as fd:
+        attr_dict = _read_header(band_dict)
+        descriptors = _sample_descriptors(attr_dict, band_names, label_only)
+        zip_infos = {zip_info.filename: zip_info for zip_info in band_dict.zip.infolist()}
+
+        def read_array(descriptor):
+            data = None
+            if mmap_mode is not None:
+                zip_info = zip_infos[f"{descriptor}.npy"]
+                data = _memmap_npz_member(sample_path, fd, zip_info, mmap_mode)
+            if data is None:
+                data = band_dict[descriptor]
+            return data
+
+        arrays = {descriptor: read_array(descriptor) for descriptor in descriptors}
+
+    windows = None
+    if window is not None:
+        windows = _band_windows(window, {name: data.shape for name, data in arrays.items()})
+        for descriptor, (row_start, col_start, height, width) in windows.items():
+            data = arrays[descriptor]
+            arrays[descriptor] = data[row_start : row_start + height, col_start : col_start + width]
+
+    return _build_sample(
+        attr_dict, descriptors, arrays.__getitem__, sample_name=sample_path.stem, windows=windows
+    )
 
-    band_names = attr_dict["bands_order"]
-    bands = []
-    label = None
-    for band_name in band_names:
-        if label_only and band_name != "label":
-            continue
 
-        band = Band(data=band_dict[band_name], **attr_dict[band_name])
-        if band_name == "label":
-            label = band
-        else:
-            bands.append(band)
+# thread pool of each kind of task, with the pid and number of threads it was created with
+_THREAD_POOLS: Dict[Tuple[str, int], Tuple[int, ThreadPoolExecutor]] = {}
+_THREAD_POOL_LOCK = threading.Lock()
 
-    if label is None:
-        label = attr_dict.get("label", None)
 
-    return Sample(bands=bands, label=label, sample_name=sample_path.stem)
+def _get_thread_pool(n_threads: int, kind: str = "bands") -> ThreadPoolExecutor:
+    """Return the thread pool of the current process for a kind of task, created on first use.
+
+    There is one pool per number of threads, kept for the lifetime of the process, so that callers
+    asking for different sizes neither leak pools nor shut down a pool still in use. Pools are
+    recreated in forked processes, e.g., dataloader workers, since threads are not inherited.
+    Samples and bands are read by different pools, so that samples read in parallel can read
+    their bands in parallel too.
+    """
+    with _THREAD_POOL_LOCK:
+        pool = _THREAD_POOLS.get((kind, n_threads))
+        if pool is None or pool[0] != os.getpid():
+            pool = (os.getpid(), ThreadPoolExecutor(n_threads))
+            _THREAD_POOLS[(kind, n_threads)] = pool
+        return pool[1]
+
+
+def _thread_map(fn: Callable, items: Sequence, n_threads: int = None, kind: str = "bands") -> List:
+    """Apply `fn` to `items` with a thread pool, or sequentially if n_threads <= 1."""
+    if n_threads is None:
+        n_threads = config.TIF_READ_THREADS
+    if n_threads <= 1 or len(items) <= 1:
+        return [fn(item) for item in items]
+    return list(_get_thread_pool(n_threads, kind).map(fn, items))
+
+
+def _tif_shape(file_path) -> Tuple[int, int]:
+    with rasterio.open(file_path) as src:
+        return src.shape
+
 
+def _load_band_tif_args(args) -> Band:
+    # rasterio datasets are opened, read and closed in the same thread.
+    return load_band_tif(*args)
 
-def load_sample_tif(sample_dir: Path, band_names: List[str]) -> Sample:
+
+def load_samples_tif(
+    sample_dirs: Sequence[Path],
+    band_names: List[str] = None,
+    window: Window = None,
+    n_threads: int = None,
+    lazy: bool = False,
+) -> List[Sample]:
+    """Load several tif samples, decoding the bands of all samples in one batch.
+
+    rasterio releases the GIL while decoding, so with a thread pool bands are decoded concurrently.
+
+    Args:
+        sample_dirs: paths to sample directories
+        band_names: list of bandnames to return from each sample. Defaults to None, which loads all
+            bands.
+        window: (row_start, col_start, height, width) in pixels of the largest selected band of each
+            sample. See `load_sample_tif`.
+        n_threads: size of the thread pool of the process. Defaults to None, which uses
+            `config.TIF_READ_THREADS`. 0 or 1 reads bands sequentially.
+        lazy: whether to only read the file headers, and decode the pixels of each band on first
+            access to `Band.data`.
+
+    Return
+        loaded samples
+    """
+    labels = []
+    sample_files = []
+    all_tags = []
+    for sample_dir in sample_dirs:
+        sample_dir = Path(sample_dir)
+        with open(sample_dir / "band_index.json", "r") as fd:
+            band_index = OrderedDict(json.load(fd))
+
+        sample_band_names = band_index.keys() if band_names is None else band_names
+        file_names = [
+            file_name for band_name in sample_band_names for file_name in band_index[band_name]
+        ]
+
+        label = None
+        label_file = sample_dir / "label.json"
+        label_file_tif = sample_dir / "label.tif"
+        if label_file.exists():
+            with open(label_file, "r") as fd:
+                label = json.load(fd)
+        elif label_file_tif.exists():
+            file_names.append(label_file_tif.name)
+        labels.append(label)
+        sample_files.append([sample_dir / file_name for file_name in file_names])
+
+        metadata = _load_tif_metadata(sample_dir)
+        all_tags.extend(
+            [None] * len(file_names)
+            if metadata is None
+            else [metadata[file_name] for file_name in file_names]
+        )
+
+    all_files = [path for file_paths in sample_files for path in file_paths]
+    windows = [None] * len(all_files)
+    if window is not None:
+        shapes = _thread_map(_tif_shape, all_files, n_threads)
+        start = 0
+        for file_paths in sample_files:
+            stop = start + len(file_paths)
+            sample_windows = _band_windows(window, dict(enumerate(shapes[start:stop])))
+            windows[start:stop] = sample_windows.values()
+            start = stop
+    bands = _thread_map(
+        _load_band_tif_args,
+        list(zip(all_files, windows, all_tags, [lazy] * len(all_files))),
+        n_threads,
+    )
+
+    samples = []
+    start = 0
+    for sample_dir, file_paths, label in zip(sample_dirs, sample_files, labels):
+        band_list = bands[start : start + len(file_paths)]
+        start += len(file_paths)
+        if label is None and file_paths and file_paths[-1].name == "label.tif":
+            label = band_list.pop()
+        samples.append(Sample(band_list, label, sample_name=Path(sample_dir).name))
+    return samples
+
+
+def load_sample_tif(
+    sample_dir: Path,
+    band_names: List[str] = None,
+    window: Window = None,
+    n_threads: int = None,
+    lazy: bool = False,
+) -> Sample:
     """Load a tif sample.
 
     Args:
         sample_dir: path to sample directoy
-        band_names: list of bandnames to return from sample
+        band_names: list of bandnames to return from sample. Defaults to None, which loads all
+            bands.
+        window: (row_start, col_start, height, width) in pixels of the largest selected band. Only
+            this region is read, scaled to the shape of each band (see `Band.crop_from_ratio`),
+            and transforms are updated accordingly. Defaults to None, which reads whole bands.
+        n_threads: number of threads decoding bands concurrently. Defaults to None, which uses
+            `config.TIF_READ_THREADS`.
+        lazy: whether to defer decoding the pixels of each band to the first access to `Band.data`.
 
     Return
         loaded sample
     """
-    band_list = []
-    with open(sample_dir / "band_index.json", "r") as fd:
-        band_index = OrderedDict(json.load(fd))
-
-    for band_name in band_names:
-        for file_name in band_index[band_name]:
-            band_list.append(load_band_tif(Path(sample_dir, file_name)))
-
-    label_file = sample_dir / "label.json"
-    label_file_tif = sample_dir / "label.tif"
-    if label_file.exists():
-        with open(label_file, "r") as fd:
-            label = json.load(fd)
-    elif label_file_tif.exists():
-        label = load_band_tif(label_file_tif)
-    return Sample(band_list, label, sample_name=sample_dir.name)
+    return load_samples_tif(
+        [sample_dir], band_names, window=window, n_threads=n_threads, lazy=lazy
+    )[0]
 
 
-def load_sample(sample_path: Path, band_names=None, format=None) -> Sample:
+def load_sample(
+    sample_path: Path, band_names=None, format=None, window: Window = None, lazy: bool = False
+) -> Sample:
     """Create helper function to decide what sample loader to use.
 
     Args:
         sample_path: path to sample
         band_names: list of band_names
-        format: 'hdf5' or 'tif'
+        format: 'hdf5', 'tif' or 'npz'
+        window: (row_start, col_start, height, width) in pixels of the largest selected band, to
+            read only a region of each band. Defaults to None, which reads whole bands.
+        lazy: whether to only read the sample header, and decode the pixels of each band on first
+            access to `Band.data`. Uncompressed npz bands are always memory-mapped.
 
     Return:
         sample from corresponding function
@@ -1034,13 +2410,30 @@ def load_sample(sample_path: Path, band_names=None, format=None) -> Sample:
         ValueError if format is not specified correctly
     """
     if format == "tif":
-        return load_sample_tif(sample_path, band_names=band_names)
+        return load_sample_tif(sample_path, band_names=band_names, window=window, lazy=lazy)
     elif format == "hdf5":
-        return load_sample_hdf5(sample_path, band_names=band_names)
+        return load_sample_hdf5(sample_path, band_names=band_names, window=window, lazy=lazy)
+    elif format == "npz":
+        return load_sample_npz(sample_path, band_names=band_names, window=window)
     else:
         raise ValueError(f"Format not compatible, found {format}")
 
 
+def _packed_dtype(dtypes: List[np.dtype], missing: bool, fill_value: float) -> np.dtype:
+    """Return the dtype of a packed array, promoting the dtypes of the bands and the fill value."""
+    if missing and fill_value is not None:
+        dtypes = dtypes + [(np.zeros((), dtype=np.int16) + fill_value).dtype]
+    return np.result_type(*dtypes) if dtypes else np.dtype(np.int16)
+
+
+def _n_channels(band_info: BandInfo, data: Optional[np.ndarray]) -> int:
+    """Return the number of channels of a band in a packed array, from its data at any date."""
+    if data is not None:
+        return data.shape[2] if data.ndim == 3 else 1
+    # missing at all dates
+    return getattr(band_info, "n_bands", None) or 1
+
+
 def _largest_shape(band_array: np.ndarray) -> Tuple[int, ...]:
     """Extract the largest shape and the dtype from an array of bands.
 
@@ -1054,8 +2447,8 @@ def _largest_shape(band_array: np.ndarray) -> Tuple[int, ...]:
     for band in band_array.flat:
         if band is None:
             continue
-        shape[0] = max(shape[0], band.data.shape[0])
-        shape[1] = max(shape[1], band.data.shape[1])
+        shape[0] = max(shape[0], band.shape[0])
+        shape[1] = max(shape[1], band.shape[1])
 
     return tuple(shape)
 
@@ -1199,6 +2592,41 @@ class GeneratorWithLength(object):
         return self.generator
 
 
+def _iter_async(async_generator: AsyncGenerator) -> Generator:
+    """Iterate synchronously over an async generator.
+
+    The generator runs on an event loop in a background thread, which also works when the caller
+    already runs an event loop, e.g., in a notebook.
+    """
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    try:
+        while True:
+            try:
+                yield asyncio.run_coroutine_threadsafe(async_generator.__anext__(), loop).result()
+            except StopAsyncIteration:
+                break
+    finally:
+        asyncio.run_coroutine_threadsafe(async_generator.aclose(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+
+# dataset of the current worker process of `GeobenchDataset._iter_samples`
+_WORKER_DATASET: Optional["GeobenchDataset"] = None
+
+
+def _set_worker_dataset(dataset: "GeobenchDataset") -> None:
+    global _WORKER_DATASET
+    _WORKER_DATASET = dataset
+
+
+def _worker_get_sample(sample_name: str) -> Sample:
+    return _WORKER_DATASET.get_sample(sample_name)
+
+
 def _load_band_stats(dataset_dir):
     with open(dataset_dir / "band_stats.json", "r") as fd:
         all_band_stats_dict = json.load(fd)
@@ -1219,6 +2647,8 @@ class GeobenchDataset:
         split=None,
         transform: Callable[[Sample], Sample] = None,
         format="hdf5",
+        compact: bool = False,
+        cache=None,
     ) -> None:
         """Initialize new Geobench dataset.
 
@@ -1231,7 +2661,15 @@ class GeobenchDataset:
             band_names: Sequence of band names to select
             split: Specify split to use or None for all
             transform: callable for transforming a sample after loading
-            format: 'hdf5' or 'tif'
+            format: 'hdf5', 'tif', 'npz', 'shards' or 'memmap'. See geobench.shards.write_shards and
+                geobench.memmap.write_memmap for converting a dataset to these formats.
+            compact: whether to return samples as `CompactSample`, storing same-shape bands in one
+                array, e.g., to reduce the pickling cost of samples sent by DataLoader workers.
+            cache: a geobench.cache.SampleCache, or its budget in bytes, keeping the loaded samples
+                in memory before the transform, e.g., for multi-epoch training. A
+                geobench.cache.SharedSampleCache is shared by DataLoader workers and processes of
+                the node instead. Defaults to None, which reads every sample from storage. Cached
+                samples are returned as CompactSample.
         """
         self.dataset_dir = Path(dataset_dir)
         if not self.dataset_dir.exists():
@@ -1240,12 +2678,21 @@ class GeobenchDataset:
         assert format in [
             "hdf5",
             "tif",
-        ], f"Invalid file format, found {format}, choose 'tif' or 'hdf5'"
+            "npz",
+            "shards",
+            "memmap",
+        ], f"Invalid file format, found {format}, choose 'tif', 'hdf5', 'npz', 'shards' or 'memmap'"
         self.format = format
         self.transform = transform
+        self.compact = compact
+        if isinstance(cache, int):
+            # avoids circular import
+            from geobench.cache import SampleCache
+
+            cache = SampleCache(cache)
+        self.cache = cache
         self._load_partitions(partition_name)
         assert split is None or split in self.list_splits(), "Invalid split {}".format(split)
-        assert format in ["hdf5", "tif"], f"Invalid file format {format}"
 
         if band_names is None:
             band_names = [band_info.name for band_info in self.task_specs.bands_info]
@@ -1284,15 +2731,23 @@ class GeobenchDataset:
 
     #### Loading paths
     def _load_partitions(self, active_partition_name: str) -> None:
-        """Scan directory for partition files.
+        """List partition files, from the manifest if it is current, or by scanning the directory.
 
         Args:
             active_partition_name: name of active partition
         """
+        # avoids circular import
+        from geobench.manifest import manifest_is_current
+
         self._partition_path_dict = {}
-        for p in self.dataset_dir.glob("*_partition.json"):
-            partition_name = p.name.split("_partition.json")[0]
-            self._partition_path_dict[partition_name] = p
+        if manifest_is_current(self.dataset_dir):
+            for partition_name in self.manifest.partitions:
+                p = self.dataset_dir / f"{partition_name}_partition.json"
+                self._partition_path_dict[partition_name] = p
+        else:
+            for p in self.dataset_dir.glob("*_partition.json"):
+                partition_name = p.name.split("_partition.json")[0]
+                self._partition_path_dict[partition_name] = p
 
         self.set_partition(active_partition_name)
         self._sample_name_list = []
@@ -1312,6 +2767,27 @@ class GeobenchDataset:
         task.dataset_name = self.dataset_dir.name
         return task
 
+    @cached_property
+    def manifest(self):  # -> Optional[Manifest]
+        """Load the sample manifest of the dataset, or None if there is none."""
+        # avoids circular import
+        from geobench.manifest import Manifest
+
+        return Manifest.load(self.dataset_dir)
+
+    @cached_property
+    def _reader(self):  # -> ShardReader or MemmapReader
+        """Open the index of the container formats, the data files are opened on first read."""
+        # avoids circular import
+        if self.format == "shards":
+            from geobench.shards import ShardReader
+
+            return ShardReader(self.dataset_dir)
+        else:
+            from geobench.memmap import MemmapReader
+
+            return MemmapReader(self.dataset_dir)
+
     #### Splits ####
 
     def set_split(self, split):
@@ -1421,88 +2897,438 @@ class GeobenchDataset:
 
         return means, stds
 
+    def tensor_cache(self, cache_dir, **kwargs):  # -> TensorCache
+        """Return the preprocessed arrays of the active split, built once in `cache_dir`.
+
+        Args:
+            cache_dir: local directory of the caches.
+            kwargs: transform, fingerprint, resample_method, fill_value and normalize, see
+                geobench.cache.TensorCache.
+
+        Returns:
+            the cache, indexable like the dataset and returning (image, label) arrays.
+        """
+        # avoids circular import
+        from geobench.cache import TensorCache
+
+        return TensorCache(self, cache_dir, **kwargs)
+
     #### Common accessors and iterators ####
 
-    def __getitem__(self, idx: int) -> Sample:
+    def __getitem__(self, idx: Union[int, Sequence[int]]) -> Union[Sample, List[Sample]]:
         """Return item idx from active split, from active partition.
 
         Args:
-            idx: index for active split
+            idx: index for active split, or a sequence of indexes loaded with `get_batch`, e.g.,
+                by a DataLoader with a BatchSampler as sampler and batch_size=None.
+
+        Returns:
+            sample, or list of samples
+        """
+        if isinstance(idx, (list, tuple, np.ndarray)):
+            return self.get_batch(idx)
+        return self.get_sample(self.list_sample_names()[idx])
+
+    def _read_location(self, sample_name: str) -> Tuple:
+        """Return a key ordering the reads of samples by their location in storage."""
+        if self.format in ("shards", "memmap"):
+            return self._reader.location(sample_name)
+        return (sample_name,)
+
+    def get_batch(
+        self,
+        indices: Sequence[int],
+        pack: bool = False,
+        n_threads: int = None,
+        **pack_kwargs,
+    ) -> Union[List[Sample], Tuple[np.ndarray, List[Any]]]:
+        """Load a batch of samples from the active split in one call.
+
+        Reads are sorted by location in storage, i.e., by shard and offset, by memmap row or by
+        file name, so that storage sees the most sequential requests. Samples are read and decoded
+        in parallel by a thread pool and returned in the order of `indices`.
+
+        Args:
+            indices: indexes of the samples in the active split.
+            pack: whether to pack the samples, after the transform, into a single array.
+            n_threads: number of samples read concurrently. Defaults to None, which uses
+                config.BATCH_READ_THREADS.
+            pack_kwargs: passed to `Sample.pack_to_4d`, e.g., resample=True.
+
+        Returns:
+            samples, or with pack, an array of shape (batch_size, n_dates, height, width, n_bands)
+            and the label of each sample. The dtype of the array is promoted over all samples.
+
+        Raises:
+            ValueError if packing an empty batch.
+        """
+        sample_name_list = self.list_sample_names()
+        sample_names = [sample_name_list[idx] for idx in indices]
+        order = sorted(range(len(sample_names)), key=lambda i: self._read_location(sample_names[i]))
+        if n_threads is None:
+            n_threads = config.BATCH_READ_THREADS
+        loaded = _thread_map(
+            self.get_sample, [sample_names[i] for i in order], n_threads, kind="samples"
+        )
+        samples: List[Any] = [None] * len(sample_names)
+        for i, sample in zip(order, loaded):
+            samples[i] = sample
+        if not pack:
+            return samples
+        if len(samples) == 0:
+            raise ValueError("Can't pack an empty batch, its shape is unknown.")
+
+        # promote the dtypes of all samples, as np.stack would
+        dtype_kwargs = {
+            name: pack_kwargs[name]
+            for name in ("dates", "band_names", "fill_value")
+            if name in pack_kwargs
+        }
+        dtype = np.result_type(*(sample.packed_dtype(**dtype_kwargs) for sample in samples))
+        first, _, _ = samples[0].pack_to_4d(**pack_kwargs)
+        array = np.empty((len(samples),) + first.shape, dtype=dtype)
+        array[0] = first
+        for i, sample in enumerate(samples[1:], 1):
+            sample.pack_to_4d(out=array[i], **pack_kwargs)
+        return array, [sample.label for sample in samples]
+
+    def get_sample(self, sample_name: str, window: Window = None, lazy: bool = False) -> Sample:
+        """Load sample.
+
+        Args:
+            sample_name: name of sample
+            window: (row_start, col_start, height, width) in pixels of the largest band, to read
+                only a region of each band, e.g., for random crops. Defaults to None, which reads
+                whole bands.
+            lazy: whether to only read the sample header and defer reading the pixels of each band
+                to the first access to `Band.data`, e.g., to inspect band shapes and dtypes. Lazy
+                samples are never compacted nor cached.
 
         Returns:
             sample
         """
-        if self.split is None:
-            sample_name_list = self._sample_name_list
+        sample = None
+        cached = self.cache is not None and window is None and not lazy
+        if cached:
+            key = self._cache_key(sample_name)
+            sample = self.cache.get(key)
+        if sample is None:
+            sample = self.read_sample(
+                sample_name, band_names=self.band_names, window=window, lazy=lazy
+            )
+            if cached:
+                self.cache.put(key, sample)
+        if self.compact and not lazy:
+            sample = sample.compact()
+        if self.transform is not None:
+            return self.transform(sample)
         else:
-            sample_name_list = self.active_partition.partition_dict[self.split]
-        return self.get_sample(sample_name_list[idx])
+            return sample
 
-    def get_sample(self, sample_name: str) -> Sample:
-        """Load sample.
+    def _cache_key(self, sample_name: str) -> Tuple:
+        """Return the key of a sample in the cache, unique across datasets and band selections."""
+        return (str(self.dataset_dir), self.format, sample_name, tuple(self.band_names))
+
+    def read_sample(
+        self, sample_name: str, band_names=None, window: Window = None, lazy: bool = False
+    ) -> Sample:
+        """Read a sample from storage, bypassing the cache, the compaction and the transform.
 
         Args:
             sample_name: name of sample
+            band_names: names or alt names of the bands to read. Defaults to None, which reads all
+                bands.
+            window: region of each band to read, see `get_sample`.
+            lazy: whether to defer reading the pixels of each band, see `get_sample`.
 
         Returns:
             sample
         """
-        if self.format == "hdf5":
-            sample_name_ = sample_name + ".hdf5"
+        if self.format in ("shards", "memmap"):
+            return self._reader.load_sample(
+                sample_name, band_names=band_names, window=window, lazy=lazy
+            )
+        if self.format in ("hdf5", "npz"):
+            sample_name_ = f"{sample_name}.{self.format}"
         else:
             sample_name_ = sample_name
-        sample = load_sample(
-            Path(self.dataset_dir, sample_name_), band_names=self.band_names, format=self.format
+        return load_sample(
+            Path(self.dataset_dir, sample_name_),
+            band_names=band_names,
+            format=self.format,
+            window=window,
+            lazy=lazy,
         )
-        if self.transform is not None:
-            return self.transform(sample)
-        else:
+
+    def load_into(
+        self, idx: int, out: np.ndarray, band_names: Sequence[str] = None, fill_value: float = None
+    ) -> Sample:
+        """Load item idx from active split directly into a preallocated array.
+
+        Bands are written in the layout of `Sample.pack_to_4d`, or channel first for a single date,
+        and cast to the dtype of `out`. With hdf5, HDF5 reads each band straight into `out` and
+        performs the dtype conversion during the read. Other formats read each band once and copy
+        it into `out`. Bands are not resampled and the transform of the dataset is not applied.
+
+        Args:
+            idx: index for active split
+            out: array of shape (n_dates, height, width, n_channels) or (n_channels, height, width),
+                e.g., a slice of a batch array, or `tensor.numpy()` of a pinned batch tensor.
+                Direct reads require `out` to be C-contiguous.
+            band_names: names or alt names of the bands, in channel order. Defaults to None, which
+                uses the band_names of the dataset, or all bands.
+            fill_value: fills missing bands with this value. Defaults to None, which raises an error
+                for missing bands.
+
+        Returns:
+            sample whose band data are views on `out`, along with its label.
+
+        Raises:
+            ValueError if the shape of `out` doesn't match the selected bands.
+        """
+        sample_name = self.list_sample_names()[idx]
+        if band_names is None:
+            band_names = self.band_names
+
+        if self.format != "hdf5":
+            sample = self.read_sample(sample_name, band_names=band_names)
+            band_metas = {
+                i: (band.band_info, band.date, band.shape) for i, band in enumerate(sample.bands)
+            }
+            views = _pack_into(
+                out, band_metas, lambda i, index: sample.bands[i].data, band_names, fill_value
+            )
+            for i, view in views.items():
+                sample.bands[i].data = view
             return sample
 
+        with h5py.File(Path(self.dataset_dir, sample_name + ".hdf5"), "r") as fp:
+            attr_dict = _read_header(fp.attrs)
+            if "bands_order" not in attr_dict:
+                attr_dict["bands_order"] = list(fp.keys())
+            descriptors = _sample_descriptors(attr_dict, band_names)
+            band_metas = {
+                descriptor: (
+                    attr_dict[descriptor]["band_info"],
+                    attr_dict[descriptor]["date"],
+                    fp[descriptor].shape,
+                )
+                for descriptor in descriptors
+                if not descriptor.startswith("label")
+            }
+
+            def read_into(descriptor, index):
+                h5_band = fp[descriptor]
+                if out.flags.c_contiguous and out[index].shape == h5_band.shape:
+                    h5_band.read_direct(out, dest_sel=index)
+                    return None
+                return h5_band[()]
+
+            views = _pack_into(out, band_metas, read_into, band_names, fill_value)
+
+            def read_band(descriptor):
+                if descriptor in views:
+                    return views[descriptor]
+                return np.array(fp[descriptor])
+
+            return _build_sample(attr_dict, descriptors, read_band, sample_name=sample_name)
+
+    async def aget_sample(
+        self, sample_name: str, window: Window = None, executor: Executor = None
+    ) -> Sample:
+        """Load sample in an executor, without blocking the event loop.
+
+        Args:
+            sample_name: name of sample
+            window: see `get_sample`.
+            executor: executor running the blocking read and decode. Defaults to None, which uses
+                the default executor of the event loop.
+
+        Returns:
+            sample
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            executor, partial(self.get_sample, sample_name, window=window)
+        )
+
+    async def aiter(
+        self, batch_size: int = 16, indexes: Sequence[int] = None, executor: Executor = None
+    ) -> AsyncGenerator[Sample, None]:
+        """Iterate asynchronously over the active split, overlapping up to `batch_size` reads.
+
+        Samples are yielded in order, while the next reads are in flight, which hides the latency
+        of network file systems.
+
+        Args:
+            batch_size: maximum number of samples read concurrently.
+            indexes: indexes of the samples to load in the active split. Defaults to None, which
+                loads all samples in order.
+            executor: executor running the blocking reads and decodes. Defaults to None, which uses
+                a thread pool of `batch_size` threads for the duration of the iteration.
+
+        Yields:
+            samples
+        """
+        sample_name_list = self.list_sample_names()
+        if indexes is None:
+            indexes = range(len(sample_name_list))
+
+        with ExitStack() as stack:
+            if executor is None:
+                executor = stack.enter_context(ThreadPoolExecutor(batch_size))
+            pending: Deque[asyncio.Future] = deque()
+            try:
+                for idx in indexes:
+                    pending.append(
+                        asyncio.ensure_future(
+                            self.aget_sample(sample_name_list[idx], executor=executor)
+                        )
+                    )
+                    if len(pending) >= batch_size:
+                        yield await pending.popleft()
+                while pending:
+                    yield await pending.popleft()
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    def list_sample_names(self) -> List[str]:
+        """List the sample names of the active split, or of all splits, from active partition."""
+        if self.split is None:
+            return self._sample_name_list
+        return self.active_partition.partition_dict[self.split]
+
     def __len__(self) -> int:
         """Return length of active split, from active partition."""
-        if self.split is None:
-            sample_name_list = self._sample_name_list
-        else:
-            sample_name_list = self.active_partition.partition_dict[self.split]
-        return len(sample_name_list)
+        return len(self.list_sample_names())
+
+    def _iter_samples(
+        self,
+        indexes: Sequence[int],
+        prefetch: int = None,
+        num_threads: int = None,
+        processes: bool = False,
+    ) -> Generator[Sample, None, None]:
+        """Yield the samples at `indexes` of the active split, in order, loading ahead.
+
+        Args:
+            indexes: indexes of the samples in the active split.
+            prefetch: maximum number of samples loaded ahead of the consumer, i.e., submitted
+                after the sample it is processing. While it waits for the next sample, at most
+                prefetch + 1 samples are pending, including that one. Defaults to None, which loads
+                each sample when requested.
+            num_threads: number of threads, or processes, loading samples. Defaults to None, which
+                uses min(prefetch, cpu count).
+            processes: whether to load samples in a process pool rather than a thread pool, e.g.,
+                for hdf5, whose reads and decompression are serialized across threads.
+
+        Yields:
+            samples
+        """
+        sample_name_list = self.list_sample_names()
+        if not prefetch:
+            for idx in indexes:
+                yield self.get_sample(sample_name_list[idx])
+            return
 
-    def _iter_dataset(self, max_count=None) -> Generator[Sample, None, None]:
+        if num_threads is None:
+            num_threads = min(prefetch, os.cpu_count() or 1)
+        if processes:
+            executor: Executor = ProcessPoolExecutor(
+                num_threads, initializer=_set_worker_dataset, initargs=(self,)
+            )
+            load = _worker_get_sample
+        else:
+            executor = ThreadPoolExecutor(num_threads)
+            load = self.get_sample
+        with executor:
+            pending: Deque = deque()
+            try:
+                for idx in indexes:
+                    pending.append(executor.submit(load, sample_name_list[idx]))
+                    # the head of the queue is the next sample, not a sample loaded ahead
+                    if len(pending) > prefetch:
+                        yield pending.popleft().result()
+                while pending:
+                    yield pending.popleft().result()
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    def _iter_dataset(
+        self, max_count=None, concurrency=None, **prefetch_kwargs
+    ) -> Generator[Sample, None, None]:
         """Iterate over dataset.
 
         Args:
             max_count: maximum number of samples to make available.
+            concurrency: if not None, number of samples read concurrently with `aiter`, and
+                prefetch_kwargs are not given.
+            prefetch_kwargs: prefetch, num_threads and processes, see `_iter_samples`.
 
         Returns:
             index of a sample in active split
         """
         indexes = np.random.choice(len(self), size=max_count, replace=False)
-        for idx in indexes:
-            yield self[idx]
-        # if self.split is None:
-        #     sample_name_list = self._sample_name_list
-        # else:
-        #     sample_name_list = self.active_partition.partition_dict[self.split]
-        # sample_names = np.random.choice(sample_name_list, size=max_count, replace=False)
-        # for sample_name in sample_names:
-        #     yield load_sample(Path(self.dataset_dir, sample_name))
-
-    def iter_dataset(self, max_count: int = None) -> GeneratorWithLength:
+        if concurrency is not None:
+            yield from _iter_async(self.aiter(batch_size=concurrency, indexes=indexes))
+            return
+        yield from self._iter_samples(indexes, **prefetch_kwargs)
+
+    def iter_dataset(
+        self,
+        max_count: int = None,
+        concurrency: int = None,
+        prefetch: int = None,
+        num_threads: int = None,
+        processes: bool = False,
+    ) -> GeneratorWithLength:
         """Iterate over dataset.
 
+        The order of the samples only depends on the numpy random seed, with or without prefetch.
+        Samples are read ahead either with `concurrency` or with `prefetch`, `num_threads` and
+        `processes`, not both.
+
         Args:
             max_count: maximum number of samples to make available.
+            concurrency: number of samples read concurrently, see `aiter`. Defaults to None, which
+                reads samples one by one, or ahead with prefetch.
+            prefetch: maximum number of samples loaded ahead in the background while the consumer
+                works, see `_iter_samples`. Defaults to None, which loads each sample when
+                requested.
+            num_threads: number of threads, or processes, loading samples ahead. Defaults to None,
+                which uses min(prefetch, cpu count).
+            processes: whether samples are loaded ahead by processes instead of threads, e.g., to
+                decode hdf5 samples on several cores.
 
         Returns:
             generator
+
+        Raises:
+            ValueError if concurrency is given along with prefetch, num_threads or processes.
         """
+        if concurrency is not None and (prefetch or num_threads is not None or processes):
+            raise ValueError(
+                "concurrency and prefetch, num_threads or processes are exclusive, "
+                "choose either aiter or a thread or process pool to read samples ahead."
+            )
         n = len(self)
         if max_count is None:
             max_count = n
         else:
             max_count = min(n, max_count)
 
-        return GeneratorWithLength(self._iter_dataset(max_count=max_count), max_count)
+        return GeneratorWithLength(
+            self._iter_dataset(
+                max_count=max_count,
+                concurrency=concurrency,
+                prefetch=prefetch,
+                num_threads=num_threads,
+                processes=processes,
+            ),
+            max_count,
+        )
 
     #### len and printing utils ####
     def get_available_stats_str(self):
@@ -1603,7 +3429,11 @@ def compute_stats(values) -> Stats:
 
 
 def compute_dataset_statistics(
-    dataset: GeobenchDataset, n_value_per_image: int = 1000, n_samples: int = None
+    dataset: GeobenchDataset,
+    n_value_per_image: int = 1000,
+    n_samples: int = None,
+    prefetch: int = None,
+    num_threads: int = None,
 ) -> Tuple[Dict[str, "np.typing.NDArray[np.float_]"], Dict[str, Stats]]:
     """Compute statistics over an entire dataset.
 
@@ -1611,6 +3441,8 @@ def compute_dataset_statistics(
         dataset: dataset to compute statistics over
         n_value_per_image: number of values to consider per image
         n_sample: number of samples
+        prefetch: number of samples loaded ahead, see `GeobenchDataset.iter_dataset`.
+        num_threads: number of threads loading samples ahead.
 
     Returns:
         band values and computed band statistics
@@ -1621,8 +3453,8 @@ def compute_dataset_statistics(
     else:
         indices = list(range(len(dataset)))  # type: ignore
 
-    for i in tqdm(indices, desc="Extracting Statistics"):
-        sample = dataset[i]
+    samples = dataset._iter_samples(indices, prefetch=prefetch, num_threads=num_threads)
+    for sample in tqdm(samples, total=len(indices), desc="Extracting Statistics"):
 
         for band in sample.bands:
             if n_value_per_image is None:
@@ -1721,6 +3553,7 @@ def check_dataset_integrity(
     max_count: int = None,
     assert_dense: bool = True,
     rewrite_if_necessary=False,
+    prefetch: int = None,
 ) -> None:
     """Verify the intergrity, coherence and consistancy of a list of a dataset.
 
@@ -1729,6 +3562,8 @@ def check_dataset_integrity(
         sample: list of samples
         max_count: max count of samples
         assert_dense: whether or not to check that there are no None values
+        prefetch: number of samples loaded ahead when samples is None, see
+            `GeobenchDataset.iter_dataset`.
     """
 
     partition_names = dataset._partition_path_dict.keys()
@@ -1749,8 +3584,25 @@ def check_dataset_integrity(
             f"Partition names are not as expected. Found:\n {partition_names} vs:\n {epxected_partition_names}"
         )
 
-    # list directory content for all hdf5 files
-    hdf5_names = [file.stem for file in dataset.dataset_dir.glob("*.hdf5")]
+    # list all samples, and compare them to the manifest if any
+    if dataset.manifest is not None:
+        # avoids circular import
+        from geobench.manifest import _sample_name, _sample_paths
+
+        format = dataset.manifest.format
+        hdf5_names = [
+            _sample_name(path, format) for path in _sample_paths(dataset.dataset_dir, format)
+        ]
+        missing = set(dataset.manifest.sample_names) - set(hdf5_names)
+        if len(missing) > 0:
+            warn(
+                f"{len(missing)} samples of the manifest are missing, e.g., {sorted(missing)[:5]}."
+            )
+        unlisted = set(hdf5_names) - set(dataset.manifest.sample_names)
+        if len(unlisted) > 0:
+            warn(f"{len(unlisted)} samples are not in the manifest, e.g., {sorted(unlisted)[:5]}.")
+    else:
+        hdf5_names = [file.stem for file in dataset.dataset_dir.glob("*.hdf5")]
 
     for partition_name in partition_names:
         # print(f"check integrity of {partition_name}")
@@ -1759,8 +3611,20 @@ def check_dataset_integrity(
 
     task_specs = _check_task_specs(dataset, rewrite_if_necessary)
 
+    if dataset.manifest is not None:
+        # shapes of all samples are known without reading them
+        for sample_name in dataset.manifest.sample_names:
+            shapes = [
+                shape[:2]
+                for shape in dataset.manifest.band_shapes(sample_name, with_label=False).values()
+            ]
+            max_shape = np.array(shapes).max(axis=0)
+            assert np.all(
+                max_shape == task_specs.patch_size
+            ), f"{sample_name}: {max_shape} vs {task_specs.patch_size}"
+
     if samples is None:
-        samples = dataset.iter_dataset(max_count=max_count)
+        samples = dataset.iter_dataset(max_count=max_count, prefetch=prefetch)
 
     if samples is not None:
         for sample in samples:
@@ -1777,7 +3641,7 @@ def check_dataset_integrity(
                 band.band_info.assert_valid(band)
                 # if dataset.dataset_dir.name == "m-so2sat":
                 #     print("so2sat")
-                shapes.append(band.data.shape[:2])
+                shapes.append(band.shape[:2])
             max_shape = np.array(shapes).max(axis=0)
             assert np.all(
                 max_shape == task_specs.patch_size
@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+"""Convert a benchmark, or a single dataset, to another sample format.
+
+Samples are converted with a pool of processes. Partitions, task specifications, band statistics,
+label maps and the label index are copied along, and the sample manifest is rebuilt. Each sample
+is written to a temporary location and moved in place once complete, so an interrupted conversion
+resumes where it stopped. The conversion ends by comparing every converted sample with its
+source, bit for bit.
+"""
+
+import argparse
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from tqdm import tqdm
+
+from geobench import GEO_BENCH_DIR
+from geobench.dataset import Band, Sample, load_sample
+from geobench.manifest import (
+    MANIFEST_FILE,
+    SAMPLE_FORMATS,
+    _sample_name,
+    _sample_path,
+    _sample_paths,
+    build_manifest,
+    infer_format,
+)
+from geobench.memmap import MEMMAP_DIR, MemmapReader, write_memmap
+from geobench.shards import SHARDS_DIR, ShardReader, write_shards
+
+CONTAINER_FORMATS = ("shards", "memmap")
+_TMP_DIR = ".convert_tmp"
+
+
+def _copy_metadata(src_dir: Path, dst_dir: Path, sample_paths: Sequence[Path]) -> None:
+    """Copy partitions, task specifications, statistics and label maps of a dataset."""
+    sample_paths = set(sample_paths)
+    for path in src_dir.iterdir():
+        if path.is_file() and path not in sample_paths and path.name != MANIFEST_FILE:
+            shutil.copy2(path, dst_dir / path.name)
+
+
+def _convert_sample(args: Tuple[Path, str, Path, str, Dict[str, Any]]) -> None:
+    """Convert a sample, writing it in a temporary directory before moving it in place."""
+    src_path, src_format, dst_dir, format, write_kwargs = args
+    sample_name = _sample_name(src_path, src_format)
+    dst_path = _sample_path(dst_dir, sample_name, format)
+    if dst_path.exists():
+        return
+    sample = load_sample(src_path, format=src_format)
+    tmp_path = sample.write(dst_dir / _TMP_DIR, format=format, **write_kwargs)
+    os.replace(tmp_path, dst_path)
+
+
+def _band_difference(band: Band, band_: Band) -> Optional[str]:
+    if band.band_info != band_.band_info:
+        return f"band_info {band.band_info} vs {band_.band_info}"
+    if band.date != band_.date:
+        return f"date {band.date} vs {band_.date} for {band.band_info.name}"
+    data, data_ = np.asarray(band.data), np.asarray(band_.data)
+    if data.dtype != data_.dtype or not np.array_equal(data, data_):
+        return f"data of {band.band_info.name} differs ({data.dtype} vs {data_.dtype})"
+    return None
+
+
+def sample_difference(sample: Sample, sample_: Sample) -> Optional[str]:
+    """Compare two samples bit for bit.
+
+    Args:
+        sample: reference sample
+        sample_: sample to compare
+
+    Returns:
+        a description of the first difference found, or None if samples are identical.
+    """
+    if len(sample.bands) != len(sample_.bands):
+        return f"{len(sample.bands)} bands vs {len(sample_.bands)}"
+    for band, band_ in zip(sample.bands, sample_.bands):
+        difference = _band_difference(band, band_)
+        if difference is not None:
+            return difference
+    label, label_ = sample.label, sample_.label
+    if isinstance(label, Band) or isinstance(label_, Band):
+        if not (isinstance(label, Band) and isinstance(label_, Band)):
+            return "label type differs"
+        return _band_difference(label, label_)
+    if not np.array_equal(np.asarray(label), np.asarray(label_)):
+        return f"label {label} vs {label_}"
+    return None
+
+
+def _verify_sample(args: Tuple[Path, str, Path, str]) -> Optional[str]:
+    """Compare a converted sample with its source."""
+    src_path, src_format, dst_dir, format = args
+    sample_name = _sample_name(src_path, src_format)
+    sample = load_sample(src_path, format=src_format)
+    sample_ = load_sample(_sample_path(dst_dir, sample_name, format), format=format)
+    difference = sample_difference(sample, sample_)
+    if difference is not None:
+        return f"{sample_name}: {difference}"
+    return None
+
+
+def _map(fn: Callable, tasks: List, n_workers: int, desc: str) -> Iterable:
+    """Apply `fn` to `tasks` with a process pool, or in process if n_workers is 0."""
+    if n_workers == 0:
+        return [fn(task) for task in tqdm(tasks, desc=desc)]
+    with ProcessPoolExecutor(n_workers) as executor:
+        chunksize = max(1, min(64, len(tasks) // (4 * n_workers)))
+        return list(tqdm(executor.map(fn, tasks, chunksize=chunksize), total=len(tasks), desc=desc))
+
+
+def convert_dataset(
+    src_dir,
+    dst_dir,
+    format: str,
+    n_workers: int = None,
+    verify: bool = True,
+    write_kwargs: Dict[str, Any] = None,
+) -> List[str]:
+    """Convert a dataset to another format.
+
+    Args:
+        src_dir: path to the source dataset.
+        dst_dir: path to the converted dataset. Can be `src_dir` for 'shards' and 'memmap', which
+            are written next to the samples.
+        format: 'hdf5', 'npz', 'tif', 'shards' or 'memmap'.
+        n_workers: number of processes converting samples. Defaults to None, which uses the
+            number of cpus. 0 converts samples in the current process.
+        verify: whether to compare every converted sample with its source.
+        write_kwargs: passed to `Sample.write`, e.g., dict(compression="gzip") for hdf5.
+
+    Returns:
+        descriptions of the samples differing from their source, empty if all samples are identical.
+    """
+    src_dir, dst_dir = Path(src_dir), Path(dst_dir)
+    if format not in SAMPLE_FORMATS + CONTAINER_FORMATS:
+        raise ValueError(f"Unknown format {format}.")
+    if n_workers is None:
+        n_workers = os.cpu_count()
+    src_format = infer_format(src_dir)
+    src_paths = _sample_paths(src_dir, src_format)
+    dst_dir.mkdir(parents=True, exist_ok=True)
+    if src_dir.resolve() != dst_dir.resolve():
+        _copy_metadata(src_dir, dst_dir, src_paths)
+
+    if format in CONTAINER_FORMATS:
+        # containers are written sequentially, by a single writer.
+        container_dir, writer = dict(
+            shards=(SHARDS_DIR, write_shards), memmap=(MEMMAP_DIR, write_memmap)
+        )[format]
+        if not (dst_dir / container_dir / "index.json").exists():
+            writer(src_dir, src_format=src_format, output_dir=dst_dir)
+        if not verify:
+            return []
+        reader = dict(shards=ShardReader, memmap=MemmapReader)[format](dst_dir)
+        differences = []
+        for src_path in tqdm(src_paths, desc=f"Verifying {dst_dir.name}"):
+            sample_name = _sample_name(src_path, src_format)
+            if sample_name not in reader:
+                continue  # samples absent from all partitions are not packed
+            sample = load_sample(src_path, format=src_format)
+            difference = sample_difference(sample, reader.load_sample(sample_name))
+            if difference is not None:
+                differences.append(f"{sample_name}: {difference}")
+        return differences
+
+    write_kwargs = write_kwargs or {}
+    (dst_dir / _TMP_DIR).mkdir(exist_ok=True)
+    tasks = [(path, src_format, dst_dir, format, write_kwargs) for path in src_paths]
+    _map(_convert_sample, tasks, n_workers, desc=f"Converting {src_dir.name} to {format}")
+    shutil.rmtree(dst_dir / _TMP_DIR, ignore_errors=True)
+    build_manifest(dst_dir, format)
+
+    if not verify:
+        return []
+    tasks = [(path, src_format, dst_dir, format) for path in src_paths]
+    results = _map(_verify_sample, tasks, n_workers, desc=f"Verifying {dst_dir.name}")
+    return [difference for difference in results if difference is not None]
+
+
+def convert_benchmark(src_dir, dst_dir, format: str, **kwargs) -> Dict[str, List[str]]:
+    """Convert all datasets of a benchmark, see `convert_dataset`.
+
+    Args:
+        src_dir: path to the source benchmark.
+        dst_dir: path to the converted benchmark.
+        format: 'hdf5', 'npz', 'tif', 'shards' or 'memmap'.
+        kwargs: passed to `convert_dataset`.
+
+    Returns:
+        mapping from dataset name to the differences found for this dataset.
+    """
+    differences = {}
+    for dataset_dir in sorted(Path(src_dir).iterdir()):
+        if (dataset_dir / "task_specs.pkl").exists():
+            differences[dataset_dir.name] = convert_dataset(
+                dataset_dir, Path(dst_dir) / dataset_dir.name, format, **kwargs
+            )
+    return differences
+
+
+def main():
+    """Convert the benchmark or dataset given on the command line."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("src", help="benchmark or dataset directory, relative to GEO_BENCH_DIR.")
+    parser.add_argument("dst", help="output directory, relative to GEO_BENCH_DIR.")
+    parser.add_argument("--format", required=True, choices=SAMPLE_FORMATS + CONTAINER_FORMATS)
+    parser.add_argument("--workers", type=int, default=None, help="defaults to the cpu count.")
+    parser.add_argument("--no-verify", action="store_true", help="skip the final comparison.")
+    parser.add_argument("--compression", default=None, help="hdf5 compression filter.")
+    parser.add_argument("--compression-opts", type=int, default=None)
+    parser.add_argument("--shuffle", action="store_true", help="hdf5 byte shuffle filter.")
+    args = parser.parse_args()
+
+    write_kwargs = {}
+    if args.compression is not None:
+        write_kwargs = dict(
+            compression=args.compression,
+            compression_opts=args.compression_opts,
+            shuffle=args.shuffle,
+        )
+    src_dir, dst_dir = Path(GEO_BENCH_DIR, args.src), Path(GEO_BENCH_DIR, args.dst)
+    kwargs = dict(n_workers=args.workers, verify=not args.no_verify, write_kwargs=write_kwargs)
+    if (src_dir / "task_specs.pkl").exists():
+        differences = {src_dir.name: convert_dataset(src_dir, dst_dir, args.format, **kwargs)}
+    else:
+        differences = convert_benchmark(src_dir, dst_dir, args.format, **kwargs)
+
+    n_different = sum(len(dataset_differences) for dataset_differences in differences.values())
+    for dataset_name, dataset_differences in differences.items():
+        for difference in dataset_differences:
+            print(f"{dataset_name}/{difference}")
+    if n_different > 0:
+        raise SystemExit(f"{n_different} converted samples differ from their source.")
+    print(f"Converted {len(differences)} datasets to {args.format}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+"""Replace the legacy pickled headers of hdf5, npz and tif samples by versioned json headers."""
+
+import argparse
+from pathlib import Path
+
+from tqdm import tqdm
+
+from geobench import GEO_BENCH_DIR
+from geobench.dataset import migrate_sample_header
+from geobench.label_index import LABEL_INDEX_FILE
+from geobench.manifest import MANIFEST_FILE, build_manifest
+
+
+def migrate_headers(directory) -> int:
+    """Migrate all hdf5, npz and tif samples found recursively in `directory`.
+
+    Args:
+        directory: a benchmark directory, a dataset directory or GEO_BENCH_DIR itself.
+
+    Returns:
+        number of migrated samples
+    """
+    paths = [
+        path
+        for path in Path(directory).rglob("*")
+        if path.suffix in (".hdf5", ".npz") and path.name != LABEL_INDEX_FILE
+    ]
+    paths += [path.parent for path in Path(directory).rglob("band_index.json")]
+    n_migrated = 0
+    for path in tqdm(paths, desc=f"Migrating sample headers in {directory}"):
+        n_migrated += migrate_sample_header(path)
+
+    # checksums of migrated samples changed
+    if n_migrated > 0:
+        for manifest_path in Path(directory).rglob(MANIFEST_FILE):
+            build_manifest(manifest_path.parent)
+    return n_migrated
+
+
+def main():
+    """Migrate the sample headers of the directory given on the command line."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "directory",
+        nargs="?",
+        default=GEO_BENCH_DIR,
+        help="benchmark or dataset directory to migrate. Defaults to GEO_BENCH_DIR.",
+    )
+    args = parser.parse_args()
+    n_migrated = migrate_headers(args.directory)
+    print(f"Migrated {n_migrated} samples.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+"""Dataset-level label index.
+
+The label of every sample of a dataset is summarized in a single `label_index.npz` file, so that
+label maps and label statistics are computed without opening each sample:
+
+* classification: the class id of each sample, shape (n_samples,).
+* multi-label classification: the multi-hot vector of each sample, shape (n_samples, n_classes).
+* segmentation: the pixel count of each class in each sample, shape (n_samples, n_classes).
+"""
+
+import json
+import pickle
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from tqdm import tqdm
+
+from geobench.dataset import Band, load_band_tif, load_sample_hdf5, load_sample_npz
+
+LABEL_INDEX_FILE = "label_index.npz"
+
+
+def summarize_label(label: Any, n_classes: int = None) -> Tuple[str, np.ndarray]:
+    """Summarize a label for the label index.
+
+    Args:
+        label: label of a sample, a class id, a multi-hot vector or a segmentation Band.
+        n_classes: number of classes, used as minimum length of the pixel counts of segmentation.
+
+    Returns:
+        kind: 'class_id', 'multi_hot' or 'pixel_count'
+        summary: array summarizing the label
+
+    Raises:
+        ValueError for unsupported labels e.g., detection.
+    """
+    if isinstance(label, Band):
+        n_classes = getattr(label.band_info, "n_classes", n_classes) or 0
+        return "pixel_count", np.bincount(np.asarray(label.data).ravel(), minlength=n_classes)
+    if isinstance(label, (int, np.integer)):
+        return "class_id", np.array(int(label))
+    if isinstance(label, np.ndarray) and label.ndim == 1:
+        return "multi_hot", label.astype(np.int8)
+    raise ValueError(f"Can't summarize label of type {type(label)} in a label index.")
+
+
+class LabelIndex:
+    """Summary of the label of each sample of a dataset."""
+
+    def __init__(
+        self, sample_names: Sequence[str], values: np.ndarray, kind: str, n_classes: int = None
+    ) -> None:
+        """Initialize new instance of LabelIndex.
+
+        Args:
+            sample_names: name of each sample.
+            values: label summary of each sample, see `summarize_label`.
+            kind: 'class_id', 'multi_hot' or 'pixel_count'.
+            n_classes: number of classes. Defaults to None, which infers it from `values`.
+        """
+        assert len(sample_names) == len(values), f"{len(sample_names)} vs {len(values)}"
+        self.sample_names = list(sample_names)
+        self.values = values
+        self.kind = kind
+        if n_classes is None:
+            n_classes = int(values.max()) + 1 if kind == "class_id" else values.shape[1]
+        self.n_classes = n_classes
+
+    @staticmethod
+    def from_labels(labels: Dict[str, Any], n_classes: int = None) -> "LabelIndex":
+        """Create a label index from a mapping from sample name to label.
+
+        Args:
+            labels: mapping from sample name to label.
+            n_classes: number of classes.
+
+        Raises:
+            ValueError if labels are of different kinds.
+        """
+        kinds = set()
+        summaries = []
+        for label in labels.values():
+            kind, summary = summarize_label(label, n_classes)
+            kinds.add(kind)
+            summaries.append(summary)
+        if len(kinds) > 1:
+            raise ValueError(f"Labels of different kinds {kinds} can't be indexed together.")
+
+        if len(summaries) > 0 and summaries[0].ndim == 1:
+            width = max(len(summary) for summary in summaries)
+            summaries = [np.pad(summary, (0, width - len(summary))) for summary in summaries]
+        values = np.array(summaries)
+        return LabelIndex(list(labels.keys()), values, kinds.pop(), n_classes)
+
+    def save(self, dataset_dir) -> Path:
+        """Save the label index to `dataset_dir/label_index.npz`."""
+        file_path = Path(dataset_dir, LABEL_INDEX_FILE)
+        np.savez(
+            file_path,
+            sample_names=np.array(self.sample_names),
+            values=self.values,
+            kind=np.array(self.kind),
+            n_classes=np.array(self.n_classes),
+        )
+        return file_path
+
+    @staticmethod
+    def load(dataset_dir) -> Optional["LabelIndex"]:
+        """Load the label index of a dataset, or None if there is none."""
+        file_path = Path(dataset_dir, LABEL_INDEX_FILE)
+        if not file_path.exists():
+            return None
+        with np.load(file_path) as data:
+            return LabelIndex(
+                data["sample_names"].tolist(),
+                data["values"],
+                str(data["kind"]),
+                int(data["n_classes"]),
+            )
+
+    def subset(self, indices: Sequence[int]) -> "LabelIndex":
+        """Return the label index restricted to the samples at `indices`."""
+        indices = np.asarray(indices, dtype=int)
+        sample_names = [self.sample_names[i] for i in indices]
+        return LabelIndex(sample_names, self.values[indices], self.kind, self.n_classes)
+
+    def label_map(self) -> Dict[str, List[str]]:
+        """Return the mapping from class id to sample names, as stored in label_map.json.
+
+        Raises:
+            ValueError if labels are not class ids.
+        """
+        if self.kind != "class_id":
+            raise ValueError(
+                f"A label map requires class ids, but the label index has {self.kind}."
+            )
+        label_map: Dict[str, List[str]] = {}
+        for sample_name, class_id in zip(self.sample_names, self.values.tolist()):
+            label_map.setdefault(str(class_id), []).append(sample_name)
+        return label_map
+
+    def label_stats(self) -> Dict[str, List[float]]:
+        """Return the mapping from sample name to label statistics, as stored in label_stats.json.
+
+        Statistics are one-hot vectors for classification, multi-hot vectors for multi-label
+        classification and class frequencies for segmentation.
+        """
+        if self.kind == "class_id":
+            stats = np.eye(self.n_classes)[self.values]
+        elif self.kind == "pixel_count":
+            totals = self.values.sum(axis=1, keepdims=True)
+            stats = self.values / np.maximum(totals, 1)
+        else:
+            stats = self.values
+        return dict(zip(self.sample_names, stats.tolist()))
+
+
+def _load_label(sample_path: Path) -> Any:
+    """Load only the label of a hdf5, npz or tif sample."""
+    if sample_path.suffix == ".hdf5":
+        return load_sample_hdf5(sample_path, label_only=True).label
+    if sample_path.suffix == ".npz":
+        return load_sample_npz(sample_path, label_only=True).label
+    label_file = sample_path / "label.json"
+    if label_file.exists():
+        with open(label_file, "r") as fd:
+            return json.load(fd)
+    return load_band_tif(sample_path / "label.tif")
+
+
+def _sample_files(dataset_dir: Path, format: str) -> Iterator[Path]:
+    """Iterate over the hdf5 or npz sample files of a dataset."""
+    return (path for path in dataset_dir.glob(f"*.{format}") if path.name != LABEL_INDEX_FILE)
+
+
+def save_label_index(
+    dataset_dir, labels: Dict[str, Any], n_classes: int = None
+) -> Optional[LabelIndex]:
+    """Save the label index of labels collected while writing a dataset.
+
+    Args:
+        dataset_dir: path to the dataset directory.
+        labels: mapping from sample name to label.
+        n_classes: number of classes.
+
+    Returns:
+        label index, or None if the labels can't be indexed e.g., for detection.
+    """
+    try:
+        label_index = LabelIndex.from_labels(labels, n_classes=n_classes)
+    except ValueError:
+        return None
+    label_index.save(dataset_dir)
+    return label_index
+
+
+def build_label_index(dataset_dir, format: str = None) -> LabelIndex:
+    """Build the label index of a dataset by loading the label of every sample, and save it.
+
+    Args:
+        dataset_dir: path to the dataset directory.
+        format: 'hdf5', 'npz' or 'tif'. Defaults to None, which infers it from the samples.
+
+    Returns:
+        label index
+    """
+    dataset_dir = Path(dataset_dir)
+    if format is None:
+        format = "tif"
+        for format_ in ("hdf5", "npz"):
+            if next(_sample_files(dataset_dir, format_), None) is not None:
+                format = format_
+    if format in ("hdf5", "npz"):
+        sample_paths = sorted(_sample_files(dataset_dir, format))
+    else:
+        sample_paths = sorted(
+            path for path in dataset_dir.iterdir() if (path / "band_index.json").exists()
+        )
+
+    n_classes = None
+    task_specs_path = dataset_dir / "task_specs.pkl"
+    if task_specs_path.exists():
+        with open(task_specs_path, "rb") as fd:
+            n_classes = getattr(pickle.load(fd).label_type, "n_classes", None)
+
+    labels = {}
+    for sample_path in tqdm(sample_paths, desc=f"Indexing labels of {dataset_dir.name}"):
+        labels[sample_path.stem if format != "tif" else sample_path.name] = _load_label(sample_path)
+
+    label_index = LabelIndex.from_labels(labels, n_classes=n_classes)
+    label_index.save(dataset_dir)
+    return label_index
@@ -0,0 +1,327 @@
+"""Dataset-level sample manifest.
+
+The facts that are otherwise rediscovered by listing the dataset directory and opening samples
+are collected once in a single `manifest.json` file:
+
+* the format of the samples and the names of the partitions.
+* for each sample: file name, size in bytes, crc32 checksum, band layout, dates and label summary.
+
+Band layouts, i.e., the descriptor, shape and dtype of each band (and label band), are stored
+once and referenced by each sample, since all samples of a dataset typically share the same
+layout. Metadata queries are then answered from one file read, instead of globbing the dataset
+directory. The manifest is stale once files are added to, removed from or renamed in the dataset
+directory, see `manifest_is_current`, and GeobenchDataset then lists partitions from the directory.
+"""
+
+import argparse
+import json
+import os
+import zlib
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from tqdm import tqdm
+
+from geobench import GEO_BENCH_DIR
+from geobench.dataset import Band, _from_json, _to_json, load_sample
+from geobench.label_index import LABEL_INDEX_FILE, summarize_label
+
+MANIFEST_FILE = "manifest.json"
+MANIFEST_VERSION = 1
+SAMPLE_FORMATS = ("hdf5", "npz", "tif")
+
+# (descriptor, shape, dtype) of each band of a sample
+BandLayout = List[Tuple[str, Tuple[int, ...], str]]
+
+
+def infer_format(dataset_dir) -> str:
+    """Infer the format of the samples of a dataset, 'hdf5', 'npz' or 'tif'.
+
+    Raises:
+        ValueError if no sample is found.
+    """
+    for format in SAMPLE_FORMATS:
+        if len(_sample_paths(Path(dataset_dir), format)) > 0:
+            return format
+    raise ValueError(f"No hdf5, npz or tif sample found in {dataset_dir}.")
+
+
+def _sample_paths(dataset_dir: Path, format: str) -> List[Path]:
+    """List the samples of a dataset in a given format."""
+    if format == "tif":
+        return sorted(path.parent for path in dataset_dir.glob("*/band_index.json"))
+    return sorted(path for path in dataset_dir.glob(f"*.{format}") if path.name != LABEL_INDEX_FILE)
+
+
+def _sample_path(dataset_dir: Path, sample_name: str, format: str) -> Path:
+    if format == "tif":
+        return dataset_dir / sample_name
+    return dataset_dir / f"{sample_name}.{format}"
+
+
+def _sample_name(sample_path: Path, format: str) -> str:
+    return sample_path.name if format == "tif" else sample_path.stem
+
+
+def _list_partitions(dataset_dir: Path) -> List[str]:
+    return sorted(
+        path.name[: -len("_partition.json")] for path in dataset_dir.glob("*_partition.json")
+    )
+
+
+def manifest_is_current(dataset_dir) -> bool:
+    """Check that a dataset has a manifest, and no file was added, removed or renamed since.
+
+    The modification time of a directory changes with its entries, so a directory more recent than
+    its manifest has changed since. Changes in the same clock tick as the save are not noticed.
+    """
+    try:
+        manifest_mtime = os.stat(Path(dataset_dir, MANIFEST_FILE)).st_mtime_ns
+    except FileNotFoundError:
+        return False
+    return os.stat(dataset_dir).st_mtime_ns <= manifest_mtime
+
+
+def file_checksum(sample_path: Path) -> Tuple[int, str]:
+    """Return the size in bytes and the crc32 checksum of a sample file or tif directory."""
+    paths = sorted(sample_path.iterdir()) if sample_path.is_dir() else [sample_path]
+    size = 0
+    crc = 0
+    for path in paths:
+        with open(path, "rb") as fd:
+            while True:
+                chunk = fd.read(1 << 20)
+                if not chunk:
+                    break
+                crc = zlib.crc32(chunk, crc)
+                size += len(chunk)
+    return size, f"{crc:08x}"
+
+
+def describe_sample(sample_path: Path, format: str) -> Tuple[BandLayout, Dict[str, Any]]:
+    """Describe a sample for the manifest, reading band headers and the label only.
+
+    Args:
+        sample_path: path to the sample.
+        format: 'hdf5', 'npz' or 'tif'.
+
+    Returns:
+        layout: descriptor, shape and dtype of each band, followed by the label band if any.
+        entry: file name, size, checksum, dates and label summary of the sample.
+    """
+    sample = load_sample(sample_path, format=format, lazy=True)
+    bands: List[Band] = list(sample.bands)
+    if isinstance(sample.label, Band):
+        bands.append(sample.label)
+    layout = [
+        (band.get_descriptor(), tuple(int(n) for n in band.shape), np.dtype(band.dtype).str)
+        for band in bands
+    ]
+    try:
+        label = summarize_label(sample.label)[1].tolist()
+    except ValueError:
+        label = None  # e.g., detection
+    size, crc32 = file_checksum(sample_path)
+    entry = dict(
+        file=sample_path.name,
+        size=size,
+        crc32=crc32,
+        dates=[band.date for band in sample.bands],
+        label=label,
+    )
+    return layout, entry
+
+
+class Manifest:
+    """Metadata of the samples of a dataset, see module documentation."""
+
+    def __init__(
+        self,
+        format: str,
+        partitions: List[str],
+        layouts: List[BandLayout],
+        samples: Dict[str, Dict[str, Any]],
+    ) -> None:
+        """Initialize new instance of Manifest.
+
+        Args:
+            format: format of the samples, 'hdf5', 'npz' or 'tif'.
+            partitions: names of the partitions of the dataset.
+            layouts: distinct band layouts of the samples.
+            samples: mapping from sample name to its entry, see `describe_sample`. The entry refers
+                to the index of its band layout in `layouts` with the 'layout' key.
+        """
+        self.format = format
+        self.partitions = list(partitions)
+        self.layouts = layouts
+        self.samples = samples
+
+    @staticmethod
+    def from_samples(
+        format: str,
+        partitions: List[str],
+        descriptions: Dict[str, Tuple[BandLayout, Dict[str, Any]]],
+    ) -> "Manifest":
+        """Create a manifest from the descriptions of samples.
+
+        Args:
+            format: format of the samples, 'hdf5', 'npz' or 'tif'.
+            partitions: names of the partitions of the dataset.
+            descriptions: mapping from sample name to the output of `describe_sample`.
+        """
+        layouts: List[BandLayout] = []
+        layout_ids: Dict[Tuple, int] = {}
+        samples = {}
+        for sample_name, (layout, entry) in descriptions.items():
+            key = tuple(layout)
+            if key not in layout_ids:
+                layout_ids[key] = len(layouts)
+                layouts.append(list(layout))
+            samples[sample_name] = dict(entry, layout=layout_ids[key])
+        return Manifest(format, partitions, layouts, samples)
+
+    @property
+    def sample_names(self) -> List[str]:
+        """Return the names of all samples."""
+        return list(self.samples.keys())
+
+    def __contains__(self, sample_name: str) -> bool:
+        """Check if a sample is in the manifest."""
+        return sample_name in self.samples
+
+    def __len__(self) -> int:
+        """Return the number of samples."""
+        return len(self.samples)
+
+    def sample_path(self, dataset_dir, sample_name: str) -> Path:
+        """Return the path to the file, or tif directory, of a sample."""
+        return Path(dataset_dir, self.samples[sample_name]["file"])
+
+    def band_layout(self, sample_name: str) -> BandLayout:
+        """Return the descriptor, shape and dtype of each band of a sample, label band included."""
+        return self.layouts[self.samples[sample_name]["layout"]]
+
+    def band_shapes(self, sample_name: str, with_label: bool = True) -> Dict[str, Tuple[int, ...]]:
+        """Return the mapping from band descriptor to band shape of a sample.
+
+        Args:
+            sample_name: name of the sample.
+            with_label: whether to include the label band, for segmentation.
+        """
+        layout = self.band_layout(sample_name)
+        if not with_label:
+            layout = layout[: len(self.dates(sample_name))]
+        return {descriptor: shape for descriptor, shape, _ in layout}
+
+    def largest_shape(self, sample_name: str) -> Tuple[int, int]:
+        """Return the height and width of the largest band of a sample, including label."""
+        shapes = [shape[:2] for _, shape, _ in self.band_layout(sample_name)]
+        return tuple(int(size) for size in np.max(shapes, axis=0))
+
+    def dates(self, sample_name: str) -> List[Any]:
+        """Return the date of each band of a sample, excluding the label."""
+        return self.samples[sample_name]["dates"]
+
+    def label_summary(self, sample_name: str) -> Optional[List]:
+        """Return the label summary of a sample, see `geobench.label_index.summarize_label`."""
+        return self.samples[sample_name]["label"]
+
+    def verify_sample(self, dataset_dir, sample_name: str) -> bool:
+        """Check that the size and checksum of a sample match the manifest."""
+        entry = self.samples[sample_name]
+        size, crc32 = file_checksum(self.sample_path(dataset_dir, sample_name))
+        return size == entry["size"] and crc32 == entry["crc32"]
+
+    def save(self, dataset_dir) -> Path:
+        """Save the manifest to `dataset_dir/manifest.json`, atomically."""
+        file_path = Path(dataset_dir, MANIFEST_FILE)
+        manifest = dict(
+            version=MANIFEST_VERSION,
+            format=self.format,
+            partitions=self.partitions,
+            layouts=[
+                [[descriptor, list(shape), dtype] for descriptor, shape, dtype in layout]
+                for layout in self.layouts
+            ],
+            samples=_to_json(self.samples),
+        )
+        tmp_path = file_path.with_suffix(".tmp")
+        with open(tmp_path, "w") as fd:
+            json.dump(manifest, fd, separators=(",", ":"))
+        os.replace(tmp_path, file_path)
+        # the rename updated the directory, the manifest must not look older, see manifest_is_current
+        os.utime(file_path)
+        return file_path
+
+    @staticmethod
+    def load(dataset_dir) -> Optional["Manifest"]:
+        """Load the manifest of a dataset, or None if there is none."""
+        file_path = Path(dataset_dir, MANIFEST_FILE)
+        if not file_path.exists():
+            return None
+        with open(file_path, "r") as fd:
+            manifest = json.load(fd, object_hook=_from_json)
+        if manifest.get("version") != MANIFEST_VERSION:
+            raise ValueError(f"Unsupported manifest version {manifest.get('version')}.")
+        layouts = [
+            [(descriptor, tuple(shape), dtype) for descriptor, shape, dtype in layout]
+            for layout in manifest["layouts"]
+        ]
+        return Manifest(manifest["format"], manifest["partitions"], layouts, manifest["samples"])
+
+
+def build_manifest(dataset_dir, format: str = None) -> Manifest:
+    """Build the manifest of a dataset by reading the header and label of every sample, and save it.
+
+    Args:
+        dataset_dir: path to the dataset directory.
+        format: 'hdf5', 'npz' or 'tif'. Defaults to None, which infers it from the samples.
+
+    Returns:
+        manifest
+    """
+    dataset_dir = Path(dataset_dir)
+    if format is None:
+        format = infer_format(dataset_dir)
+    descriptions = {}
+    for sample_path in tqdm(
+        _sample_paths(dataset_dir, format), desc=f"Indexing samples of {dataset_dir.name}"
+    ):
+        descriptions[_sample_name(sample_path, format)] = describe_sample(sample_path, format)
+    manifest = Manifest.from_samples(format, _list_partitions(dataset_dir), descriptions)
+    manifest.save(dataset_dir)
+    return manifest
+
+
+def build_benchmark_manifests(directory) -> List[Path]:
+    """Build the manifest of every dataset found recursively in `directory`.
+
+    Args:
+        directory: a benchmark directory, a dataset directory or GEO_BENCH_DIR itself.
+
+    Returns:
+        paths to the dataset directories
+    """
+    dataset_dirs = sorted(path.parent for path in Path(directory).rglob("task_specs.pkl"))
+    for dataset_dir in dataset_dirs:
+        build_manifest(dataset_dir)
+    return dataset_dirs
+
+
+def main():
+    """Build the sample manifests of the directory given on the command line."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "directory",
+        nargs="?",
+        default=GEO_BENCH_DIR,
+        help="benchmark or dataset directory to index. Defaults to GEO_BENCH_DIR.",
+    )
+    args = parser.parse_args()
+    dataset_dirs = build_benchmark_manifests(args.directory)
+    print(f"Built the manifest of {len(dataset_dirs)} datasets.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""Memory-mapped container format.
+
+Each split of a dataset is stored as one `.npy` array per band group, of shape
+(n_samples, n_channels, *band_shape), where a group collects the bands sharing the same shape and
+dtype, e.g., (N, C, H, W) for 2d bands. Each loaded sample maps its own rows in copy-on-write
+mode: the data of the loaded bands are views on the page cache, shared by all workers and jobs
+reading the dataset on a node, and pages are only copied when a transform writes to them. Writes
+stay private to the loaded sample, like with the npz format.
+
+All samples must have the same band layout, which is typically the case for small benchmarks
+such as m-eurosat or m-so2sat.
+
+Layout inside the dataset directory::
+
+    memmap/
+        index.json
+        train_group_00.npy
+        train_group_01.npy
+        valid_group_00.npy
+        ...
+"""
+
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+from tqdm import tqdm
+
+from geobench.dataset import (
+    Band,
+    GeobenchDataset,
+    Sample,
+    Window,
+    _band_windows,
+    _build_sample,
+    _make_attr_dict,
+    _sample_descriptors,
+    decode_header,
+    encode_header,
+)
+from geobench.label_index import save_label_index
+from geobench.shards import _n_classes, _samples_by_split
+
+MEMMAP_DIR = "memmap"
+MEMMAP_INDEX_VERSION = 1
+
+
+def _group_file_name(split: str, group_id: int) -> str:
+    return f"{split}_group_{group_id:02d}.npy"
+
+
+class MemmapReader:
+    """Read samples as views on the memory-mapped arrays of a dataset."""
+
+    def __init__(self, dataset_dir) -> None:
+        """Initialize new instance of MemmapReader.
+
+        Args:
+            dataset_dir: the path containing the memmap directory of the dataset.
+        """
+        self.memmap_dir = Path(dataset_dir) / MEMMAP_DIR
+        with open(self.memmap_dir / "index.json", "r") as fd:
+            index = json.load(fd)
+        if index.get("version") != MEMMAP_INDEX_VERSION:
+            raise ValueError(f"Unsupported memmap index version {index.get('version')}.")
+        self.groups: List[Dict[str, Any]] = index["groups"]
+        self.slots: List[Tuple[int, int]] = [tuple(slot) for slot in index["slots"]]
+        self.samples: Dict[str, Dict[str, Any]] = index["samples"]
+        self._headers: Dict[Tuple[str, int], Tuple[int, Tuple[int, ...], np.dtype]] = {}
+
+    def __contains__(self, sample_name: str) -> bool:
+        """Check if a sample is in the memory-mapped arrays."""
+        return sample_name in self.samples
+
+    def location(self, sample_name: str) -> Tuple[str, int]:
+        """Return the split and row of a sample, to sort reads."""
+        entry = self.samples[sample_name]
+        return entry["split"], entry["row"]
+
+    def _get_header(self, split: str, group_id: int) -> Tuple[int, Tuple[int, ...], np.dtype]:
+        """Return the data offset, shape and dtype of the array of a group, read on first access."""
+        key = (split, group_id)
+        header = self._headers.get(key)
+        if header is None:
+            with open(self.memmap_dir / _group_file_name(split, group_id), "rb") as fd:
+                version = np.lib.format.read_magic(fd)
+                if version == (1, 0):
+                    shape, _, dtype = np.lib.format.read_array_header_1_0(fd)
+                else:
+                    shape, _, dtype = np.lib.format.read_array_header_2_0(fd)
+                header = (fd.tell(), shape, dtype)
+            self._headers[key] = header
+        return header
+
+    def _map_row(self, split: str, group_id: int, row: int) -> np.memmap:
+        """Memory-map the row of a group in copy-on-write mode, in a mapping of its own."""
+        offset, shape, dtype = self._get_header(split, group_id)
+        row_shape = tuple(shape[1:])
+        row_size = int(np.prod(row_shape)) * dtype.itemsize
+        return np.memmap(
+            self.memmap_dir / _group_file_name(split, group_id),
+            dtype=dtype,
+            mode="c",
+            offset=offset + row * row_size,
+            shape=row_shape,
+        )
+
+    def load_sample(
+        self,
+        sample_name: str,
+        band_names=None,
+        label_only=False,
+        window: Window = None,
+        lazy: bool = False,
+    ) -> Sample:
+        """Load a sample whose band data are views on its own copy-on-write mapping of the arrays.
+
+        Args:
+            sample_name: name of the sample
+            band_names: list of bandnames to return from sample. Alt names are accepted. Defaults to
+                None, which loads all bands.
+            label_only: whether or not to only return the label
+            window: (row_start, col_start, height, width) in pixels of the largest selected band.
+                Defaults to None, which returns whole bands.
+            lazy: ignored, views on the memory-mapped arrays are only read when accessed.
+
+        Returns:
+            loaded sample
+        """
+        entry = self.samples[sample_name]
+        attr_dict = decode_header(entry["header"])
+        descriptors = _sample_descriptors(attr_dict, band_names, label_only)
+        slot_ids = {descriptor: i for i, descriptor in enumerate(attr_dict["bands_order"])}
+        split, row = entry["split"], entry["row"]
+        windows = None
+        if window is not None:
+            shapes = {
+                name: self.groups[self.slots[slot_ids[name]][0]]["band_shape"]
+                for name in descriptors
+            }
+            windows = _band_windows(window, shapes)
+
+        rows: Dict[int, np.memmap] = {}
+
+        def read_band(descriptor):
+            group_id, channel = self.slots[slot_ids[descriptor]]
+            if group_id not in rows:
+                rows[group_id] = self._map_row(split, group_id, row)
+            data = rows[group_id][channel]
+            if windows is not None:
+                row_start, col_start, height, width = windows[descriptor]
+                data = data[row_start : row_start + height, col_start : col_start + width]
+            return data
+
+        return _build_sample(attr_dict, descriptors, read_band, sample_name, windows=windows)
+
+
+def _make_layout(bands: List[Band]) -> Tuple[List[Dict[str, Any]], List[Tuple[int, int]]]:
+    """Group bands by shape and dtype and return the groups and the (group_id, channel) of each band."""
+    groups: List[Dict[str, Any]] = []
+    group_ids: Dict[Tuple[Tuple[int, ...], str], int] = {}
+    slots = []
+    for band in bands:
+        key = (tuple(band.data.shape), np.dtype(band.data.dtype).str)
+        if key not in group_ids:
+            group_ids[key] = len(groups)
+            groups.append(dict(band_shape=list(key[0]), dtype=key[1], n_channels=0))
+        group = groups[group_ids[key]]
+        slots.append((group_ids[key], group["n_channels"]))
+        group["n_channels"] += 1
+    return groups, slots
+
+
+def write_memmap(
+    dataset_dir, partition_name: str = "default", src_format: str = "hdf5", output_dir=None
+) -> Path:
+    """Write the samples of a dataset to memory-mappable arrays, stored in `dataset_dir/memmap`.
+
+    Rows are grouped by split of `partition_name`. Samples appearing only in other partitions are
+    stored in an additional 'other' split. The original samples are left untouched. The label index
+    of the dataset is written along the way.
+
+    Args:
+        dataset_dir: path to the dataset directory.
+        partition_name: partition defining the grouping of samples into splits.
+        src_format: format of the samples to read, 'hdf5', 'npz' or 'tif'.
+        output_dir: directory in which to write the memmap directory and the label index. Defaults
+            to None, which uses `dataset_dir`.
+
+    Returns:
+        path to the memmap index
+
+    Raises:
+        ValueError if samples don't all have the same band layout.
+    """
+    dataset = GeobenchDataset(dataset_dir, partition_name=partition_name, format=src_format)
+    output_dir = dataset.dataset_dir if output_dir is None else Path(output_dir)
+    memmap_dir = output_dir / MEMMAP_DIR
+    memmap_dir.mkdir(parents=True, exist_ok=True)
+
+    groups = None
+    slots = None
+    samples: Dict[str, Dict[str, Any]] = {}
+    labels = {}
+    for split, sample_names in _samples_by_split(dataset).items():
+        arrays = None
+        for row, sample_name in enumerate(
+            tqdm(sample_names, desc=f"Mapping {split} of {dataset_dir}")
+        ):
+            sample = dataset.get_sample(sample_name)
+            bands, attr_dict = _make_attr_dict(sample)
+            layout = _make_layout(bands)
+            if groups is None:
+                groups, slots = layout
+            elif layout != (groups, slots):
+                raise ValueError(
+                    f"Sample {sample_name} has a different band layout than the first sample, "
+                    "the memmap format requires all samples to have the same band shapes and dtypes."
+                )
+
+            if arrays is None:
+                arrays = [
+                    np.lib.format.open_memmap(
+                        memmap_dir / _group_file_name(split, group_id),
+                        mode="w+",
+                        dtype=group["dtype"],
+                        shape=(len(sample_names), group["n_channels"], *group["band_shape"]),
+                    )
+                    for group_id, group in enumerate(groups)
+                ]
+
+            for band, (group_id, channel) in zip(bands, slots):
+                arrays[group_id][row, channel] = band.data
+            samples[sample_name] = dict(split=split, row=row, header=encode_header(attr_dict))
+            labels[sample_name] = sample.label
+
+        if arrays is not None:
+            for array in arrays:
+                array.flush()
+
+    save_label_index(output_dir, labels, _n_classes(dataset))
+    index = dict(version=MEMMAP_INDEX_VERSION, groups=groups, slots=slots, samples=samples)
+    index_path = memmap_dir / "index.json"
+    tmp_path = index_path.with_suffix(".tmp")
+    with open(tmp_path, "w") as fd:
+        json.dump(index, fd)
+    os.replace(tmp_path, index_path)
+    return index_path
@@ -0,0 +1,193 @@
+"""Separable resampling of bands with cached interpolation plans.
+
+Bands of different spatial resolutions are resampled to a common shape by `Sample.pack_to_4d`.
+Each interpolation method is separable: an output row (resp. column) is a weighted sum of a few
+input rows (resp. columns). The indices and weights of these taps only depend on the input size,
+the output size and the method, so they are computed once per (src_shape, dst_shape, method) and
+cached. Bands sharing a shape are stacked and resampled in a single call.
+
+Pixel centers are aligned, i.e., output pixel i covers input coordinates
+[i * scale, (i + 1) * scale) with scale = src_size / dst_size, and borders are replicated.
+
+Methods:
+* nearest: one tap per output pixel, a plain gather.
+* bilinear: two taps.
+* bicubic: four taps, Keys cubic convolution with a = -0.5.
+* area: average of the input pixels covered by the output pixel, weighted by overlap. This is the
+  method of choice for downsampling.
+"""
+
+from functools import lru_cache
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+METHODS = ("nearest", "bilinear", "bicubic", "area")
+
+# resampling methods matching the spline orders of scipy.ndimage.zoom
+ORDER_TO_METHOD = {0: "nearest", 1: "bilinear", 3: "bicubic"}
+
+
+def _cubic_weights(t: np.ndarray, a: float = -0.5) -> np.ndarray:
+    """Return the weights of the 4 taps at offsets -1, 0, 1, 2 for fractional positions `t`."""
+    distances = np.abs(t[:, None] - np.arange(-1, 3)[None, :])
+    near = ((a + 2) * distances - (a + 3)) * distances**2 + 1
+    far = ((a * distances - 5 * a) * distances + 8 * a) * distances - 4 * a
+    return np.where(distances <= 1, near, np.where(distances < 2, far, 0.0))
+
+
+def _area_taps(src_size: int, dst_size: int) -> Tuple[np.ndarray, np.ndarray]:
+    scale = src_size / dst_size
+    n_taps = int(np.ceil(scale)) + 1
+    starts = np.arange(dst_size) * scale
+    first = np.floor(starts).astype(np.int64)
+    indices = first[:, None] + np.arange(n_taps)[None, :]
+    # overlap of [start, start + scale) with each input pixel [j, j + 1)
+    overlap = np.minimum(indices + 1, starts[:, None] + scale) - np.maximum(
+        indices, starts[:, None]
+    )
+    weights = np.clip(overlap, 0, None) / scale
+    return np.minimum(indices, src_size - 1), weights
+
+
+@lru_cache(maxsize=256)
+def axis_taps(src_size: int, dst_size: int, method: str) -> Tuple[np.ndarray, np.ndarray]:
+    """Compute the taps resampling an axis of `src_size` pixels to `dst_size` pixels.
+
+    Args:
+        src_size: number of input pixels.
+        dst_size: number of output pixels.
+        method: 'nearest', 'bilinear', 'bicubic' or 'area'.
+
+    Returns:
+        indices: input pixel of each tap, shape (dst_size, n_taps).
+        weights: weight of each tap, shape (dst_size, n_taps). Rows sum to 1.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown resampling method {method}, choose one of {METHODS}.")
+    scale = src_size / dst_size
+    if method == "area":
+        indices, weights = _area_taps(src_size, dst_size)
+    else:
+        # input coordinate of each output pixel center
+        coords = (np.arange(dst_size) + 0.5) * scale - 0.5
+        if method == "nearest":
+            indices = np.floor((np.arange(dst_size) + 0.5) * scale).astype(np.int64)[:, None]
+            weights = np.ones((dst_size, 1))
+        elif method == "bilinear":
+            coords = np.clip(coords, 0, src_size - 1)
+            first = np.floor(coords).astype(np.int64)
+            t = coords - first
+            indices = first[:, None] + np.arange(2)[None, :]
+            weights = np.stack((1 - t, t), axis=1)
+        else:
+            first = np.floor(coords).astype(np.int64)
+            indices = first[:, None] + np.arange(-1, 3)[None, :]
+            weights = _cubic_weights(coords - first)
+    indices = np.clip(indices, 0, src_size - 1)
+    for array in (indices, weights):
+        array.flags.writeable = False  # shared by all callers through the cache
+    return indices, weights
+
+
+def _resample_axis(data: np.ndarray, taps: Tuple[np.ndarray, np.ndarray], axis: int) -> np.ndarray:
+    indices, weights = taps
+    if indices.shape[1] == 1:
+        return np.take(data, indices[:, 0], axis=axis)
+    shape = [1] * data.ndim
+    shape[axis] = -1
+    out = np.take(data, indices[:, 0], axis=axis) * weights[:, 0].reshape(shape)
+    for k in range(1, indices.shape[1]):
+        out += np.take(data, indices[:, k], axis=axis) * weights[:, k].reshape(shape)
+    return out
+
+
+class ResamplePlan:
+    """Resample arrays of shape (height, width, ...) from `src_shape` to `dst_shape`."""
+
+    def __init__(self, src_shape: Tuple[int, int], dst_shape: Tuple[int, int], method: str) -> None:
+        """Initialize new instance of ResamplePlan.
+
+        Args:
+            src_shape: (height, width) of the input arrays.
+            dst_shape: (height, width) of the output arrays.
+            method: 'nearest', 'bilinear', 'bicubic' or 'area'.
+        """
+        self.src_shape = tuple(src_shape)
+        self.dst_shape = tuple(dst_shape)
+        self.method = method
+        self.row_taps = axis_taps(self.src_shape[0], self.dst_shape[0], method)
+        self.col_taps = axis_taps(self.src_shape[1], self.dst_shape[1], method)
+
+    def __call__(self, data: np.ndarray) -> np.ndarray:
+        """Resample the first two axes of `data`, keeping its dtype.
+
+        Integer outputs are rounded and clipped to the range of the dtype.
+        """
+        if tuple(data.shape[:2]) != self.src_shape:
+            raise ValueError(f"Expected an array of shape {self.src_shape}, got {data.shape}.")
+        if self.method == "nearest":
+            return data[self.row_taps[0][:, 0]][:, self.col_taps[0][:, 0]]
+
+        work = data.astype(np.promote_types(data.dtype, np.float32), copy=False)
+        # resample the axis reducing the size first
+        axes = [(0, self.row_taps), (1, self.col_taps)]
+        if self.dst_shape[1] * self.src_shape[0] < self.dst_shape[0] * self.src_shape[1]:
+            axes.reverse()
+        for axis, taps in axes:
+            work = _resample_axis(work, taps, axis)
+
+        if np.issubdtype(data.dtype, np.integer):
+            info = np.iinfo(data.dtype)
+            work = np.clip(np.rint(work), info.min, info.max)
+        return work.astype(data.dtype, copy=False)
+
+
+@lru_cache(maxsize=256)
+def get_plan(src_shape: Tuple[int, int], dst_shape: Tuple[int, int], method: str) -> ResamplePlan:
+    """Return the cached resampling plan from `src_shape` to `dst_shape`."""
+    return ResamplePlan(src_shape, dst_shape, method)
+
+
+def resample(data: np.ndarray, shape: Sequence[int], method: str = "bilinear") -> np.ndarray:
+    """Resample an array of shape (height, width, ...) to `shape` (height, width).
+
+    Args:
+        data: array to resample.
+        shape: output (height, width).
+        method: 'nearest', 'bilinear', 'bicubic' or 'area'.
+
+    Returns:
+        resampled array, with the dtype of data.
+    """
+    src_shape = tuple(int(size) for size in data.shape[:2])
+    return get_plan(src_shape, tuple(int(size) for size in shape), method)(data)
+
+
+def resample_batch(
+    arrays: Sequence[np.ndarray], shape: Sequence[int], method: str = "bilinear"
+) -> List[np.ndarray]:
+    """Resample arrays of shape (height, width) or (height, width, channels) to `shape`.
+
+    Arrays sharing a shape and a dtype are stacked along channels and resampled in one call.
+
+    Args:
+        arrays: arrays to resample.
+        shape: output (height, width).
+        method: 'nearest', 'bilinear', 'bicubic' or 'area'.
+
+    Returns:
+        resampled arrays, in the order of `arrays`.
+    """
+    groups: Dict[Tuple, List[int]] = {}
+    for i, data in enumerate(arrays):
+        groups.setdefault((data.shape[:2], data.dtype), []).append(i)
+
+    results: List[np.ndarray] = [None] * len(arrays)  # type: ignore
+    for indices in groups.values():
+        stacked = [arrays[i] if arrays[i].ndim == 3 else arrays[i][:, :, None] for i in indices]
+        channels = np.cumsum([0] + [data.shape[2] for data in stacked])
+        out = resample(np.concatenate(stacked, axis=2), shape, method)
+        for i, start, stop in zip(indices, channels[:-1], channels[1:]):
+            results[i] = out[:, :, start:stop] if arrays[i].ndim == 3 else out[:, :, start]
+    return results
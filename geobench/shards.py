@@ -0,0 +1,330 @@
+"""Sharded container format.
+
+The samples of a dataset are packed into a few large binary files (shards) next to an index
+mapping each sample name to its shard, its header and the byte range of each band. A shard is
+opened once per process and bands are read with positional reads, which avoids one file open and
+one metadata lookup per sample on network file systems.
+
+Layout inside the dataset directory::
+
+    shards/
+        index.json
+        train-00000.bin
+        train-00001.bin
+        valid-00000.bin
+        ...
+"""
+
+import json
+import os
+import threading
+from collections import defaultdict
+from functools import partial
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from tqdm import tqdm
+
+from geobench.dataset import (
+    GeobenchDataset,
+    LazyArray,
+    Sample,
+    Window,
+    _band_windows,
+    _build_sample,
+    _make_attr_dict,
+    _sample_descriptors,
+    decode_header,
+    encode_header,
+)
+from geobench.label_index import save_label_index
+
+SHARDS_DIR = "shards"
+SHARD_INDEX_VERSION = 1
+
+# offset alignment of bands in a shard, in bytes.
+_ALIGNMENT = 64
+
+
+class ShardReader:
+    """Read samples from the shards of a dataset."""
+
+    def __init__(self, dataset_dir) -> None:
+        """Initialize new instance of ShardReader.
+
+        Args:
+            dataset_dir: the path containing the shards directory of the dataset.
+        """
+        self.shards_dir = Path(dataset_dir) / SHARDS_DIR
+        with open(self.shards_dir / "index.json", "r") as fd:
+            index = json.load(fd)
+        if index.get("version") != SHARD_INDEX_VERSION:
+            raise ValueError(f"Unsupported shard index version {index.get('version')}.")
+        self.shard_names: List[str] = index["shards"]
+        self.samples: Dict[str, Dict[str, Any]] = index["samples"]
+        self._init_handles()
+
+    def _init_handles(self) -> None:
+        # reads are positional, so descriptors inherited by forked workers can safely be shared.
+        self._fds: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        """Drop the file descriptors, they are reopened lazily by the new process."""
+        state = self.__dict__.copy()
+        for key in ("_fds", "_lock"):
+            del state[key]
+        return state
+
+    def __setstate__(self, state):
+        """Restore state and reset file descriptors."""
+        self.__dict__.update(state)
+        self._init_handles()
+
+    def _get_fd(self, shard_id: int) -> int:
+        """Return the file descriptor of a shard, opening it once per process."""
+        fd = self._fds.get(shard_id)
+        if fd is None:
+            with self._lock:
+                fd = self._fds.get(shard_id)
+                if fd is None:
+                    fd = os.open(self.shards_dir / self.shard_names[shard_id], os.O_RDONLY)
+                    self._fds[shard_id] = fd
+        return fd
+
+    def _read_band(
+        self, fd: int, offset: int, dtype: str, shape: Sequence[int], window: Window = None
+    ) -> np.ndarray:
+        """Read a band from a shard directly into a new array.
+
+        With a window, only the rows of the window are read.
+        """
+        if window is not None:
+            row_start, col_start, height, width = window
+            assert 0 <= row_start and row_start + height <= shape[0], f"{window} for {shape}."
+            assert 0 <= col_start and col_start + width <= shape[1], f"{window} for {shape}."
+            offset += row_start * int(np.prod(shape[1:])) * np.dtype(dtype).itemsize
+            rows = self._read_band(fd, offset, dtype, (height, *shape[1:]))
+            return rows[:, col_start : col_start + width]
+
+        data = np.empty(shape, dtype=dtype)
+        buffer = memoryview(data).cast("B")
+        while len(buffer) > 0:
+            n_read = os.preadv(fd, [buffer], offset)
+            if n_read == 0:
+                raise EOFError(f"Unexpected end of shard in {self.shards_dir}.")
+            buffer = buffer[n_read:]
+            offset += n_read
+        return data
+
+    def _load_band(
+        self, shard_id: int, offset: int, dtype: str, shape: Sequence[int], window: Window = None
+    ) -> np.ndarray:
+        """Read a band of a shard, reopening the shard if it was closed since."""
+        return self._read_band(self._get_fd(shard_id), offset, dtype, shape, window=window)
+
+    def __contains__(self, sample_name: str) -> bool:
+        """Check if a sample is in the shards."""
+        return sample_name in self.samples
+
+    def location(self, sample_name: str) -> Tuple[int, int]:
+        """Return the shard and offset of the first band of a sample, to sort reads."""
+        entry = self.samples[sample_name]
+        return entry["shard"], min(offset for offset, _, _ in entry["bands"].values())
+
+    def close(self) -> None:
+        """Close all open shards."""
+        for fd in self._fds.values():
+            os.close(fd)
+        self._fds.clear()
+
+    def load_sample(
+        self,
+        sample_name: str,
+        band_names=None,
+        label_only=False,
+        window: Window = None,
+        lazy: bool = False,
+    ) -> Sample:
+        """Load a sample from the shards.
+
+        Args:
+            sample_name: name of the sample
+            band_names: list of bandnames to return from sample. Alt names are accepted. Defaults to
+                None, which loads all bands.
+            label_only: whether or not to only return the label
+            window: (row_start, col_start, height, width) in pixels of the largest selected band.
+                Defaults to None, which reads whole bands.
+            lazy: whether to defer reading each band to the first access to `Band.data`.
+
+        Returns:
+            loaded sample
+        """
+        entry = self.samples[sample_name]
+        attr_dict = decode_header(entry["header"])
+        descriptors = _sample_descriptors(attr_dict, band_names, label_only)
+        shard_id = entry["shard"]
+        band_locations = entry["bands"]
+        windows = None
+        if window is not None:
+            shapes = {name: band_locations[name][2] for name in descriptors}
+            windows = _band_windows(window, shapes)
+
+        def read_band(descriptor):
+            offset, dtype, shape = band_locations[descriptor]
+            band_window = None if windows is None else windows[descriptor]
+            if lazy:
+                loader = partial(self._load_band, shard_id, offset, dtype, shape, band_window)
+                if band_window is not None:
+                    shape = (band_window[2], band_window[3], *shape[2:])
+                return LazyArray(shape, dtype, loader)
+            return self._load_band(shard_id, offset, dtype, shape, window=band_window)
+
+        return _build_sample(attr_dict, descriptors, read_band, sample_name, windows=windows)
+
+
+class _ShardWriter:
+    """Append bands to shard files, starting a new shard when `max_shard_size` is reached."""
+
+    def __init__(self, shards_dir: Path, max_shard_size: int) -> None:
+        self.shards_dir = shards_dir
+        self.max_shard_size = max_shard_size
+        self.shard_names: List[str] = []
+        self.samples: Dict[str, Dict[str, Any]] = {}
+        self._fd = None
+        self._prefix = None
+        self._shard_counts: Dict[str, int] = defaultdict(int)
+
+    def _open(self, prefix: str) -> None:
+        self.close()
+        self._prefix = prefix
+        shard_name = f"{prefix}-{self._shard_counts[prefix]:05d}.bin"
+        self._shard_counts[prefix] += 1
+        self.shard_names.append(shard_name)
+        self._fd = open(self.shards_dir / shard_name, "wb")
+
+    def close(self) -> None:
+        if self._fd is not None:
+            self._fd.close()
+            self._fd = None
+
+    def write(self, sample: Sample, prefix: str) -> None:
+        bands, attr_dict = _make_attr_dict(sample)
+        if self._fd is None or prefix != self._prefix or self._fd.tell() >= self.max_shard_size:
+            self._open(prefix)
+
+        band_locations = {}
+        for band, descriptor in zip(bands, attr_dict["bands_order"]):
+            data = np.ascontiguousarray(band.data)
+            if data.dtype.hasobject:
+                raise ValueError(f"Band {descriptor} of {sample.sample_name} has dtype object.")
+            offset = self._fd.tell()
+            padding = -offset % _ALIGNMENT
+            if padding:
+                self._fd.write(b"\0" * padding)
+                offset += padding
+            self._fd.write(data.tobytes())
+            band_locations[descriptor] = [offset, data.dtype.str, list(data.shape)]
+
+        self.samples[sample.sample_name] = dict(
+            shard=len(self.shard_names) - 1,
+            header=encode_header(attr_dict),
+            bands=band_locations,
+        )
+
+    def write_index(self) -> Path:
+        self.close()
+        index = dict(version=SHARD_INDEX_VERSION, shards=self.shard_names, samples=self.samples)
+        index_path = self.shards_dir / "index.json"
+        tmp_path = index_path.with_suffix(".tmp")
+        with open(tmp_path, "w") as fd:
+            json.dump(index, fd)
+        os.replace(tmp_path, index_path)
+        return index_path
+
+
+def _samples_by_split(dataset: GeobenchDataset) -> Dict[str, List[str]]:
+    """Group all samples of all partitions by their split in the active partition of `dataset`.
+
+    Samples absent from the active partition are grouped under 'other'.
+    """
+    split_samples = {
+        split: list(sample_names)
+        for split, sample_names in dataset.active_partition.partition_dict.items()
+    }
+    seen = set(name for sample_names in split_samples.values() for name in sample_names)
+    others = []
+    for name in dataset.list_partitions():
+        for sample_names in dataset.load_partition(name).partition_dict.values():
+            for sample_name in sample_names:
+                if sample_name not in seen:
+                    seen.add(sample_name)
+                    others.append(sample_name)
+    if others:
+        split_samples["other"] = others
+    return split_samples
+
+
+def _n_classes(dataset: GeobenchDataset) -> Optional[int]:
+    """Return the number of classes of the label type of a dataset, if any."""
+    if not (dataset.dataset_dir / "task_specs.pkl").exists():
+        return None
+    return getattr(dataset.task_specs.label_type, "n_classes", None)
+
+
+def write_shards(
+    dataset_dir,
+    partition_name: str = "default",
+    src_format: str = "hdf5",
+    max_shard_size: int = 2**30,
+    output_dir=None,
+) -> Path:
+    """Pack the samples of a dataset into shards, stored in `dataset_dir/shards`.
+
+    Samples are grouped by split of `partition_name` so that a split is read from contiguous
+    shards. Samples appearing only in other partitions are packed last. The original samples are
+    left untouched. The label index of the dataset is written along the way.
+
+    Args:
+        dataset_dir: path to the dataset directory.
+        partition_name: partition defining the grouping of samples into shards.
+        src_format: format of the samples to read, 'hdf5', 'npz' or 'tif'.
+        max_shard_size: a new shard is started once a shard reaches this number of bytes.
+        output_dir: directory in which to write the shards directory and the label index. Defaults
+            to None, which uses `dataset_dir`.
+
+    Returns:
+        path to the shard index
+    """
+    dataset = GeobenchDataset(dataset_dir, partition_name=partition_name, format=src_format)
+    split_samples = _samples_by_split(dataset)
+
+    output_dir = dataset.dataset_dir if output_dir is None else Path(output_dir)
+    shards_dir = output_dir / SHARDS_DIR
+    shards_dir.mkdir(parents=True, exist_ok=True)
+    writer = _ShardWriter(shards_dir, max_shard_size=max_shard_size)
+    labels = {}
+    try:
+        for split, sample_names in split_samples.items():
+            for sample_name in tqdm(sample_names, desc=f"Sharding {split} of {dataset_dir}"):
+                if sample_name not in writer.samples:
+                    sample = dataset.get_sample(sample_name)
+                    writer.write(sample, prefix=split)
+                    labels[sample_name] = sample.label
+    finally:
+        writer.close()
+    save_label_index(output_dir, labels, _n_classes(dataset))
+    return writer.write_index()
+
+
+def write_benchmark_shards(benchmark_dir, **kwargs) -> None:
+    """Pack the samples of all datasets of a benchmark into shards, see `write_shards`.
+
+    Args:
+        benchmark_dir: path to the benchmark directory.
+        kwargs: passed to `write_shards`.
+    """
+    for dataset_dir in sorted(Path(benchmark_dir).iterdir()):
+        if (dataset_dir / "task_specs.pkl").exists():
+            write_shards(dataset_dir, **kwargs)
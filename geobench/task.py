@@ -10,6 +10,7 @@ import numpy as np
 
 from geobench import GEO_BENCH_DIR
 from geobench.dataset import GeobenchDataset, Sample, _load_band_stats
+from geobench.label_index import LabelIndex
 
 
 class TaskSpecifications:
@@ -78,6 +79,7 @@ class TaskSpecifications:
         transform=None,
         band_names: Sequence[str] = ("red", "green", "blue"),
         format: str = "hdf5",
+        cache=None,
     ) -> GeobenchDataset:
         """Retrieve dataset for a given split and partition with chosen transform, format and bands.
 
@@ -85,8 +87,9 @@ class TaskSpecifications:
             split: dataset split to choose
             partition_name: name of partition, i.e. 'default' for default_partition.json
             transform: callable for transforming a sample after loading
-            file_format: 'hdf5' or 'tif'
+            format: 'hdf5', 'tif', 'npz', 'shards' or 'memmap'
             band_names: band names to select from dataset
+            cache: sample cache, see GeobenchDataset.
         """
         return GeobenchDataset(
             dataset_dir=self.get_dataset_dir(),
@@ -95,12 +98,21 @@ class TaskSpecifications:
             transform=transform,
             format=format,
             band_names=band_names,
+            cache=cache,
         )
 
     def get_dataset_dir(self) -> Path:
         """Retrieve directory where dataset is read."""
         return GEO_BENCH_DIR / self.benchmark_name / self.dataset_name
 
+    def get_label_index(self) -> Union[None, LabelIndex]:
+        """Retrieve the label index, a summary of the label of each sample.
+
+        Returns:
+            label index if present or None
+        """
+        return LabelIndex.load(self.get_dataset_dir())
+
     def get_label_map(self) -> Union[None, Dict[str, List[str]]]:
         """Retriebe the label map, a dictionary defining labels to input paths.
 
@@ -108,9 +120,14 @@ class TaskSpecifications:
             benchmark_dir: benchmark directory from which to retrieve dataset
 
 
+        The label index is used when present, otherwise the label map is read from label_map.json.
+
         Returns:
             label map if present or None
         """
+        label_index = self.get_label_index()
+        if label_index is not None and label_index.kind == "class_id":
+            return label_index.label_map()
         label_map_path = self.get_dataset_dir() / "label_map.json"
         if label_map_path.exists():
             with open(label_map_path, "r") as fp:
@@ -122,9 +139,14 @@ class TaskSpecifications:
     def label_stats(self, benchmark_dir: str = None) -> Union[None, Dict[str, List[Any]]]:
         """Retriebe the label stats, a dictionary defining labels to statistics.
 
+        The label index is used when present, otherwise the label stats are read from label_stats.json.
+
         Returns:
             label stats if present or None
         """
+        label_index = self.get_label_index()
+        if label_index is not None:
+            return label_index.label_stats()
         label_stats_path = self.get_dataset_dir() / "label_stats.json"
         if label_stats_path.exists():
             with open(label_stats_path, "r") as fp:
@@ -148,6 +170,10 @@ class TaskSpecifications:
         eval_transform=None,
         collate_fn=None,
         band_names: Sequence[str] = ("red", "green", "blue"),
+        tensor_output: bool = False,
+        pin_memory: bool = False,
+        cache=None,
+        batched_reads: bool = False,
     ):
         """return pytorch data module for this dataset."""
 
@@ -164,6 +190,10 @@ class TaskSpecifications:
             eval_transform=eval_transform,
             collate_fn=collate_fn,
             band_names=band_names,
+            tensor_output=tensor_output,
+            pin_memory=pin_memory,
+            cache=cache,
+            batched_reads=batched_reads,
         )
         return data_module
 
@@ -177,13 +207,13 @@ class TaskSpecifications:
         for sample in samples:
             if bands_info is None:
                 bands_info = [band.band_info for band in sample.bands]
-                shapes = [band.data.shape for band in sample.bands]
+                shapes = [band.shape for band in sample.bands]
             else:
                 assert len(bands_info) == len(sample.bands)
                 for i, band_info in enumerate(bands_info):
                     assert band_info == sample.bands[i].band_info
                 for i, shape in enumerate(shapes):
-                    assert shape == sample.bands[i].data.shape
+                    assert shape == sample.bands[i].shape
 
         resolutions = [band_info.spatial_resolution for band_info in bands_info]
 
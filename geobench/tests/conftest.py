@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+import rasterio
+
+import geobench as gb
+
+
+def write_dataset(dataset_dir, n_samples=5, multi_resolution=False):
+    """Write a small hdf5 dataset with a segmentation label and 2 partitions.
+
+    Bands and label are 8x8, except with `multi_resolution` where band_2 is 4x4 at 20m.
+    """
+    transform = rasterio.transform.from_bounds(1, 2, 3, 3, 4, 5)
+    bands_info = [gb.SpectralBand(f"band_{i}", (f"alt_{i}",), 10, 0.1 * i) for i in range(3)]
+    shapes = [(8, 8), (8, 8), (8, 8)]
+    if multi_resolution:
+        bands_info[2].spatial_resolution = 20
+        shapes[2] = (4, 4)
+    label_info = gb.SegmentationClasses("label", spatial_resolution=10, n_classes=3)
+    samples = []
+    partition = gb.Partition()
+    for i in range(n_samples):
+        bands = [
+            gb.Band(
+                np.random.randint(1, 100, shape).astype(np.int16),
+                band_info,
+                band_info.spatial_resolution,
+                transform=transform * rasterio.Affine.scale(8 // shape[0]),
+            )
+            for band_info, shape in zip(bands_info, shapes)
+        ]
+        label = gb.Band(np.random.randint(3, size=(8, 8)), label_info, 10)
+        sample = gb.Sample(bands, label, f"sample_{i}")
+        sample.write(dataset_dir)
+        samples.append(sample)
+        partition.add(("train", "valid", "test")[i % 3], sample.sample_name)
+    partition.save(dataset_dir, "default")
+    gb.Partition({"train": ["sample_0"], "valid": [], "test": []}).save(dataset_dir, "small")
+    task_specs = gb.TaskSpecifications(
+        dataset_name="test",
+        benchmark_name="test_bench",
+        patch_size=(8, 8),
+        spatial_resolution=10,
+        bands_info=bands_info,
+        label_type=label_info,
+    )
+    task_specs.save(dataset_dir, overwrite=True)
+    return samples
+
+
+@pytest.fixture
+def dataset_dir(tmp_path):
+    """Empty directory for a dataset, see the samples fixture."""
+    dataset_dir = tmp_path / "dataset"
+    dataset_dir.mkdir()
+    return str(dataset_dir)
+
+
+@pytest.fixture
+def samples(request, dataset_dir):
+    """Samples of the dataset written in dataset_dir by write_dataset.
+
+    Arguments of write_dataset are given by indirect parametrization, e.g.
+    `@pytest.mark.parametrize("samples", [dict(multi_resolution=True)], indirect=True)`.
+    """
+    return write_dataset(dataset_dir, **getattr(request, "param", {}))
@@ -0,0 +1,127 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+import geobench as gb
+from geobench.dataset import _get_thread_pool
+from geobench.shards import write_shards
+
+
+@pytest.mark.parametrize("samples", [dict(n_samples=7)], indirect=True)
+def test_aget_sample_and_aiter(dataset_dir, samples):
+    dataset = gb.GeobenchDataset(dataset_dir, partition_name="default")
+
+    async def load():
+        sample = await dataset.aget_sample("sample_3")
+        loaded = [sample async for sample in dataset.aiter(batch_size=3)]
+        return sample, loaded
+
+    sample, loaded = asyncio.run(load())
+
+    np.testing.assert_array_equal(sample.bands[0].data, samples[3].bands[0].data)
+    # samples are yielded in the order of the split.
+    assert [sample.sample_name for sample in loaded] == dataset._sample_name_list
+    for sample_ in loaded:
+        expected = samples[int(sample_.sample_name.split("_")[1])]
+        np.testing.assert_array_equal(sample_.label.data, expected.label.data)
+
+
+@pytest.mark.parametrize("samples", [dict(n_samples=7)], indirect=True)
+def test_iter_dataset_concurrency(dataset_dir, samples):
+    dataset = gb.GeobenchDataset(dataset_dir, partition_name="default")
+
+    np.random.seed(0)
+    sequential = [sample.sample_name for sample in dataset.iter_dataset(max_count=5)]
+    np.random.seed(0)
+    iterator = dataset.iter_dataset(max_count=5, concurrency=2)
+    assert len(iterator) == 5
+    concurrent = [sample.sample_name for sample in iterator]
+    assert concurrent == sequential
+
+    # stopping early closes the iteration
+    for i, _ in enumerate(dataset.iter_dataset(concurrency=4)):
+        if i == 1:
+            break
+
+
+@pytest.mark.parametrize("format", ["hdf5", "shards"])
+@pytest.mark.parametrize("samples", [dict(n_samples=7)], indirect=True)
+def test_get_batch(format, dataset_dir, samples):
+    # the last sample of the batch has a float band
+    samples[5].bands[2].data = samples[5].bands[2].data.astype(np.float32)
+    samples[5].write(dataset_dir)
+    if format == "shards":
+        write_shards(dataset_dir, max_shard_size=500)
+    dataset = gb.GeobenchDataset(dataset_dir, partition_name="default", format=format)
+
+    indices = [5, 0, 3, 6]
+    batch = dataset.get_batch(indices, n_threads=3)
+    assert [sample.sample_name for sample in batch] == [
+        dataset._sample_name_list[idx] for idx in indices
+    ]
+    for sample in batch:
+        expected = samples[int(sample.sample_name.split("_")[1])]
+        np.testing.assert_array_equal(sample.bands[0].data, expected.bands[0].data)
+    assert [sample.sample_name for sample in dataset[indices]] == [
+        sample.sample_name for sample in batch
+    ]
+
+    array, labels = dataset.get_batch(indices, pack=True, band_names=("band_2", "alt_0"))
+    assert array.shape == (4, 1, 8, 8, 2)
+    for packed, sample, label in zip(array, batch, labels):
+        np.testing.assert_array_equal(packed, sample.pack_to_4d(band_names=("band_2", "alt_0"))[0])
+        np.testing.assert_array_equal(label.data, sample.label.data)
+    assert dataset._sample_name_list[indices[-1]] == "sample_5"
+    assert array.dtype == np.float32
+
+    assert dataset.get_batch([]) == []
+    with pytest.raises(ValueError):
+        dataset.get_batch([], pack=True)
+
+
+@pytest.mark.parametrize("processes", [False, True])
+@pytest.mark.parametrize("samples", [dict(n_samples=7)], indirect=True)
+def test_iter_dataset_prefetch(processes, dataset_dir, samples):
+    dataset = gb.GeobenchDataset(dataset_dir, partition_name="default")
+
+    np.random.seed(0)
+    sequential = [sample.sample_name for sample in dataset.iter_dataset(max_count=6)]
+    np.random.seed(0)
+    iterator = dataset.iter_dataset(max_count=6, prefetch=3, num_threads=2, processes=processes)
+    assert len(iterator) == 6
+    prefetched = list(iterator)
+    assert [sample.sample_name for sample in prefetched] == sequential
+    for sample in prefetched:
+        expected = samples[int(sample.sample_name.split("_")[1])]
+        np.testing.assert_array_equal(sample.bands[0].data, expected.bands[0].data)
+
+    # stopping early cancels the pending reads
+    for i, _ in enumerate(dataset.iter_dataset(prefetch=4, processes=processes)):
+        if i == 1:
+            break
+
+    if not processes:
+        # at most prefetch samples are loaded ahead of the sample being processed
+        get_sample, loaded = dataset.get_sample, []
+
+        def counted_get_sample(sample_name):
+            loaded.append(sample_name)
+            return get_sample(sample_name)
+
+        dataset.get_sample = counted_get_sample
+        for i, _ in enumerate(dataset.iter_dataset(prefetch=2, num_threads=1), 1):
+            assert len(loaded) - i <= 2
+
+    # aiter and the thread or process pool are exclusive ways of reading ahead
+    with pytest.raises(ValueError):
+        dataset.iter_dataset(concurrency=2, prefetch=2, processes=processes)
+
+
+def test_thread_pools_per_size():
+    pool_2 = _get_thread_pool(2, kind="test")
+    pool_3 = _get_thread_pool(3, kind="test")
+    assert pool_3 is not pool_2
+    # asking for another size neither replaces nor shuts down the first pool
+    assert _get_thread_pool(2, kind="test") is pool_2
+    assert list(pool_2.map(abs, [-1, -2])) == [1, 2]
@@ -0,0 +1,127 @@
+import multiprocessing
+import pickle
+
+import numpy as np
+import pytest
+
+import geobench as gb
+from geobench.cache import SampleCache, SharedSampleCache, sample_nbytes
+
+
+def test_sample_cache(dataset_dir, samples):
+    nbytes = sample_nbytes(samples[0])
+    dataset = gb.GeobenchDataset(dataset_dir, cache=2 * nbytes)
+
+    for sample in samples[:2]:
+        dataset.get_sample(sample.sample_name)
+    assert dataset.cache.stats()["misses"] == 2
+
+    # hits return a copy, modifying it leaves the cache unchanged
+    sample_ = dataset.get_sample("sample_0")
+    assert isinstance(sample_, gb.CompactSample)
+    sample_.bands[0].data[:] = -1
+    sample_.label.data[:] = -1
+    sample_ = dataset.get_sample("sample_0")
+    for band, band_ in zip(samples[0].bands, sample_.bands):
+        np.testing.assert_array_equal(band.data, band_.data)
+    np.testing.assert_array_equal(samples[0].label.data, sample_.label.data)
+
+    # sample_1 is the least recently used
+    dataset.get_sample("sample_2")
+    stats = dataset.cache.stats()
+    assert (stats["hits"], stats["misses"], stats["evictions"]) == (2, 3, 1)
+    assert stats["nbytes"] == 2 * nbytes
+    dataset.get_sample("sample_0")
+    dataset.get_sample("sample_1")
+    assert dataset.cache.hits == 3
+
+    # windowed reads bypass the cache, pickled caches are empty
+    dataset.get_sample("sample_0", window=(0, 0, 4, 4))
+    assert dataset.cache.hits + dataset.cache.misses == 7
+    assert len(pickle.loads(pickle.dumps(dataset)).cache) == 0
+
+    cache = SampleCache(nbytes - 1)
+    assert not cache.put("sample_0", samples[0])
+    assert len(cache) == 0
+
+
+def _fill_cache(dataset, sample_names):
+    for sample_name in sample_names:
+        dataset.get_sample(sample_name)
+
+
+def test_shared_sample_cache(tmp_path, dataset_dir, samples):
+    cache_dir = str(tmp_path / "cache")
+    cache = SharedSampleCache(cache_dir, max_bytes=3 * sample_nbytes(samples[0]))
+    dataset = gb.GeobenchDataset(dataset_dir, cache=cache)
+
+    # samples cached by another process are read from the arena
+    process = multiprocessing.get_context("spawn").Process(
+        target=_fill_cache, args=(dataset, ["sample_0", "sample_1"])
+    )
+    process.start()
+    process.join()
+    assert process.exitcode == 0
+    assert len(cache) == 2
+    sample_ = dataset.get_sample("sample_0")
+    assert cache.hits == 1
+    for band, band_ in zip(samples[0].bands, sample_.bands):
+        np.testing.assert_array_equal(band.data, band_.data)
+
+    # samples are copied out of the arena, other readers are not affected
+    sample_.bands[0].data[:] = -1
+    sample_ = pickle.loads(pickle.dumps(cache)).get(dataset._cache_key("sample_0"))
+    np.testing.assert_array_equal(samples[0].bands[0].data, sample_.bands[0].data)
+
+    # the oldest samples are evicted, and overwritten without affecting returned samples
+    _fill_cache(dataset, ["sample_2", "sample_3"])
+    assert cache.evictions > 0
+    assert dataset._cache_key("sample_0") not in cache
+    _fill_cache(dataset, ["sample_4", "sample_0", "sample_1"])
+    np.testing.assert_array_equal(samples[0].bands[0].data, sample_.bands[0].data)
+
+    # a sample evicted while it is copied is a miss, not a torn sample
+    read = cache._read
+
+    def read_and_evict(offset, nbytes):
+        data = read(offset, nbytes)
+        _fill_cache(dataset, ["sample_2", "sample_3", "sample_4"])
+        return data
+
+    key = dataset._cache_key("sample_1")
+    assert key in cache
+    cache._read = read_and_evict
+    assert cache.get(key) is None
+    assert key not in cache
+    with pytest.raises(ValueError):
+        SharedSampleCache(cache_dir, max_bytes=10)
+
+
+def _flip(sample):
+    for band in sample.bands:
+        band.data = band.data[::-1]
+    return sample
+
+
+def test_tensor_cache(tmp_path, dataset_dir, samples):
+    cache_dir = str(tmp_path / "cache")
+    dataset = gb.GeobenchDataset(dataset_dir, split="train", band_names=("alt_2", "alt_0"))
+    cache = dataset.tensor_cache(cache_dir, transform=_flip, fingerprint="flip")
+    assert cache.built
+    assert len(cache) == len(dataset)
+    image, label = cache[1]
+    sample = samples[int(dataset.list_sample_names()[1].split("_")[1])]
+    assert image.shape == (2, 8, 8) and image.dtype == np.float32
+    np.testing.assert_array_equal(image[0], sample.bands[2].data[::-1])
+    np.testing.assert_array_equal(label, sample.label.data)
+
+    # reopened without preprocessing, other settings get their own arrays
+    assert not dataset.tensor_cache(cache_dir, transform=_flip, fingerprint="flip").built
+    assert dataset.tensor_cache(cache_dir).directory != cache.directory
+    with pytest.raises(ValueError):
+        dataset.tensor_cache(cache_dir, transform=_flip)
+
+    # rewriting a sample invalidates the arrays
+    sample.write(dataset_dir)
+    cache_ = dataset.tensor_cache(cache_dir, transform=_flip, fingerprint="flip")
+    assert cache_.built and cache_.directory == cache.directory
@@ -0,0 +1,46 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+import geobench as gb
+from geobench.geobench_convert import convert_dataset, sample_difference
+
+
+@pytest.mark.parametrize("format", ["npz", "shards", "memmap"])
+def test_convert_dataset(format, tmp_path, dataset_dir, samples):
+    dst_dir = str(tmp_path / "dst")
+    assert convert_dataset(dataset_dir, dst_dir, format, n_workers=0) == []
+
+    for file_name in ("task_specs.pkl", "default_partition.json", "small_partition.json"):
+        assert Path(dst_dir, file_name).exists()
+    dataset = gb.GeobenchDataset(dst_dir, format=format)
+    for sample in samples:
+        assert sample_difference(sample, dataset.get_sample(sample.sample_name)) is None
+
+    # resuming skips converted samples
+    assert convert_dataset(dataset_dir, dst_dir, format, n_workers=0) == []
+
+
+def test_convert_tif_is_verified(tmp_path, dataset_dir, samples):
+    dst_dir = str(tmp_path / "dst")
+    differences = convert_dataset(dataset_dir, dst_dir, "tif", n_workers=0)
+    # tif stores the int64 segmentation labels as int16, which the verification reports.
+    assert len(differences) == 5
+    assert all("label differs (int64 vs int16)" in difference for difference in differences)
+
+
+def test_convert_with_process_pool(tmp_path, dataset_dir, samples):
+    dst_dir = str(tmp_path / "dst")
+    assert convert_dataset(dataset_dir, dst_dir, "npz", n_workers=2) == []
+    assert len(list(Path(dst_dir).glob("sample_*.npz"))) == 5
+
+
+def test_verification_reports_differences(tmp_path, dataset_dir, samples):
+    dst_dir = str(tmp_path / "dst")
+    convert_dataset(dataset_dir, dst_dir, "npz", n_workers=0, verify=False)
+    sample = samples[0]
+    sample.bands[0].data = sample.bands[0].data + np.int16(1)
+    sample.write(dst_dir, format="npz")
+    differences = convert_dataset(dataset_dir, dst_dir, "npz", n_workers=0)
+    assert len(differences) == 1 and differences[0].startswith(sample.sample_name)
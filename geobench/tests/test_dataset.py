@@ -1,10 +1,15 @@
+import datetime
+import pickle
 import tempfile
 
+import h5py
 import numpy as np
 import pytest
 import rasterio
 
 import geobench as gb
+from geobench.memmap import write_memmap
+from geobench.shards import write_shards
 
 
 def random_band(shape=(16, 16), band_name="test_band", alt_band_names=("alt_name",)):
@@ -78,6 +83,96 @@ def test_pack_4d_multi_band():
     assert tuple(band_names) == ("band_1",) * 5 + ("band_2", "band_3")
 
 
+def test_pack_4d_fill_value_multi_band():
+    multi = random_band((3, 4, 5), "band_1")
+    band_0, band_1 = random_band((3, 4), "band_2"), random_band((3, 4), "band_2")
+    multi.date = datetime.date(2020, 1, 2)
+    band_0.date, band_1.date = datetime.date(2020, 1, 1), datetime.date(2020, 1, 2)
+    sample = gb.Sample([multi, band_0, band_1], 0, "test_sample")
+
+    with pytest.raises(ValueError):
+        sample.pack_to_4d()
+    image, dates, band_names = sample.pack_to_4d(fill_value=-1)
+
+    assert image.shape == (2, 3, 4, 6)
+    assert image.dtype == np.float64
+    assert tuple(band_names) == ("band_1",) * 5 + ("band_2",)
+    assert np.all(image[0, :, :, :5] == -1)
+    np.testing.assert_array_equal(image[1, :, :, :5], multi.data)
+    np.testing.assert_array_equal(image[0, :, :, 5], band_0.data)
+    np.testing.assert_array_equal(image[1, :, :, 5], band_1.data)
+
+
+def test_shared_sample_layout():
+    samples = [random_sample(name=f"sample_{i}") for i in range(2)]
+    assert samples[0]._layout is samples[1]._layout
+    sample = samples[1]
+    assert sample.band_names == [" 0", " 1", " 2"]
+    assert sample.get_band_info("alt_ 1") is sample.bands[1].band_info
+    np.testing.assert_array_equal(sample.band_array[0], sample.bands)
+
+    selection = sample._layout.select(band_names=("alt_ 2", " 0"))
+    assert selection is sample._layout.select(band_names=("alt_ 2", " 0"))
+    assert selection.rows == ((2, 0),)
+    image, _, band_names = sample.pack_to_4d(band_names=("alt_ 2", " 0"))
+    assert band_names == [" 2", " 0"]
+    np.testing.assert_array_equal(image[0, :, :, 0], sample.bands[2].data)
+
+    # the layout is looked up again when unpickling
+    sample_ = pickle.loads(pickle.dumps(sample))
+    assert sample_._layout is sample._layout
+
+
+def assert_same_bands(sample, sample_):
+    assert len(sample.bands) == len(sample_.bands)
+    for band, band_ in zip(sample.bands, sample_.bands):
+        assert (band.band_info, band.date, band.transform) == (
+            band_.band_info,
+            band_.date,
+            band_.transform,
+        )
+        np.testing.assert_array_equal(band.data, band_.data)
+
+
+def test_compact_sample():
+    dates = [datetime.date(2020, 1, 1), datetime.date(2020, 1, 2)]
+    bands = []
+    for date in dates:
+        for i, shape in enumerate([(8, 8), (8, 8), (4, 4), (8, 8, 3)]):
+            band = random_band(shape, band_name=f"band_{i}")
+            band.date = band.date_id = date
+            bands.append(band)
+    sample = gb.Sample(bands, 1, "test_sample")
+    compact = sample.compact()
+
+    # 8x8 and 4x4 bands, the multi band stays as is
+    assert [group.data.shape for group in compact.groups] == [(2, 2, 8, 8), (2, 1, 4, 4)]
+    assert compact._layout is sample._layout
+    assert compact._bands is None
+    assert compact.largest_shape() == sample.largest_shape()
+    image, _, _ = compact.pack_to_4d(resample=True)
+    np.testing.assert_array_equal(image, sample.pack_to_4d(resample=True)[0])
+    assert compact._bands is None
+
+    # band views, in the original order, share memory with the groups
+    assert_same_bands(sample, compact)
+    assert np.shares_memory(compact.bands[1].data, compact.groups[0].data)
+    compact.bands[0].data[0, 0] = -1
+    assert compact.groups[0].data[0, 0, 0, 0] == -1
+
+    compact_ = pickle.loads(pickle.dumps(compact))
+    assert len(pickle.dumps(compact)) < len(pickle.dumps(sample))
+    assert compact_._bands is None
+    assert_same_bands(compact, compact_)
+
+    # modified views are packed again
+    compact.bands[1].crop((0, 0), (4, 4))
+    assert [group.data.shape for group in compact.groups] == [(2, 2, 8, 8), (2, 2, 4, 4)]
+    compact_ = pickle.loads(pickle.dumps(compact))
+    assert_same_bands(compact, compact_)
+    assert np.shares_memory(compact.bands[1].data, compact.groups[1].data)
+
+
 def test_write_read():
     with tempfile.TemporaryDirectory() as dataset_dir:
         sample = random_sample()
@@ -250,3 +345,305 @@ def test_class_id():
 
     assert isinstance(dataset.sentinel2_13_bands[0], gb.SpectralBand)
     assert isinstance(gb.sentinel2_13_bands[0], dataset.SpectralBand)
+
+
+def test_load_hdf5_band_selection():
+    bands = [
+        random_band(band_name="band_1", alt_band_names=("alt_1",)),
+        random_band(band_name="band_2", alt_band_names=("alt_2",)),
+        random_band(band_name="band_3", alt_band_names=("alt_3",)),
+    ]
+    sample = gb.Sample(bands, 1, "test_sample")
+    with tempfile.TemporaryDirectory() as dataset_dir:
+        sample_path = sample.write(dataset_dir)
+
+        sample_ = gb.load_sample_hdf5(sample_path, band_names=("band_3", "alt_1"))
+        assert [band.band_info.name for band in sample_.bands] == ["band_1", "band_3"]
+        np.testing.assert_array_equal(sample_.bands[0].data, bands[0].data)
+        np.testing.assert_array_equal(sample_.bands[1].data, bands[2].data)
+        assert sample_.label == 1
+
+        assert len(gb.load_sample_hdf5(sample_path).bands) == 3
+
+        with pytest.raises(ValueError):
+            gb.load_sample_hdf5(sample_path, band_names=("band_4",))
+
+
+def test_header_round_trip():
+    band = random_band()
+    attr_dict = {
+        "band": dict(
+            date=datetime.date(2020, 1, 2),
+            date_id=datetime.datetime(2020, 1, 2, 3, 4),
+            spatial_resolution=10,
+            band_info=gb.sentinel2_13_bands[1],
+            meta_info={"location": (1.0, 2.0), 3: "int key"},
+            transform=band.transform,
+            crs=rasterio.crs.CRS.from_epsg(4326),
+        ),
+        "label": np.array([0, 1, 1], dtype=np.int8),
+        "bands_order": ["band"],
+    }
+    attr_dict_ = gb.decode_header(gb.encode_header(attr_dict))
+
+    attrs, attrs_ = attr_dict["band"], attr_dict_["band"]
+    for key in ("date", "date_id", "spatial_resolution", "meta_info", "transform", "crs"):
+        assert attrs[key] == attrs_[key], key
+    assert isinstance(attrs_["transform"], rasterio.Affine)
+    assert isinstance(attrs_["band_info"], gb.Sentinel2)
+    assert attrs_["band_info"].alt_names == ("2", "02", "blue")
+    assert attrs_["band_info"].wavelength == 0.49
+    np.testing.assert_array_equal(attr_dict_["label"], attr_dict["label"])
+    assert attr_dict_["label"].dtype == np.int8
+    assert attr_dict_["bands_order"] == ["band"]
+
+
+@pytest.mark.parametrize("format", ["hdf5", "npz"])
+def test_transform_round_trip(format):
+    sample = random_sample()
+    with tempfile.TemporaryDirectory() as dataset_dir:
+        sample_path = sample.write(dataset_dir, format=format)
+        sample_ = gb.load_sample(sample_path, format=format)
+        for band, band_ in zip(sample.bands, sample_.bands):
+            assert isinstance(band_.transform, rasterio.Affine)
+            assert band_.transform == band.transform
+
+
+def _write_legacy_hdf5(sample, dataset_dir):
+    """Write a sample with the pickled header used before header version 2."""
+    sample_path = gb.write_sample_hdf5(sample, dataset_dir)
+    with h5py.File(sample_path, "r+") as fp:
+        attr_dict = gb.decode_header(fp.attrs["header"])
+        del fp.attrs["header"]
+        fp.attrs["pickle"] = str(pickle.dumps(attr_dict))
+    return sample_path
+
+
+def test_legacy_header_and_migration():
+    sample = random_sample()
+    with tempfile.TemporaryDirectory() as dataset_dir:
+        sample_path = _write_legacy_hdf5(sample, dataset_dir)
+        sample_ = gb.load_sample_hdf5(sample_path)
+        assert sample_.label == sample.label
+        assert [band.band_info for band in sample_.bands] == [b.band_info for b in sample.bands]
+
+        assert gb.migrate_sample_header(sample_path)
+        assert not gb.migrate_sample_header(sample_path)
+        with h5py.File(sample_path, "r") as fp:
+            assert "pickle" not in fp.attrs
+        sample_ = gb.load_sample_hdf5(sample_path)
+        assert sample_.label == sample.label
+        np.testing.assert_array_equal(sample_.bands[0].data, sample.bands[0].data)
+
+
+def test_tif_metadata_sidecar():
+    samples = [random_sample(name=f"sample_{i}") for i in range(2)]
+    band_names = [band.band_info.name for band in samples[0].bands]
+    with tempfile.TemporaryDirectory() as dataset_dir:
+        paths = [sample.write(dataset_dir, format="tif") for sample in samples]
+        assert (paths[0] / gb.TIF_METADATA_FILE).exists()
+        tif_path = paths[0] / f"{samples[0].bands[0].get_descriptor()}.tif"
+        with rasterio.open(tif_path) as src:
+            assert "data" not in src.tags()
+
+        loaded = [gb.load_sample_tif(path, band_names) for path in paths]
+        assert gb.load_band_tif(tif_path).band_info == samples[0].bands[0].band_info
+        # band infos are decoded once and shared by all samples of a dataset.
+        assert loaded[0].bands[0].band_info is loaded[1].bands[0].band_info
+
+        # legacy samples store the meta data as pickled tags in each file.
+        for tif_path in paths[0].glob("*.tif"):
+            band = gb.load_band_tif(tif_path)
+            tif_path.unlink()
+            band.write_to_geotiff(paths[0])
+        (paths[0] / gb.TIF_METADATA_FILE).unlink()
+        legacy = gb.load_sample_tif(paths[0], band_names)
+        assert gb.migrate_sample_header(paths[0])
+        assert not gb.migrate_sample_header(paths[0])
+        migrated = gb.load_sample_tif(paths[0], band_names)
+
+    for band, band_, band__ in zip(loaded[0].bands, legacy.bands, migrated.bands):
+        assert band.band_info == band_.band_info == band__.band_info
+        np.testing.assert_array_equal(band.data, band_.data)
+        np.testing.assert_array_equal(band.data, band__.data)
+
+
+def test_write_read_npz():
+    sample = random_sample()
+    with tempfile.TemporaryDirectory() as dataset_dir:
+        sample_path = gb.write_sample_npz(sample, dataset_dir)
+        sample_ = gb.load_sample_npz(sample_path)
+        assert sample_.label == sample.label
+        for band, band_ in zip(sample.bands, sample_.bands):
+            assert band.band_info == band_.band_info
+            np.testing.assert_array_equal(band.data, band_.data)
+
+
+@pytest.mark.parametrize("compressed", [False, True])
+def test_load_npz_mmap(compressed):
+    sample = gb.Sample([random_band((16, 16), "band_1"), random_band((8, 8, 3), "multi")], 1, "s")
+    with tempfile.TemporaryDirectory() as dataset_dir:
+        sample_path = sample.write(dataset_dir, format="npz", compressed=compressed)
+        sample_ = gb.load_sample(sample_path, band_names=("multi",), format="npz")
+        assert [band.band_info.name for band in sample_.bands] == ["multi"]
+        data = sample_.bands[0].data
+        assert isinstance(data, np.memmap) != compressed
+        np.testing.assert_array_equal(data, sample.bands[1].data)
+
+        windowed = gb.load_sample_npz(sample_path, window=(4, 4, 8, 8))
+        np.testing.assert_array_equal(windowed.bands[0].data, sample.bands[0].data[4:12, 4:12])
+        np.testing.assert_array_equal(windowed.bands[1].data, sample.bands[1].data[2:6, 2:6])
+        del sample_, data, windowed
+
+
+@pytest.mark.parametrize(
+    "filter_kwargs",
+    [
+        dict(compression="lzf"),
+        dict(compression="gzip", compression_opts=4, shuffle=True, chunks=(8, 8)),
+        dict(chunks=True),
+    ],
+)
+def test_write_read_hdf5_compression(filter_kwargs):
+    sample = gb.Sample([random_band((16, 16)), random_band((16, 16, 3), "multi")], 1, "test")
+    with tempfile.TemporaryDirectory() as dataset_dir:
+        sample_path = sample.write(dataset_dir, **filter_kwargs)
+        with h5py.File(sample_path, "r") as fp:
+            assert fp["multi"].chunks is not None
+            assert fp["multi"].compression == filter_kwargs.get("compression")
+        sample_ = gb.load_sample_hdf5(sample_path)
+        for band, band_ in zip(sample.bands, sample_.bands):
+            np.testing.assert_array_equal(band.data, band_.data)
+
+
+@pytest.mark.parametrize("format", ["hdf5", "tif"])
+def test_load_window(format):
+    bands = [random_band((16, 16), "band_1"), random_band((8, 8), "band_2")]
+    sample = gb.Sample(bands, 1, "test_sample")
+    with tempfile.TemporaryDirectory() as dataset_dir:
+        sample_path = sample.write(dataset_dir, format=format)
+        full = gb.load_sample(sample_path, band_names=("band_1", "band_2"), format=format)
+        windowed = gb.load_sample(
+            sample_path, band_names=("band_1", "band_2"), format=format, window=(4, 2, 8, 12)
+        )
+
+    assert windowed.bands[0].data.shape == (8, 12)
+    assert windowed.bands[1].data.shape == (4, 6)
+    for band, band_ in zip(full.bands, windowed.bands):
+        band.crop_from_ratio((4 / 16, 2 / 16), (8 / 16, 12 / 16))
+        np.testing.assert_array_equal(band.data, band_.data)
+        assert band.transform.almost_equals(band_.transform)
+
+
+def test_load_window_out_of_bounds():
+    sample = gb.Sample([random_band((16, 16))], 1, "test_sample")
+    with tempfile.TemporaryDirectory() as dataset_dir:
+        sample_path = sample.write(dataset_dir)
+        with pytest.raises(ValueError):
+            gb.load_sample_hdf5(sample_path, window=(10, 0, 8, 8))
+
+
+@pytest.mark.parametrize("samples", [dict(multi_resolution=True)], indirect=True)
+@pytest.mark.parametrize("format", ["hdf5", "tif", "npz", "shards", "memmap"])
+@pytest.mark.parametrize(
+    "window, small_window",
+    [((2, 1, 4, 5), (1, 0, 2, 3)), ((5, 5, 3, 3), (2, 2, 2, 2)), ((0, 0, 1, 1), (0, 0, 1, 1))],
+)
+def test_load_window_multi_resolution(dataset_dir, samples, format, window, small_window):
+    if format in ("tif", "npz"):
+        for sample in samples:
+            sample.write(dataset_dir, format=format)
+    elif format == "shards":
+        write_shards(dataset_dir)
+    elif format == "memmap":
+        write_memmap(dataset_dir)
+    dataset = gb.GeobenchDataset(dataset_dir, format=format)
+
+    sample, sample_ = samples[3], dataset.get_sample("sample_3", window=window)
+    # band_2 is 4x4, it covers all the pixels of the 8x8 window
+    for band, band_, (row, col, height, width) in zip(
+        sample.bands + [sample.label],
+        sample_.bands + [sample_.label],
+        [window] * 2 + [small_window, window],
+    ):
+        np.testing.assert_array_equal(band.data[row : row + height, col : col + width], band_.data)
+
+
+def test_crop_transform():
+    band = random_band(shape=(10, 10))
+    transform = band.transform
+    band.crop((2, 3), (4, 4))
+    assert band.transform == transform * rasterio.Affine.translation(3, 2)
+    x, y = transform * (3, 2)
+    assert band.transform * (0, 0) == (x, y)
+
+
+@pytest.mark.parametrize("n_threads", [0, 4])
+def test_load_samples_tif(n_threads):
+    samples = [
+        gb.Sample(
+            [random_band((16, 16), "band_1"), random_band((8, 8), "band_2")],
+            gb.Band(
+                np.random.randint(3, size=(16, 16)), gb.SegmentationClasses("label", 10, 3), 10
+            ),
+            f"sample_{i}",
+        )
+        for i in range(3)
+    ]
+    with tempfile.TemporaryDirectory() as dataset_dir:
+        paths = [sample.write(dataset_dir, format="tif") for sample in samples]
+        expected = [gb.load_sample_tif(path, ("band_1", "band_2"), n_threads=0) for path in paths]
+        loaded = gb.load_samples_tif(paths, ("band_1", "band_2"), n_threads=n_threads)
+        windowed = gb.load_samples_tif(paths, ("band_2",), window=(0, 0, 4, 4), n_threads=n_threads)
+
+    for sample, sample_, windowed_ in zip(expected, loaded, windowed):
+        assert sample_.sample_name == sample.sample_name
+        for band, band_ in zip(sample.bands, sample_.bands):
+            np.testing.assert_array_equal(band.data, band_.data)
+        np.testing.assert_array_equal(sample.label.data, sample_.label.data)
+        # the window is in pixels of the largest band, the 16x16 label.
+        np.testing.assert_array_equal(windowed_.bands[0].data, sample.bands[1].data[:2, :2])
+        np.testing.assert_array_equal(windowed_.label.data, sample.label.data[:4, :4])
+
+
+def test_npz_dataset(dataset_dir, samples):
+    for sample in samples:
+        sample.write(dataset_dir, format="npz")
+    dataset = gb.GeobenchDataset(dataset_dir, format="npz", band_names=("alt_1",))
+    for sample in samples:
+        sample_ = dataset.get_sample(sample.sample_name)
+        assert [band.band_info.name for band in sample_.bands] == ["band_1"]
+        np.testing.assert_array_equal(sample_.bands[0].data, sample.bands[1].data)
+        np.testing.assert_array_equal(sample_.label.data, sample.label.data)
+
+    # bands are copy-on-write, in place transforms don't reach the file
+    sample_ = dataset[0]
+    assert isinstance(sample_.bands[0].data, np.memmap)
+    sample_.bands[0].data += 1
+    np.testing.assert_array_equal(dataset[0].bands[0].data + 1, sample_.bands[0].data)
+
+
+@pytest.mark.parametrize("format", ["hdf5", "tif"])
+@pytest.mark.parametrize("window", [None, (4, 2, 8, 12)])
+def test_lazy_load(format, window):
+    bands = [random_band((16, 16), "band_1"), random_band((8, 8), "band_2")]
+    label = gb.Band(np.random.randint(3, size=(16, 16)), gb.SegmentationClasses("label", 10, 3), 10)
+    sample = gb.Sample(bands, label, "test_sample")
+    with tempfile.TemporaryDirectory() as dataset_dir:
+        sample_path = sample.write(dataset_dir, format=format)
+        eager = gb.load_sample(sample_path, format=format, window=window)
+        lazy = gb.load_sample(sample_path, format=format, window=window, lazy=True)
+
+        for band, band_ in zip(eager.bands + [eager.label], lazy.bands + [lazy.label]):
+            assert not band_.is_loaded
+            assert band_.shape == band.data.shape
+            assert band_.dtype == band.data.dtype
+        assert lazy.largest_shape() == eager.largest_shape()
+        assert not lazy.bands[0].is_loaded
+
+        # pickling decodes the pending bands.
+        lazy_ = pickle.loads(pickle.dumps(lazy))
+        for band, band_, band__ in zip(eager.bands, lazy.bands, lazy_.bands):
+            np.testing.assert_array_equal(band_.data, band.data)
+            np.testing.assert_array_equal(band__.data, band.data)
+            assert band_.is_loaded
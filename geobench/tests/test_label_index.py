@@ -0,0 +1,60 @@
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+import geobench as gb
+from geobench.label_index import LABEL_INDEX_FILE, LabelIndex, build_label_index
+from geobench.shards import write_shards
+
+
+def test_segmentation_label_index(dataset_dir, samples):
+    label_index = build_label_index(dataset_dir)
+    assert Path(dataset_dir, LABEL_INDEX_FILE).exists()
+    assert label_index.kind == "pixel_count"
+    assert label_index.n_classes == 3
+
+    label_stats = LabelIndex.load(dataset_dir).label_stats()
+    for sample in samples:
+        expected = sample.label.band_info.label_stats(sample.label)
+        np.testing.assert_allclose(label_stats[sample.sample_name], expected)
+
+    with pytest.raises(ValueError):
+        label_index.label_map()
+
+
+def test_classification_label_index():
+    label_index = LabelIndex.from_labels({"a": 1, "b": 0, "c": 1, "d": 3}, n_classes=4)
+    assert label_index.kind == "class_id"
+    assert label_index.label_map() == {"1": ["a", "c"], "0": ["b"], "3": ["d"]}
+    assert label_index.label_stats()["d"] == [0, 0, 0, 1]
+
+    with tempfile.TemporaryDirectory() as dataset_dir:
+        label_index.save(dataset_dir)
+        label_index_ = LabelIndex.load(dataset_dir)
+        assert label_index_.sample_names == label_index.sample_names
+        assert label_index_.n_classes == 4
+        np.testing.assert_array_equal(label_index_.values, label_index.values)
+
+    subset = label_index.subset([3, 0])
+    assert subset.label_map() == {"3": ["d"], "1": ["a"]}
+
+
+def test_multi_label_index():
+    labels = {"a": np.array([1, 0, 1]), "b": np.array([0, 0, 1])}
+    label_index = LabelIndex.from_labels(labels)
+    assert label_index.kind == "multi_hot"
+    assert label_index.label_stats() == {"a": [1, 0, 1], "b": [0, 0, 1]}
+
+
+def test_mixed_labels():
+    with pytest.raises(ValueError):
+        LabelIndex.from_labels({"a": 1, "b": np.array([0, 1])})
+
+
+def test_writer_emits_label_index(dataset_dir, samples):
+    write_shards(dataset_dir)
+    label_index = LabelIndex.load(dataset_dir)
+    assert sorted(label_index.sample_names) == sorted(sample.sample_name for sample in samples)
+    assert label_index.values.sum() == len(samples) * 8 * 8
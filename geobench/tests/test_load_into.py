@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+
+import geobench as gb
+from geobench.shards import write_shards
+
+
+@pytest.mark.parametrize("format", ["hdf5", "shards"])
+def test_load_into(format, dataset_dir, samples):
+    if format == "shards":
+        write_shards(dataset_dir)
+    dataset = gb.GeobenchDataset(dataset_dir, partition_name="default", format=format)
+    band_names = ("band_2", "alt_0")
+    expected, _, _ = dataset[0].pack_to_4d(band_names=band_names)
+
+    batch = np.zeros((2, 1, 8, 8, 2), dtype=np.float32)
+    sample = dataset.load_into(0, batch[1], band_names=band_names)
+    np.testing.assert_array_equal(batch[1], expected)
+    assert not batch[0].any()
+    # bands are views on the buffer, and the label is loaded.
+    assert np.shares_memory(sample.bands[0].data, batch)
+    np.testing.assert_array_equal(sample.label.data, dataset[0].label.data)
+
+    channel_first = np.empty((2, 8, 8), dtype=np.float64)
+    dataset.load_into(0, channel_first, band_names=band_names)
+    np.testing.assert_array_equal(channel_first, np.moveaxis(expected[0], 2, 0))
+
+    with pytest.raises(ValueError):
+        dataset.load_into(0, np.empty((3, 8, 8)), band_names=band_names)
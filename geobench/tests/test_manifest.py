@@ -0,0 +1,75 @@
+import os
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+import geobench as gb
+from geobench.geobench_convert import convert_dataset
+from geobench.manifest import MANIFEST_FILE, Manifest, build_manifest
+
+
+@pytest.mark.parametrize("samples", [{}, dict(multi_resolution=True)], indirect=True)
+def test_build_manifest(dataset_dir, samples):
+    build_manifest(dataset_dir)
+    manifest = Manifest.load(dataset_dir)
+
+    assert manifest.format == "hdf5"
+    assert sorted(manifest.partitions) == ["default", "small"]
+    assert sorted(manifest.sample_names) == sorted(sample.sample_name for sample in samples)
+    # all samples share the same band layout, stored once.
+    assert len(manifest.layouts) == 1
+    for sample in samples:
+        shapes = manifest.band_shapes(sample.sample_name, with_label=False)
+        assert list(shapes.values()) == [band.data.shape for band in sample.bands]
+        assert manifest.largest_shape(sample.sample_name) == sample.largest_shape()
+        assert manifest.dates(sample.sample_name) == [None] * 3
+        expected = np.bincount(sample.label.data.ravel(), minlength=3)
+        np.testing.assert_array_equal(manifest.label_summary(sample.sample_name), expected)
+        assert manifest.verify_sample(dataset_dir, sample.sample_name)
+
+    samples[0].bands[0].data += 1
+    samples[0].write(dataset_dir)
+    assert not manifest.verify_sample(dataset_dir, samples[0].sample_name)
+
+
+def _set_mtime(path, mtime_ns):
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def test_dataset_uses_manifest(dataset_dir, samples):
+    build_manifest(dataset_dir)
+    # backdated, so that later changes don't happen in the same clock tick as the manifest save
+    mtime_ns = os.stat(Path(dataset_dir, MANIFEST_FILE)).st_mtime_ns - 10**9
+    _set_mtime(Path(dataset_dir, MANIFEST_FILE), mtime_ns)
+
+    # partitions are listed from the manifest, not by scanning the directory
+    Path(dataset_dir, "small_partition.json").rename(Path(dataset_dir, "other.json"))
+    _set_mtime(dataset_dir, mtime_ns)
+    dataset = gb.GeobenchDataset(dataset_dir)
+    assert sorted(dataset.list_partitions()) == ["default", "small"]
+    Path(dataset_dir, "other.json").rename(Path(dataset_dir, "small_partition.json"))
+
+    # saving a partition doesn't rewrite the manifest, it is stale and the directory is scanned
+    gb.Partition({"train": ["sample_1"], "valid": [], "test": []}).save(dataset_dir, "new")
+    assert "new" not in Manifest.load(dataset_dir).partitions
+    dataset = gb.GeobenchDataset(dataset_dir)
+    assert sorted(dataset.list_partitions()) == ["default", "new", "small"]
+    with pytest.warns(UserWarning):
+        gb.check_dataset_integrity(dataset, samples=[], rewrite_if_necessary=False)
+
+    # samples are checked on disk, not taken from the manifest
+    Path(dataset_dir, "sample_4.hdf5").unlink()
+    with pytest.warns(UserWarning, match="samples of the manifest are missing"):
+        with pytest.raises(AssertionError, match="Not all samples are present"):
+            gb.check_dataset_integrity(dataset, samples=[], rewrite_if_necessary=False)
+
+
+def test_convert_builds_manifest(tmp_path, dataset_dir, samples):
+    dst_dir = str(tmp_path / "dst")
+    build_manifest(dataset_dir)
+    convert_dataset(dataset_dir, dst_dir, "tif", n_workers=0)
+    manifest = Manifest.load(dst_dir)
+    assert manifest.format == "tif"
+    assert manifest.largest_shape("sample_0") == (8, 8)
+    assert Path(dst_dir, MANIFEST_FILE).exists()
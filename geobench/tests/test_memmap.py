@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+import geobench as gb
+from geobench.memmap import MemmapReader, write_memmap
+
+
+def test_write_read_memmap(dataset_dir, samples):
+    write_memmap(dataset_dir)
+
+    reader = MemmapReader(dataset_dir)
+    for sample in samples:
+        sample_ = reader.load_sample(sample.sample_name)
+        for band, band_ in zip(sample.bands, sample_.bands):
+            assert band.band_info == band_.band_info
+            assert isinstance(band_.data, np.memmap)
+            np.testing.assert_array_equal(band.data, band_.data)
+        np.testing.assert_array_equal(sample.label.data, sample_.label.data)
+
+    # writing to a band is copy-on-write, private to the loaded sample and never reaches the file
+    sample_ = reader.load_sample("sample_0", band_names=("band_1",))
+    sample_.bands[0].data[:] = 0
+    sample_ = reader.load_sample("sample_0", band_names=("band_1",))
+    np.testing.assert_array_equal(sample_.bands[0].data, samples[0].bands[1].data)
+
+    ds = gb.GeobenchDataset(dataset_dir, split="valid", band_names=("alt_2",), format="memmap")
+    assert len(ds) == 2
+    np.testing.assert_array_equal(ds[1].bands[0].data, samples[4].bands[2].data)
+
+
+def test_memmap_requires_same_layout(dataset_dir, samples):
+    sample = samples[1]
+    for band in sample.bands:
+        band.data = band.data[:4]
+    sample.write(dataset_dir)
+    with pytest.raises(ValueError):
+        write_memmap(dataset_dir)
+
+
+def test_memmap_window(dataset_dir, samples):
+    write_memmap(dataset_dir)
+    ds = gb.GeobenchDataset(dataset_dir, format="memmap")
+    sample_ = ds.get_sample("sample_3", window=(2, 1, 4, 5))
+    for band, band_ in zip(samples[3].bands, sample_.bands):
+        np.testing.assert_array_equal(band.data[2:6, 1:6], band_.data)
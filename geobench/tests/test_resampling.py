@@ -0,0 +1,74 @@
+import numpy as np
+import pytest
+from test_dataset import random_band
+
+import geobench as gb
+from geobench.resampling import METHODS, axis_taps, resample, resample_batch
+
+
+@pytest.mark.parametrize("method", METHODS)
+@pytest.mark.parametrize("sizes", [(20, 120), (120, 20), (7, 13)])
+def test_taps_preserve_constants(method, sizes):
+    indices, weights = axis_taps(*sizes, method)
+    assert indices.shape == weights.shape
+    assert indices.min() >= 0 and indices.max() < sizes[0]
+    np.testing.assert_allclose(weights.sum(axis=1), 1)
+
+    data = np.full((sizes[0], sizes[0], 2), 7, dtype=np.int16)
+    out = resample(data, (sizes[1], sizes[1]), method)
+    assert out.dtype == np.int16
+    assert np.all(out == 7)
+
+
+def test_nearest_and_area():
+    data = np.random.randint(0, 1000, (6, 4)).astype(np.int16)
+    np.testing.assert_array_equal(
+        resample(data, (12, 8), "nearest"), data.repeat(2, axis=0).repeat(2, axis=1)
+    )
+    data = np.random.rand(12, 8)
+    block_mean = data.reshape(6, 2, 4, 2).mean(axis=(1, 3))
+    np.testing.assert_allclose(resample(data, (6, 4), "area"), block_mean)
+
+
+def test_bilinear_is_exact_on_ramps():
+    ramp = np.add.outer(np.arange(10.0), 2 * np.arange(10.0))
+    out = resample(ramp, (20, 20), "bilinear")
+    coords = (np.arange(20) + 0.5) / 2 - 0.5
+    expected = np.add.outer(coords, 2 * coords)
+    # borders are replicated
+    np.testing.assert_allclose(out[1:-1, 1:-1], expected[1:-1, 1:-1])
+
+
+def test_resample_batch():
+    arrays = [np.random.rand(6, 6), np.random.rand(6, 6, 3), np.random.rand(3, 3)]
+    resampled = resample_batch(arrays, (12, 12), "bicubic")
+    for data, out in zip(arrays, resampled):
+        np.testing.assert_allclose(out, resample(data, (12, 12), "bicubic"))
+    assert resampled[0].shape == (12, 12)
+    assert resampled[1].shape == (12, 12, 3)
+
+
+def test_pack_to_4d_resample_method():
+    bands = [random_band((6, 8), "band_1"), random_band((3, 4), "band_2")]
+    sample = gb.Sample(bands, 0, "test_sample")
+    image, _, _ = sample.pack_to_4d(resample=True, resample_method="nearest")
+    np.testing.assert_array_equal(image[0, :, :, 0], bands[0].data)
+    np.testing.assert_array_equal(
+        image[0, :, :, 1], bands[1].data.repeat(2, axis=0).repeat(2, axis=1)
+    )
+    # other spline orders are still resampled with scipy.ndimage.zoom
+    image, _, _ = sample.pack_to_4d(resample=True, resample_order=2)
+    assert image.shape == (1, 6, 8, 2)
+
+
+@pytest.mark.parametrize("samples", [dict(multi_resolution=True)], indirect=True)
+def test_pack_dataset_multi_resolution(dataset_dir, samples):
+    dataset = gb.GeobenchDataset(dataset_dir, partition_name="default")
+    sample = dataset[0]
+    assert sample.bands[2].data.shape == (4, 4)
+    image, _, _ = sample.pack_to_4d(resample=True, resample_method="nearest")
+    assert image.shape == (1, 8, 8, 3)
+    np.testing.assert_array_equal(image[0, :, :, 0], sample.bands[0].data)
+    np.testing.assert_array_equal(
+        image[0, :, :, 2], sample.bands[2].data.repeat(2, axis=0).repeat(2, axis=1)
+    )
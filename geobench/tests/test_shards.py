@@ -0,0 +1,58 @@
+import pickle
+
+import numpy as np
+import rasterio
+
+import geobench as gb
+from geobench.shards import ShardReader, write_shards
+
+
+def test_write_read_shards(dataset_dir, samples):
+    write_shards(dataset_dir, max_shard_size=500)
+
+    reader = ShardReader(dataset_dir)
+    assert len(reader.shard_names) > 3  # small max_shard_size forces several shards per split
+
+    for sample in samples:
+        sample_ = reader.load_sample(sample.sample_name)
+        assert sample_.sample_name == sample.sample_name
+        for band, band_ in zip(sample.bands, sample_.bands):
+            assert band.band_info == band_.band_info
+            assert band.transform == band_.transform
+            np.testing.assert_array_equal(band.data, band_.data)
+        np.testing.assert_array_equal(sample.label.data, sample_.label.data)
+
+    sample_ = reader.load_sample("sample_1", band_names=("alt_2",))
+    assert [band.band_info.name for band in sample_.bands] == ["band_2"]
+
+    # the reader can be sent to another process
+    reader = pickle.loads(pickle.dumps(reader))
+    np.testing.assert_array_equal(
+        reader.load_sample("sample_2").bands[0].data, samples[2].bands[0].data
+    )
+
+    ds = gb.GeobenchDataset(dataset_dir, split="train", band_names=("alt_0",), format="shards")
+    assert len(ds) == 2
+    np.testing.assert_array_equal(ds[0].bands[0].data, samples[0].bands[0].data)
+
+
+def test_shards_window(dataset_dir, samples):
+    write_shards(dataset_dir)
+    sample_ = ShardReader(dataset_dir).load_sample("sample_3", window=(2, 1, 4, 5))
+    for band, band_ in zip(samples[3].bands, sample_.bands):
+        np.testing.assert_array_equal(band.data[2:6, 1:6], band_.data)
+    np.testing.assert_array_equal(samples[3].label.data[2:6, 1:6], sample_.label.data)
+
+
+def test_shards_lazy(dataset_dir, samples):
+    write_shards(dataset_dir)
+    reader = ShardReader(dataset_dir)
+    sample_ = reader.load_sample("sample_2", window=(2, 0, 4, 8), lazy=True)
+    assert sample_.bands[0].shape == (4, 8)
+    assert not sample_.bands[0].is_loaded
+    reader.close()
+
+    # closed shards are reopened on first access.
+    np.testing.assert_array_equal(sample_.bands[0].data, samples[2].bands[0].data[2:6])
+    np.testing.assert_array_equal(sample_.label.data, samples[2].label.data[2:6])
+    reader.close()
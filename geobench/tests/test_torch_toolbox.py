@@ -0,0 +1,90 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+torch = pytest.importorskip("torch")
+pytest.importorskip("pytorch_lightning")
+
+import geobench as gb  # noqa: E402
+from geobench.cache import SampleCache  # noqa: E402
+from geobench.torch_toolbox.dataset import DataModule, SampleToTensor, TensorCollate  # noqa: E402
+
+BAND_NAMES = ("band_0", "band_1", "band_2")
+
+
+def _with_label(sample, label):
+    return gb.Sample(sample.bands, label, sample.sample_name)
+
+
+@pytest.mark.parametrize("samples", [dict(multi_resolution=True)], indirect=True)
+def test_sample_to_tensor(samples):
+    sample = samples[0]
+    image, label = SampleToTensor(sample.label.band_info, BAND_NAMES)(sample)
+    assert image.shape == (3, 8, 8) and image.dtype == torch.float32
+    expected, _, _ = sample.pack_to_4d(band_names=BAND_NAMES, resample=True)
+    np.testing.assert_allclose(image.numpy(), expected[0].transpose(2, 0, 1))
+    assert label.shape == (8, 8) and label.dtype == torch.int64
+    np.testing.assert_array_equal(label.numpy(), sample.label.data)
+
+    to_tensor = SampleToTensor(gb.Classification(3), BAND_NAMES)
+    _, label = to_tensor(_with_label(sample, 2))
+    assert label.shape == () and label.dtype == torch.int64 and label.item() == 2
+
+    to_tensor = SampleToTensor(gb.MultiLabelClassification(3), BAND_NAMES)
+    _, label = to_tensor(_with_label(sample, np.array([1, 0, 1])))
+    assert label.dtype == torch.float32
+    np.testing.assert_array_equal(label.numpy(), [1, 0, 1])
+
+    with pytest.raises(ValueError):
+        SampleToTensor(None)
+
+
+def test_tensor_collate(samples):
+    to_tensor = SampleToTensor(samples[0].label.band_info, BAND_NAMES)
+    items = [to_tensor(sample) for sample in samples[:3]]
+    batch = TensorCollate()(items)
+    assert batch["input"].shape == (3, 3, 8, 8) and batch["input"].dtype == torch.float32
+    assert batch["label"].shape == (3, 8, 8) and batch["label"].dtype == torch.int64
+    for i, (image, label) in enumerate(items):
+        assert torch.equal(batch["input"][i], image)
+        assert torch.equal(batch["label"][i], label)
+
+
+@pytest.mark.parametrize("samples", [dict(n_samples=7, multi_resolution=True)], indirect=True)
+@pytest.mark.parametrize("batched_reads", [False, True])
+def test_data_module(monkeypatch, dataset_dir, samples, batched_reads):
+    task_specs = gb.GeobenchDataset(dataset_dir).task_specs
+    monkeypatch.setattr(task_specs, "get_dataset_dir", lambda: Path(dataset_dir))
+    data_module = DataModule(
+        task_specs,
+        batch_size=2,
+        num_workers=2,
+        band_names=BAND_NAMES,
+        tensor_output=True,
+        batched_reads=batched_reads,
+    )
+
+    # train samples 0, 3 and 6 are shuffled, and collated in shared memory on the workers
+    batches = list(data_module.train_dataloader())
+    assert [len(batch["input"]) for batch in batches] == [2, 1]
+    for batch in batches:
+        assert batch["input"].shape[1:] == (3, 8, 8) and batch["input"].dtype == torch.float32
+        assert batch["label"].shape[1:] == (8, 8) and batch["label"].dtype == torch.int64
+
+    # test samples 2 and 5, in order
+    (batch,) = list(data_module.test_dataloader())
+    to_tensor = SampleToTensor(task_specs.label_type, BAND_NAMES)
+    for i, sample in enumerate((samples[2], samples[5])):
+        image, label = to_tensor(sample)
+        assert torch.equal(batch["input"][i], image)
+        assert torch.equal(batch["label"][i], label)
+
+
+def test_get_pytorch_data_module(dataset_dir, samples):
+    task_specs = gb.GeobenchDataset(dataset_dir).task_specs
+    cache = SampleCache(1 << 20)
+    data_module = task_specs.get_pytorch_data_module(
+        band_names=BAND_NAMES, cache=cache, batched_reads=True
+    )
+    assert data_module.cache is cache and data_module.batched_reads
@@ -1,12 +1,125 @@
 """GeobenchDataset Datamodule."""
 
 from pathlib import Path
-from typing import Sequence
+from typing import Callable, Dict, List, Sequence, Tuple
 
+import numpy as np
 import pytorch_lightning as pl
-from torch.utils.data import DataLoader
+import torch
+from torch.utils.data import (
+    BatchSampler,
+    DataLoader,
+    RandomSampler,
+    SequentialSampler,
+    get_worker_info,
+)
 
 import geobench as gb
+from geobench.label import Classification, MultiLabelClassification, SemanticSegmentation
+
+
+def _label_kind(label_type) -> str:
+    """Return 'segmentation', 'multi_label' or 'classification' for a task label type."""
+    if isinstance(label_type, (gb.SegmentationClasses, SemanticSegmentation)):
+        return "segmentation"
+    if isinstance(label_type, MultiLabelClassification):
+        return "multi_label"
+    if isinstance(label_type, Classification):
+        return "classification"
+    raise ValueError(f"Tensor output is not supported for label type {label_type}.")
+
+
+class SampleToTensor:
+    """Convert a Sample to a (C, H, W) float tensor and a label tensor, on the DataLoader workers.
+
+    Labels are converted according to the label type of the task:
+
+    * classification: int64 scalar tensor of the class id.
+    * multi-label classification: float32 tensor of shape (n_classes,), for binary cross-entropy.
+    * segmentation: int64 tensor of shape (H, W) of the class of each pixel.
+    """
+
+    def __init__(
+        self,
+        label_type,
+        band_names: Sequence[str] = None,
+        transform: Callable[[gb.Sample], gb.Sample] = None,
+        fill_value: float = None,
+    ) -> None:
+        """Initialize new instance of SampleToTensor.
+
+        Args:
+            label_type: label type of the task, see TaskSpecifications.label_type.
+            band_names: bands to stack, in order. Defaults to None, which stacks all bands.
+            transform: callable transforming the Sample before the conversion.
+            fill_value: fills missing bands with this value, see Sample.pack_to_4d.
+        """
+        self.label_kind = _label_kind(label_type)
+        self.band_names = None if band_names is None else tuple(band_names)
+        self.transform = transform
+        self.fill_value = fill_value
+
+    def __call__(self, sample: gb.Sample) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Return the image and label tensors of a sample."""
+        if self.transform is not None:
+            sample = self.transform(sample)
+        array, _, _ = sample.pack_to_4d(
+            band_names=self.band_names, resample=True, fill_value=self.fill_value
+        )
+        if array.shape[0] != 1:
+            raise ValueError(
+                f"Expected a single date, got {array.shape[0]} for {sample.sample_name}."
+            )
+        # transposed and converted in a single copy
+        image = torch.from_numpy(
+            np.ascontiguousarray(array[0].transpose(2, 0, 1), dtype=np.float32)
+        )
+
+        label = sample.label
+        if self.label_kind == "segmentation":
+            label = torch.from_numpy(np.asarray(label.data, dtype=np.int64))
+        elif self.label_kind == "multi_label":
+            label = torch.from_numpy(np.asarray(label, dtype=np.float32))
+        else:
+            label = torch.tensor(int(label), dtype=torch.int64)
+        return image, label
+
+
+def _stack(tensors: Sequence[torch.Tensor], pin_memory: bool) -> torch.Tensor:
+    """Stack tensors into a single allocation.
+
+    On a DataLoader worker, the batch is allocated in shared memory, as torch's default_collate
+    does, so that it is sent to the main process without a copy. Otherwise it is optionally
+    allocated in pinned memory, for asynchronous host to device copies.
+    """
+    elem = tensors[0]
+    shape = (len(tensors),) + tuple(elem.shape)
+    if get_worker_info() is not None:
+        out = torch.empty(shape, dtype=elem.dtype).share_memory_()
+    else:
+        out = torch.empty(shape, dtype=elem.dtype, pin_memory=pin_memory)
+    return torch.stack(tuple(tensors), 0, out=out)
+
+
+class TensorCollate:
+    """Collate the outputs of SampleToTensor into a dictionary of 'input' and 'label' batches."""
+
+    def __init__(self, pin_memory: bool = False) -> None:
+        """Initialize new instance of TensorCollate.
+
+        Args:
+            pin_memory: whether to allocate the batches in pinned memory when collating in the
+                main process. Batches collated on workers are pinned by the DataLoader instead.
+        """
+        self.pin_memory = pin_memory
+
+    def __call__(self, batch: List[Tuple[torch.Tensor, torch.Tensor]]) -> Dict[str, torch.Tensor]:
+        """Stack images and labels, each in a single preallocated tensor."""
+        images, labels = zip(*batch)
+        return {
+            "input": _stack(images, self.pin_memory),
+            "label": _stack(labels, self.pin_memory),
+        }
 
 
 class DataModule(pl.LightningDataModule):
@@ -29,6 +142,10 @@ class DataModule(pl.LightningDataModule):
         collate_fn=None,
         band_names: Sequence[str] = ("red", "green", "blue"),
         format: str = "hdf5",
+        tensor_output: bool = False,
+        pin_memory: bool = False,
+        cache=None,
+        batched_reads: bool = False,
     ) -> None:
         """Initialize new instance of DataModule .
 
@@ -41,7 +158,17 @@ class DataModule(pl.LightningDataModule):
             transform: Callable transforming a Sample. Executed on a worker and the output will be provided to collate_fn.
             collate_fn: A callable passed to the DataLoader. Maps a list of Sample to dictionnary of stacked torch tensors.
             band_names: multi spectral bands to select
-            file_format: 'hdf5' or 'tif'
+            format: 'hdf5', 'tif', 'npz', 'shards' or 'memmap', see TaskSpecifications.get_dataset
+            tensor_output: whether workers convert samples to tensors after the transforms, see
+                SampleToTensor. Batches are then dictionaries of 'input' of shape (N, C, H, W) and
+                'label', collated by TensorCollate unless collate_fn is given.
+            pin_memory: whether to return batches in pinned memory, for faster copies to the GPU.
+            cache: sample cache of all splits, see GeobenchDataset. Use a
+                geobench.cache.SharedSampleCache to share it between workers, and between epochs
+                without persistent workers.
+            batched_reads: whether workers load whole batches with GeobenchDataset.get_batch,
+                which sorts reads by location in storage and decodes samples in parallel, instead
+                of one sample per call.
         """
         super().__init__()
         self.task_specs = task_specs
@@ -54,66 +181,59 @@ class DataModule(pl.LightningDataModule):
         self.collate_fn = collate_fn
         self.band_names = band_names
         self.format = format
+        self.tensor_output = tensor_output
+        self.pin_memory = pin_memory
+        self.cache = cache
+        self.batched_reads = batched_reads
+        if tensor_output and collate_fn is None:
+            self.collate_fn = TensorCollate(pin_memory=pin_memory)
 
-    def train_dataloader(self) -> DataLoader:
-        """Create the train dataloader."""
+    def _dataloader(self, split: str, transform, batch_size: int, shuffle: bool) -> DataLoader:
+        if self.tensor_output:
+            transform = SampleToTensor(self.task_specs.label_type, self.band_names, transform)
+        # TensorCollate pins batches collated in the main process itself
+        pin_memory = self.pin_memory and not (
+            isinstance(self.collate_fn, TensorCollate) and self.num_workers == 0
+        )
+        dataset = self.task_specs.get_dataset(
+            split=split,
+            partition_name=self.partition_name,
+            transform=transform,
+            band_names=self.band_names,
+            format=self.format,
+            cache=self.cache,
+        )
+        if self.batched_reads:
+            # the dataset receives the indexes of a whole batch, see GeobenchDataset.__getitem__
+            sampler = RandomSampler(dataset) if shuffle else SequentialSampler(dataset)
+            return DataLoader(
+                dataset,
+                sampler=BatchSampler(sampler, batch_size, drop_last=False),
+                batch_size=None,
+                num_workers=self.num_workers,
+                collate_fn=self.collate_fn,
+                pin_memory=pin_memory,
+            )
         return DataLoader(
-            self.task_specs.get_dataset(
-                split="train",
-                partition_name=self.partition_name,
-                transform=self.train_transform,
-                band_names=self.band_names,
-                format=self.format,
-            ),
-            batch_size=self.batch_size,
-            shuffle=True,
+            dataset,
+            batch_size=batch_size,
+            shuffle=shuffle,
             num_workers=self.num_workers,
             collate_fn=self.collate_fn,
+            pin_memory=pin_memory,
         )
 
+    def train_dataloader(self) -> DataLoader:
+        """Create the train dataloader."""
+        return self._dataloader("train", self.train_transform, self.batch_size, shuffle=True)
+
     def val_dataloader(self) -> DataLoader:
         """Create the validation dataloader."""
         return (
-            DataLoader(
-                self.task_specs.get_dataset(
-                    split="valid",
-                    partition_name=self.partition_name,
-                    transform=self.eval_transform,
-                    band_names=self.band_names,
-                    format=self.format,
-                ),
-                batch_size=self.val_batch_size,
-                shuffle=False,
-                num_workers=self.num_workers,
-                collate_fn=self.collate_fn,
-            ),
-            DataLoader(
-                self.task_specs.get_dataset(
-                    split="test",
-                    partition_name=self.partition_name,
-                    transform=self.eval_transform,
-                    band_names=self.band_names,
-                    format=self.format,
-                ),
-                batch_size=self.val_batch_size,
-                shuffle=False,
-                num_workers=self.num_workers,
-                collate_fn=self.collate_fn,
-            ),
+            self._dataloader("valid", self.eval_transform, self.val_batch_size, shuffle=False),
+            self._dataloader("test", self.eval_transform, self.val_batch_size, shuffle=False),
         )
 
     def test_dataloader(self) -> DataLoader:
         """Create the test dataloader."""
-        return DataLoader(
-            self.task_specs.get_dataset(
-                split="test",
-                partition_name=self.partition_name,
-                transform=self.eval_transform,
-                band_names=self.band_names,
-                format=self.format,
-            ),
-            batch_size=self.val_batch_size,
-            shuffle=False,
-            num_workers=self.num_workers,
-            collate_fn=self.collate_fn,
-        )
+        return self._dataloader("test", self.eval_transform, self.val_batch_size, shuffle=False)
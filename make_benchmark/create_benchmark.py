@@ -10,6 +10,8 @@ import numpy as np
 from tqdm import tqdm
 
 import geobench as gb
+from geobench.label_index import LabelIndex, save_label_index
+from geobench.manifest import build_manifest
 from make_benchmark import bandstats
 from make_benchmark.dataset_converters import inspect_tools
 from make_benchmark.generate_partitions import generate_train_size_sweep
@@ -317,6 +319,28 @@ def max_shape_center_crop(max_shape):
     return sample_converter
 
 
+def _write_label_index(dataset_dir, new_dataset_dir, new_partition, labels, task_specs) -> None:
+    """Write the label index of a transformed dataset.
+
+    Labels of converted samples are indexed directly. Copied samples reuse the label index of the
+    source dataset, if any.
+    """
+    if labels:
+        save_label_index(new_dataset_dir, labels, getattr(task_specs.label_type, "n_classes", None))
+        return
+
+    label_index = LabelIndex.load(dataset_dir)
+    if label_index is not None:
+        positions = {name: i for i, name in enumerate(label_index.sample_names)}
+        sample_names = [
+            name
+            for split_names in new_partition.partition_dict.values()
+            for name in split_names
+            if name in positions
+        ]
+        label_index.subset([positions[name] for name in sample_names]).save(new_dataset_dir)
+
+
 def transform_dataset(
     dataset_dir: Path,
     new_benchmark_dir: Path,
@@ -326,6 +350,7 @@ def transform_dataset(
     new_dataset_name=None,
     delete_existing: bool = False,
     hdf5: bool = True,
+    write_kwargs: Dict[str, Any] = None,
 ) -> Union[Path, None]:
     """Transform dataset.
 
@@ -337,6 +362,8 @@ def transform_dataset(
         sample_converter:
         delete_existing:
         hdf5:
+        write_kwargs: passed to `Sample.write`, e.g., dict(compression="gzip", shuffle=True) for
+            hdf5. If not None, samples are rewritten even when sample_converter is None.
     """
     dataset = gb.GeobenchDataset(dataset_dir, partition_name=partition_name)
     task_specs = dataset.task_specs
@@ -370,6 +397,12 @@ def transform_dataset(
 
     # TODO task_specs should be updated if sample_converter modifies the patch_size.
 
+    if write_kwargs is None:
+        write_kwargs = {}
+    elif sample_converter is None:
+        sample_converter = rewrite
+
+    labels = {}
     for split_name, sample_names in new_partition.partition_dict.items():
         print(f"  Converting {len(sample_names)} samples from {split_name} split.")
         for sample_name in tqdm(sample_names):
@@ -387,13 +420,20 @@ def transform_dataset(
                 format = "hdf5" if hdf5 else "tif"
                 sample = gb.load_sample(dataset_dir / sample_name, format=format)
                 new_sample = sample_converter(sample)
-                new_sample.write(new_dataset_dir, format=format)
+                new_sample.write(new_dataset_dir, format=format, **write_kwargs)
+                labels[new_sample.sample_name] = new_sample.label
 
     new_partition.save(new_dataset_dir, "default")
+    _write_label_index(dataset_dir, new_dataset_dir, new_partition, labels, task_specs)
+    build_manifest(new_dataset_dir, "hdf5" if hdf5 else "tif")
 
     # get 10 random samples from dataset
 
-    samples = [dataset[i] for i in np.random.choice(len(dataset), 10)]
+    # band infos and shapes are read from the headers only
+    sample_names = dataset.list_sample_names()
+    samples = [
+        dataset.get_sample(sample_names[i], lazy=True) for i in np.random.choice(len(dataset), 10)
+    ]
 
     # update task_specs and save it again to make sure info is consistent and
     # that module paths are updated
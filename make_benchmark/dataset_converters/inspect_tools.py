@@ -343,7 +343,7 @@ def extract_bands(samples, band_groups=None, draw_label=False, label_patch_size=
 
 def center_coord(band):
     """Find center coordinates."""
-    center = np.array(band.data.shape[:2]) / 2.0
+    center = np.array(band.shape[:2]) / 2.0
     center = transform_to_4326(band.transform, band.crs, center)
     return tuple(center[::-1])
 
@@ -362,7 +362,7 @@ def transform_to_4326(transform, crs, coord):
 def get_rect(band):
     """Obtain a georeferenced rectangle ready to display in ipyleaflet."""
     sw = transform_to_4326(band.transform, band.crs, (0, 0))
-    ne = transform_to_4326(band.transform, band.crs, band.data.shape[:2])
+    ne = transform_to_4326(band.transform, band.crs, band.shape[:2])
     return Rectangle(bounds=(sw[::-1], ne[::-1]))
 
 
@@ -570,7 +570,9 @@ def collect_task_info(task, fix_task_shape=False):
         n_valid = len(partition["valid"])
         n_test = len(partition["test"])
         n_geoinfo = 0
-        for band in dataset[0].bands:
+        # only headers are needed, pixels are not read.
+        sample_0 = dataset.get_sample(dataset.list_sample_names()[0], lazy=True)
+        for band in sample_0.bands:
             if band.transform is not None:
                 n_geoinfo += 1
 
@@ -582,9 +584,13 @@ def collect_task_info(task, fix_task_shape=False):
     n_classes = getattr(task.label_type, "n_classes", -1)
 
     # shapes = [band.data.shape for band in dataset[0].bands]
-    sample_0 = dataset[0]
-    # check_module(sample_0)
-    largest_shape = sample_0.largest_shape()
+    sample_name_0 = dataset.list_sample_names()[0]
+    if dataset.manifest is not None:
+        largest_shape = dataset.manifest.largest_shape(sample_name_0)
+    else:
+        sample_0 = dataset.get_sample(sample_name_0, lazy=True)
+        # check_module(sample_0)
+        largest_shape = sample_0.largest_shape()
 
     if task.patch_size != largest_shape:
         print(
@@ -4,7 +4,6 @@ For the future, implement partitions and splits
 """
 import json
 import pickle
-from collections import defaultdict
 from pathlib import Path
 from typing import Dict, List, Set
 from warnings import warn
@@ -14,6 +13,7 @@ from tqdm import tqdm
 
 import geobench as gb
 from make_benchmark import bandstats
+from geobench.label_index import LabelIndex, build_label_index
 from geobench.task import TaskSpecifications
 from geobench import config
 
@@ -83,13 +83,24 @@ def get_samples_and_verify_partition(
             partition.save(dataset_dir, partition_name)
 
     sample_names = []
-    paths = list(dataset_dir.glob("*"))
-    if max_count is not None:
-        paths = np.random.choice(paths, max_count, replace=False)
+    if dataset.manifest is not None:
+        # no need to list and stat the whole directory
+        sample_names = [
+            dataset.manifest.sample_path(dataset_dir, sample_name)
+            for sample_name in dataset.manifest.sample_names
+        ]
+        if max_count is not None:
+            sample_names = list(np.random.choice(sample_names, max_count, replace=False))
+    else:
+        paths = list(dataset_dir.glob("*"))
+        if max_count is not None:
+            paths = np.random.choice(paths, max_count, replace=False)
 
-    for file_name in tqdm(paths, desc=f"Collecting list of subdirectories in {dataset_dir.name}."):
-        if file_name.is_dir() or file_name.suffix == ".hdf5":
-            sample_names.append(file_name)
+        for file_name in tqdm(
+            paths, desc=f"Collecting list of subdirectories in {dataset_dir.name}."
+        ):
+            if file_name.is_dir() or file_name.suffix == ".hdf5":
+                sample_names.append(file_name)
 
     if len(all_samples) != len(sample_names):
         warn(
@@ -98,6 +109,27 @@ def get_samples_and_verify_partition(
     return sample_names
 
 
+def get_label_index(dataset_dir, max_count: int = None) -> LabelIndex:
+    """Load the label index of a dataset, building it on first use.
+
+    Args:
+        dataset_dir: path to dataset directory
+        max_count: if not None, the index is restricted to max_count random samples
+
+    Returns:
+        label index
+    """
+    label_index = LabelIndex.load(dataset_dir)
+    if label_index is None:
+        get_samples_and_verify_partition(Path(dataset_dir))
+        label_index = build_label_index(dataset_dir)
+    if max_count is not None and max_count < len(label_index.sample_names):
+        label_index = label_index.subset(
+            np.random.choice(len(label_index.sample_names), max_count, replace=False)
+        )
+    return label_index
+
+
 def load_label_map(dataset_dir: str, max_count: int = None) -> Dict[str, List[str]]:
     """Load label map, which maps labels to sample names.
 
@@ -108,14 +140,7 @@ def load_label_map(dataset_dir: str, max_count: int = None) -> Dict[str, List[st
     Return:
         label map
     """
-    sample_paths = get_samples_and_verify_partition(dataset_dir, max_count=max_count)
-
-    label_map = defaultdict(list)
-
-    for sample_path in tqdm(sample_paths, desc="Loading labels."):
-        label = load_label(sample_path)
-        label_map[label].append(sample_path.stem)
-    return label_map
+    return get_label_index(dataset_dir, max_count=max_count).label_map()
 
 
 def load_label_stats(task_specs: TaskSpecifications, max_count: int = None):
@@ -130,18 +155,7 @@ def load_label_stats(task_specs: TaskSpecifications, max_count: int = None):
         label statistics
     """
     dataset_dir = task_specs.get_dataset_dir()
-    sample_paths = get_samples_and_verify_partition(dataset_dir, max_count=max_count)
-
-    # label_stats = np.zeros((len(sample_paths), task_specs.label_type.n_classes))
-    # sample_names = []
-    label_stats = {}
-
-    for sample_path in tqdm(sample_paths, desc="Loading labels."):
-        label = load_label(sample_path)
-
-        label_stats[sample_path.stem] = task_specs.label_type.label_stats(label).tolist()
-
-    return label_stats
+    return get_label_index(dataset_dir, max_count=max_count).label_stats()
 
 
 def write_all_label_map(
@@ -0,0 +1,81 @@
+"""Benchmark hdf5 compression filters on a synthetic Sentinel-2 sample set.
+
+Reports write and read throughput in MB/s of uncompressed band data, and the compression ratio
+for each filter. Reads are measured right after writing and are likely served from the page
+cache, drop caches between runs to measure cold reads.
+"""
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+from scipy.ndimage import gaussian_filter
+
+import geobench as gb
+
+FILTERS = {
+    "none": dict(),
+    "lzf": dict(compression="lzf"),
+    "lzf+shuffle": dict(compression="lzf", shuffle=True),
+    "gzip-1+shuffle": dict(compression="gzip", compression_opts=1, shuffle=True),
+    "gzip-4": dict(compression="gzip", compression_opts=4),
+    "gzip-4+shuffle": dict(compression="gzip", compression_opts=4, shuffle=True),
+    "gzip-9+shuffle": dict(compression="gzip", compression_opts=9, shuffle=True),
+    "gzip-4+shuffle 64x64 chunks": dict(
+        compression="gzip", compression_opts=4, shuffle=True, chunks=(64, 64)
+    ),
+}
+if gb.dataset.hdf5plugin is not None:
+    FILTERS.update(
+        {
+            "zstd-3+shuffle": dict(compression="zstd", compression_opts=3, shuffle=True),
+            "blosc-zstd-5+shuffle": dict(compression="blosc", compression_opts=5, shuffle=True),
+        }
+    )
+
+
+def make_sentinel2_sample(sample_name, size=120, rng=np.random):
+    """Make a sample with the 13 Sentinel-2 bands, with spatially correlated int16 values."""
+    bands = []
+    for band_info in gb.sentinel2_13_bands:
+        band_size = int(size * 10 / band_info.spatial_resolution)
+        noise = gaussian_filter(rng.randn(band_size, band_size), sigma=4) * 4000
+        data = np.clip(noise + 1500 + rng.randn(band_size, band_size) * 5, 1, 10000)
+        bands.append(gb.Band(data.astype(np.int16), band_info, band_info.spatial_resolution))
+    return gb.Sample(bands, label=int(rng.randint(10)), sample_name=sample_name)
+
+
+def bench_filter(samples, filter_kwargs, dataset_dir: Path):
+    """Write and read all samples with a filter and return (write MB/s, read MB/s, ratio)."""
+    raw_bytes = sum(band.data.nbytes for sample in samples for band in sample.bands)
+
+    start = time.perf_counter()
+    paths = [sample.write(dataset_dir, **filter_kwargs) for sample in samples]
+    write_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for path in paths:
+        gb.load_sample_hdf5(path)
+    read_time = time.perf_counter() - start
+
+    file_bytes = sum(path.stat().st_size for path in paths)
+    return raw_bytes / write_time / 1e6, raw_bytes / read_time / 1e6, raw_bytes / file_bytes
+
+
+def main(n_samples=200, size=120):
+    rng = np.random.RandomState(0)
+    samples = [make_sentinel2_sample(f"sample_{i:05d}", size, rng) for i in range(n_samples)]
+    print(f"{n_samples} synthetic Sentinel-2 samples of {size}x{size} pixels at 10m.\n")
+    print(f"{'filter':30s} {'write MB/s':>12s} {'read MB/s':>12s} {'ratio':>8s}")
+    for name, filter_kwargs in FILTERS.items():
+        dataset_dir = Path(tempfile.mkdtemp())
+        try:
+            write_speed, read_speed, ratio = bench_filter(samples, filter_kwargs, dataset_dir)
+        finally:
+            shutil.rmtree(dataset_dir)
+        print(f"{name:30s} {write_speed:12.1f} {read_speed:12.1f} {ratio:8.2f}")
+
+
+if __name__ == "__main__":
+    main()
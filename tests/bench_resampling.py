@@ -0,0 +1,79 @@
+"""Benchmark the resampling of mixed-resolution Sentinel-2 samples by `Sample.pack_to_4d`.
+
+Each band is generated at 10m from a smooth random field, then averaged down to its native
+resolution (20m or 60m). Samples are packed back to 10m with the methods of geobench.resampling and
+with the former per-band scipy.ndimage.zoom path. Reports the throughput in samples/s and the
+RMSE of the resampled 20m and 60m bands against the 10m field they were generated from.
+"""
+import time
+
+import numpy as np
+from scipy.ndimage import gaussian_filter, zoom
+
+import geobench as gb
+from geobench.resampling import resample
+
+
+def make_sentinel2_sample(sample_name, size=120, rng=np.random):
+    """Make a sample with the 13 Sentinel-2 bands, and return it with the 10m field of each band."""
+    bands = []
+    fields = []
+    for band_info in gb.sentinel2_13_bands:
+        field = gaussian_filter(rng.randn(size, size), sigma=4) * 4000 + 1500
+        band_size = int(size * 10 / band_info.spatial_resolution)
+        data = resample(field, (band_size, band_size), "area")
+        bands.append(gb.Band(data.astype(np.float32), band_info, band_info.spatial_resolution))
+        fields.append(field)
+    sample = gb.Sample(bands, label=int(rng.randint(10)), sample_name=sample_name)
+    return sample, np.stack(fields, 2)
+
+
+def zoom_pack(sample, order):
+    """Pack a sample by resampling each band with scipy.ndimage.zoom, as pack_to_4d used to."""
+    shape = sample.largest_shape()
+    data_list = []
+    for band in sample.bands:
+        data = band.data[:, :, None]
+        if data.shape[:2] != shape:
+            data = zoom(data, (shape[0] / data.shape[0], shape[1] / data.shape[1], 1), order=order)
+        data_list.append(data)
+    return np.concatenate(data_list, axis=2)[None]
+
+
+def bench(pack, samples, fields, low_res):
+    start = time.perf_counter()
+    packed = [pack(sample) for sample in samples]
+    duration = time.perf_counter() - start
+    errors = [
+        (array[0][:, :, low_res] - field[:, :, low_res]) for array, field in zip(packed, fields)
+    ]
+    rmse = np.sqrt(np.mean(np.square(errors)))
+    return len(samples) / duration, rmse
+
+
+def main(n_samples=100, size=120):
+    rng = np.random.RandomState(0)
+    samples, fields = zip(
+        *[make_sentinel2_sample(f"sample_{i:05d}", size, rng) for i in range(n_samples)]
+    )
+    low_res = [
+        i for i, band_info in enumerate(gb.sentinel2_13_bands) if band_info.spatial_resolution > 10
+    ]
+    paths = {
+        f"zoom order={order}": lambda sample, order=order: zoom_pack(sample, order)
+        for order in (0, 1, 3)
+    }
+    for method in ("nearest", "bilinear", "bicubic", "area"):
+        paths[method] = lambda sample, method=method: sample.pack_to_4d(
+            resample=True, resample_method=method
+        )[0]
+
+    print(f"{n_samples} synthetic Sentinel-2 samples of {size}x{size} pixels at 10m.\n")
+    print(f"{'path':20s} {'samples/s':>12s} {'rmse':>10s}")
+    for name, pack in paths.items():
+        throughput, rmse = bench(pack, samples, fields, low_res)
+        print(f"{name:20s} {throughput:12.1f} {rmse:10.2f}")
+
+
+if __name__ == "__main__":
+    main()